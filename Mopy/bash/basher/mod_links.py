@@ -1265,6 +1265,9 @@ def strFid(form_id):
                         item = u'%s - %s attached to Exterior CELL (%s), attached to WRLD (%s)%s' % (
                             strFid(udr.fid),udr.type,parentStr,parentParentStr,atPos)
                     dirty[pos] += u'    * %s\n' % item
+                dirty[pos] += u'  * %s: %i\n' % (_(u'ITM'),len(itms))
+                for itm_master, itm_id in sorted(itms):
+                    dirty[pos] += u'    * %s: %06X\n' % (itm_master, itm_id)
             elif udrs is None or itms is None:
                 error.append(u'* __%s__' % modInfo)
             else:
@@ -1452,7 +1455,7 @@ def Execute(self):
                         removed.append(record.eid)
                     else:
                         newRecords.append(record)
-                scpt_grp.records = newRecords
+                scpt_grp.records.replace_entries(newRecords)
                 scpt_grp.setChanged()
             if len(removed) >= 50 or badGenericLore:
                 modFile.safeSave()
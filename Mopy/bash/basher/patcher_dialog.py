@@ -32,6 +32,7 @@
 from .. import balt, bass, bolt, bosh, bush, env, load_order
 from ..balt import Link, Resources
 from ..bolt import SubProgress, GPath, Path
+from ..brec import MreRecord
 from ..exception import BoltError, CancelError, FileEditError, \
     PluginsFullError, SkipError
 from ..gui import CancelButton, DeselectAllButton, HLayout, Label, \
@@ -186,6 +187,7 @@ def PatchExecute(self):
             progress.setCancel(False, u'%s\n' % patch_name + _(u'Saving...'))
             progress(0.9)
             self._save_pbash(patchFile, patch_name)
+            self._save_compression_cache()
             #--Done
             progress.Destroy(); progress = None
             timer2 = time.clock()
@@ -204,14 +206,18 @@ def PatchExecute(self):
                 file.write(logValue)
             #--Convert log/readmeto wtxt
             bolt.WryeText.genHtml(tempReadme,None,docsDir)
+            #--Save the build profile next to the log/readme
+            tempProfile = tempReadmeDir.join(patch_name.sroot + u'.json')
+            patchFile.build_profile.save_json(tempProfile, patch_name)
             #--Try moving temp log/readme to Docs dir
             try:
                 env.shellMove(tempReadmeDir, bass.dirs[u'mods'],
                               parent=self._native_widget)
             except (CancelError,SkipError):
                 # User didn't allow UAC, move to My Games directory instead
-                env.shellMove([tempReadme, tempReadme.root + u'.html'],
-                              bass.dirs[u'saveBase'], parent=self)
+                env.shellMove([tempReadme, tempReadme.root + u'.html',
+                               tempProfile], bass.dirs[u'saveBase'],
+                              parent=self)
                 readme = bass.dirs[u'saveBase'].join(readme.tail)
             #finally:
             #    tempReadmeDir.head.rmtree(safety=tempReadmeDir.head.stail)
@@ -269,6 +275,18 @@ def _error(self, msg=None, error=None):
         bolt.deprint(u'Exception during Bashed Patch building:',
                      traceback=True)
 
+    @staticmethod
+    def _save_compression_cache():
+        """Keeps the records compressed for this patch around for the next
+        build - saved once per build, not once per plugin save."""
+        comp_cache = MreRecord.compression_cache
+        if comp_cache is None: return
+        try:
+            comp_cache.save()
+        except (OSError, IOError):
+            bolt.deprint(u'Failed to save the compression cache',
+                         traceback=True)
+
     def _save_pbash(self, patchFile, patch_name):
         while True:
             try:
@@ -25,6 +25,7 @@
 #--Standard
 from __future__ import division, print_function
 
+import array
 import cPickle as pickle  # PY3
 import codecs
 import collections
@@ -1067,13 +1068,16 @@ def __int__(self):
     def __index__(self):
         """Same as __int__, needed for packing in py3."""
         return self._field
-    def __getstate__(self): ##: do we even use this?
+    def __getstate__(self):
         """Return values for pickling."""
-        return self._field, self._names
+        return self._field, self._names, self._unknown_is_unused
     def __setstate__(self,fields):
         """Used by unpickler."""
         self._field = fields[0]
         self._names = fields[1]
+        # Older pickles did not store this
+        object.__setattr__(self, u'_unknown_is_unused',
+                           fields[2] if len(fields) > 2 else False)
 
     #--As list
     def __getitem__(self, index):
@@ -1917,8 +1921,57 @@ def readCString(ins, file_path):
                                   u'Reached end of file while expecting null')
     return b''.join(byte_list)
 
+# The directories of all strings files loaded so far, shared by all
+# StringTables. Maps the path of a strings file to its size and mtime when it
+# was read and a dict mapping string IDs to their offsets in the file
+_strings_directories = {}
+
+class _StringsFile(object):
+    """The contents of a strings file. Decodes strings on lookup. Records
+    that are decoded lazily may keep a reference to it (through their
+    StringTable) after the file was closed, so it must not depend on the file
+    staying open - or lock it, which mapping it would on Windows."""
+    __slots__ = (u'_data', u'_directory', u'_strings_start', u'_formatted',
+                 u'_backup_encoding')
+
+    def __init__(self, strings_data, directory, strings_start, formatted,
+                 backup_encoding):
+        self._data = strings_data
+        self._directory = directory
+        self._strings_start = strings_start
+        self._formatted = formatted
+        self._backup_encoding = backup_encoding
+
+    def __contains__(self, id_): return id_ in self._directory
+
+    def __nonzero__(self): return bool(self._directory)
+
+    def lookup(self, id_, __unpacker=structs_cache[u'I'].unpack_from):
+        """Returns the decoded string with the specified ID, or None if this
+        file does not contain such a string."""
+        offset = self._directory.get(id_)
+        if offset is None: return None
+        pos = self._strings_start + offset
+        strings_data = self._data
+        if self._formatted:
+            str_len, = __unpacker(strings_data, pos)
+            # seems needed, strings are null terminated
+            value = cstrip(strings_data[pos + 4:pos + 4 + str_len])
+        else:
+            end_pos = strings_data.find(b'\0', pos) # drops the null byte
+            if end_pos == -1: end_pos = len(strings_data)
+            value = strings_data[pos:end_pos]
+        try:
+            return unicode(value, u'utf-8')
+        except UnicodeDecodeError:
+            return unicode(value, self._backup_encoding)
+
 class StringTable(dict):
-    """For reading .STRINGS, .DLSTRINGS, .ILSTRINGS files."""
+    """For reading .STRINGS, .DLSTRINGS, .ILSTRINGS files. Loading a file
+    reads it and its directory of string IDs (which is cached and shared by
+    all StringTables), but the strings themselves are only decoded the first
+    time they are looked up. Note that only strings that have been looked up
+    are actually stored in the dict - use get or [] to access strings."""
     encodings = {
         # Encoding to fall back to if UTF-8 fails, based on language
         # Default is 1252 (Western European), so only list languages
@@ -1926,6 +1979,37 @@ class StringTable(dict):
         u'russian': u'cp1251',
     }
 
+    def __init__(self, *args, **kwargs):
+        super(StringTable, self).__init__(*args, **kwargs)
+        self._strings_files = []
+
+    def __missing__(self, id_):
+        # Later files take precedence, since they used to overwrite the
+        # strings of earlier ones
+        for strings_file in reversed(self._strings_files):
+            value = strings_file.lookup(id_)
+            if value is not None:
+                self[id_] = value
+                return value
+        raise KeyError(id_)
+
+    def __contains__(self, id_):
+        return dict.__contains__(self, id_) or any(
+            id_ in f for f in self._strings_files)
+
+    def __nonzero__(self):
+        return dict.__len__(self) > 0 or any(self._strings_files)
+
+    def get(self, id_, default=None):
+        try:
+            return self[id_]
+        except KeyError:
+            return default
+
+    def clear(self):
+        super(StringTable, self).clear()
+        del self._strings_files[:]
+
     def load(self, modFilePath, lang=u'English', progress=Progress()):
         baseName = modFilePath.tail.body
         baseDir = modFilePath.head.join(u'Strings')
@@ -1943,58 +2027,46 @@ def loadFile(self, path, progress, lang=u'english'):
         backupEncoding = self.encodings.get(lang.lower(), u'cp1252')
         try:
             with open(path.s, u'rb') as ins:
-                insSeek = ins.seek
-                insTell = ins.tell
-
-                insSeek(0,os.SEEK_END)
-                eof = insTell()
-                insSeek(0)
+                eof = os.fstat(ins.fileno()).st_size
                 if eof < 8:
                     deprint(u"Warning: Strings file '%s' file size (%d) is "
                             u'less than 8 bytes.  8 bytes are the minimum '
                             u'required by the expected format, assuming the '
                             u'Strings file is empty.' % (path, eof))
                     return
-
-                numIds,dataSize = unpack_many(ins, u'=2I')
-                progress.setFull(max(numIds,1))
-                stringsStart = 8 + (numIds*8)
-                if stringsStart != eof-dataSize:
-                    deprint(u"Warning: Strings file '%s' dataSize element "
-                            u'(%d) results in a string start location of %d, '
-                            u'but the expected location is %d'
-                            % (path, dataSize, eof-dataSize, stringsStart))
-
-                id_ = -1
-                offset = -1
-                for x in xrange(numIds):
-                    try:
-                        progress(x)
-                        id_,offset = unpack_many(ins, u'=2I')
-                        pos = insTell()
-                        insSeek(stringsStart+offset)
-                        if formatted:
-                            value = unpack_str32(ins) # TODO(ut): unpack_str32_null
-                            # seems needed, strings are null terminated
-                            value = cstrip(value)
-                        else:
-                            value = readCString(ins, path) #drops the null byte
-                        try:
-                            value = unicode(value, u'utf-8')
-                        except UnicodeDecodeError:
-                            value = unicode(value,backupEncoding)
-                        insSeek(pos)
-                        self[id_] = value
-                    except:
-                        deprint(u'Error reading string file:')
-                        deprint(u'id:', id_)
-                        deprint(u'offset:', offset)
-                        deprint(u'filePos:',  insTell())
-                        raise
+                strings_data = ins.read()
+            numIds, dataSize = struct_unpack(u'=2I', strings_data[:8])
+            stringsStart = 8 + (numIds*8)
+            if stringsStart != eof-dataSize:
+                deprint(u"Warning: Strings file '%s' dataSize element "
+                        u'(%d) results in a string start location of %d, '
+                        u'but the expected location is %d'
+                        % (path, dataSize, eof-dataSize, stringsStart))
+            directory = self._get_directory(path, strings_data, numIds)
+            self._strings_files.append(_StringsFile(
+                strings_data, directory, stringsStart, formatted,
+                backupEncoding))
+            progress(progress.full)
         except:
             deprint(u'Error loading string file:', path.stail, traceback=True)
             return
 
+    @staticmethod
+    def _get_directory(path, strings_data, num_ids):
+        """Returns the directory of the specified strings file, mapping string
+        IDs to their offsets. Reads it if it's not cached yet or the file
+        changed since it was read."""
+        size_mtime = path.size_mtime()
+        cached = _strings_directories.get(path)
+        if cached is not None and cached[0] == size_mtime:
+            return cached[1]
+        # The directory is an array of (id, offset) uint32 pairs
+        id_offsets = array.array(u'I')
+        id_offsets.fromstring(strings_data[8:8 + num_ids * 8])
+        directory = dict(izip(id_offsets[::2], id_offsets[1::2]))
+        _strings_directories[path] = (size_mtime, directory)
+        return directory
+
 #------------------------------------------------------------------------------
 _esub_component = re.compile(u'' r'\$(\d+)\(([^)]+)\)')
 _rsub_component = re.compile(u'' r'\\(\d+)')
@@ -51,13 +51,13 @@
 from ..bass import dirs, inisettings
 from ..bolt import GPath, DataDict, deprint, Path, decoder, AFile, \
     GPath_no_norm, struct_error
-from ..brec import ModReader, RecordHeader
+from ..brec import CompressionCache, ModReader, MreRecord, RecordHeader
 from ..exception import AbstractError, ArgumentError, BoltError, BSAError, \
     CancelError, FileError, ModError, PluginsFullError, SaveFileError, \
     SaveHeaderError, SkipError, StateError
 from ..ini_files import IniFile, OBSEIniFile, DefaultIniFile, GameIni, \
     get_ini_type_and_encoding
-from ..mod_files import ModFile, ModHeaderReader
+from ..mod_files import ModFile, ModHeaderReader, RecordIndex
 
 # Singletons, Constants -------------------------------------------------------
 reOblivion = re.compile(
@@ -365,6 +365,7 @@ def snapshot_dir(self):
 class ModInfo(FileInfo):
     """A plugin file. Currently, these are .esp, .esm, .esl and .esu files."""
     _has_esm_flag = _is_esl = False # Cached, since we need it so often
+    _record_index = None # Loaded on demand, see get_record_index
 
     def __init__(self, fullpath, load_cache=False):
         self.isGhost = endsInGhost = (fullpath.cs[-6:] == u'.ghost')
@@ -392,6 +393,8 @@ def get_hide_dir(self):
 
     def _reset_cache(self, stat_tuple, load_cache):
         super(ModInfo, self)._reset_cache(stat_tuple, load_cache)
+        # The file changed, the index will be rebuilt the next time it's needed
+        self._record_index = None
         # check if we have a cached crc for this file, use fresh mtime and size
         if load_cache:
             self.calculate_crc() # for added and hopefully updated
@@ -469,6 +472,42 @@ def calculate_crc(self, recalculate=False):
     def cached_mod_crc(self): # be sure it's valid before using it!
         return self.get_table_prop(u'crc')
 
+    def get_record_index(self, with_digests=False, progress=None):
+        """Returns a RecordIndex of this plugin. It is cached in memory until
+        do_update detects a change and on disk, keyed by the size, mtime and
+        CRC of the plugin, so it is only rebuilt for plugins that changed.
+
+        :param with_digests: If True, make sure the digests of the records
+            have been computed - see RecordIndex.compute_digests. That
+            decodes the whole plugin, but is cached the same way.
+        :rtype: mod_files.RecordIndex"""
+        idx_path = self.record_index_path(self.name)
+        if self._record_index is None:
+            cache_key = (self._file_size, self._file_mod_time,
+                         self.calculate_crc()[0])
+            rec_index = RecordIndex.load(idx_path, cache_key)
+            if rec_index is None:
+                rec_index = RecordIndex.build(self, cache_key)
+                self._save_record_index(rec_index, idx_path)
+            self._record_index = rec_index
+        if with_digests and self._record_index.digests is None:
+            self._record_index.compute_digests(self, progress)
+            self._save_record_index(self._record_index, idx_path)
+        return self._record_index
+
+    @staticmethod
+    def record_index_path(mod_name):
+        """Returns the path the RecordIndex of the plugin with the specified
+        name is cached at - see get_record_index."""
+        return dirs[u'modsBash'].join(u'Record Index', mod_name.s + u'.idx')
+
+    def _save_record_index(self, rec_index, idx_path):
+        try:
+            rec_index.save(idx_path)
+        except (OSError, IOError):
+            deprint(u'Failed to save record index of %s' % self,
+                    traceback=True)
+
     def crc_string(self):
         try:
             return u'%08X' % self.cached_mod_crc()
@@ -502,6 +541,7 @@ def setmtime(self, set_time=0.0, crc_changed=False):
             self.set_table_prop(u'crc_mtime', set_time)
         else:
             self.calculate_crc(recalculate=True)
+            self._record_index = None
 
     def _get_masters(self):
         """Return the plugin masters, in the order listed in its header."""
@@ -2755,6 +2795,14 @@ def _rename_operation(self, oldName, newName):
         if isSelected:
             self.lo_deactivate(oldName, doSave=False) # will save later
         super(ModInfos, self)._rename_operation(oldName, newName)
+        # The cached record index is still valid, only its name changes
+        old_idx = ModInfo.record_index_path(oldName)
+        try:
+            if old_idx.exists():
+                old_idx.moveTo(ModInfo.record_index_path(newName))
+        except (OSError, IOError):
+            deprint(u'Failed to rename record index of %s' % oldName,
+                    traceback=True)
         # rename in load order caches
         oldIndex = self._lo_wip.index(oldName)
         self._lo_caches_remove_mods([oldName])
@@ -2789,6 +2837,12 @@ def delete_refresh(self, deleted, paths_to_keys, check_existence,
         deleted = super(ModInfos, self).delete_refresh(deleted, paths_to_keys,
                                                        check_existence)
         if not deleted: return
+        for del_name in deleted:
+            try:
+                ModInfo.record_index_path(del_name).remove()
+            except OSError:
+                deprint(u'Failed to remove record index of %s' % del_name,
+                        traceback=True)
         # temporarily track deleted mods so BAIN can update its UI
         if _in_refresh: return
         self._lo_caches_remove_mods(deleted)
@@ -3392,6 +3446,9 @@ def initDefaultSettings():
     inisettings[u'PromptActivateBashedPatch'] = True
     inisettings[u'WarnTooManyFiles'] = True
     inisettings[u'SkippedBashInstallersDirs'] = u''
+    inisettings[u'DecompressionThreads'] = 1
+    inisettings[u'SkipIdenticalOverrides'] = False
+    inisettings[u'ScanPrefetchPlugins'] = 0
 
 __type_key_preffix = {  # Path is tooldirs only int does not appear in either!
     bolt.Path: u's', unicode: u's', list: u's', int: u'i', bool: u'b'}
@@ -3458,6 +3515,9 @@ def initBosh(bashIni, game_ini_path):
     initOptions(bashIni)
     from .bain import Installer
     Installer.init_bain_dirs()
+    # Compressed records of saved plugins are cached per game
+    MreRecord.compression_cache = CompressionCache(
+        dirs[u'modsBash'].join(u'Compressed Records.cache'))
 
 def initSettings(readOnly=False, _dat=u'BashSettings.dat',
                  _bak=u'BashSettings.dat.bak'):
@@ -29,7 +29,8 @@
 from ._mergeability import is_esl_capable
 from .. import balt, bolt, bush, bass, load_order
 from ..bolt import GPath, deprint, structs_cache
-from ..brec import ModReader, MreRecord, RecordHeader, SubrecordBlob, null1
+from ..brec import MmapModReader, ModReader, MreRecord, RecordHeader, \
+    SubrecordBlob, null1
 from ..exception import CancelError, ModError
 
 # BashTags dir ----------------------------------------------------------------
@@ -276,8 +277,9 @@ def checkMods(showModList=False, showCRC=False, showVersion=True,
 #------------------------------------------------------------------------------
 _wrld_types = frozenset((b'CELL', b'WRLD'))
 class ModCleaner(object):
-    """Class for cleaning ITM and UDR edits from mods. ITM detection does not
-    currently work with PBash."""
+    """Class for cleaning ITM and UDR edits from mods. ITMs are detected by
+    comparing record digests with those of the masters - see
+    mod_files.RecordDigests."""
     UDR     = 0x01  # Deleted references
     ITM     = 0x02  # Identical to master records
     FOG     = 0x04  # Nvidia Fog Fix
@@ -332,16 +334,30 @@ def scan(self,what=ALL,progress=bolt.Progress(),detailed=False):
             self.fog = fog
         return udr,itm,fog
 
+    @staticmethod
+    def _scan_itm(modInfo, progress):
+        """Returns a set of the long fids of the records in the specified
+        plugin that are identical to the versions in its masters."""
+        from . import modInfos
+        from ..mod_files import RecordDigests
+        rec_digests = RecordDigests()
+        for master_name in load_order.get_ordered(modInfo.masterNames):
+            if master_name in modInfos:
+                progress(0, _(u'Digesting records...') + u'\n%s' % master_name)
+                rec_digests.add_plugin(modInfos[master_name])
+        progress(0, _(u'Digesting records...') + u'\n%s' % modInfo.name)
+        return rec_digests.add_plugin(modInfo)
+
     @staticmethod
     def scan_Many(modInfos, what=DEFAULT, progress=bolt.Progress(),
         detailed=False, __unpacker=structs_cache[u'=12s2f2l2f'].unpack,
         __wrld_types=_wrld_types, __unpacker2=structs_cache[u'2i'].unpack):
         """Scan multiple mods for dirty edits"""
         if len(modInfos) == 0: return []
-        if not (what & (ModCleaner.UDR|ModCleaner.FOG)):
+        if not (what & ModCleaner.ALL):
             return [(set(), set(), set())] * len(modInfos)
-        # Python can't do ITM scanning
         doUDR = what & ModCleaner.UDR
+        doITM = what & ModCleaner.ITM
         doFog = what & ModCleaner.FOG
         progress.setFull(max(len(modInfos),1))
         ret = []
@@ -363,7 +379,8 @@ def scan_Many(modInfos, what=DEFAULT, progress=bolt.Progress(),
                 parentFid = None
                 parentParentFid = None
                 # Location (Interior = #, Exteror = (X,Y)
-                with ModReader(modInfo.name,modInfo.getPath().open(u'rb')) as ins:
+                with MmapModReader(modInfo.name,
+                                   modInfo.getPath().open(u'rb')) as ins:
                     try:
                         insAtEnd = ins.atEnd
                         insTell = ins.tell
@@ -461,6 +478,15 @@ def scan_Many(modInfos, what=DEFAULT, progress=bolt.Progress(),
                     except:
                         deprint(u'Error scanning %s, file read pos: %i:\n' % (modInfo, ins.tell()), traceback=True)
                         udr = itm = fog = None
+                if doITM and udr is not None:
+                    try:
+                        itm = ModCleaner._scan_itm(modInfo, subprogress)
+                    except CancelError:
+                        raise
+                    except:
+                        deprint(u'Error scanning %s for ITMs:\n' % modInfo,
+                                traceback=True)
+                        udr = itm = fog = None
                 #--Done
             ret.append((udr.values() if udr is not None else None,itm,fog))
         return ret
@@ -551,24 +577,28 @@ def getRecordReader(flags, size):
         complex_groups = {b'CELL', b'DIAL', b'WRLD'}
         if bush.game.fsName in (u'Fallout4', u'Fallout4VR'):
             complex_groups.add(b'QUST')
+        # Use the record index to jump straight to the records we want
+        rec_index = modInfo.get_record_index()
+        parents, offsets = rec_index.parents, rec_index.offsets
+        skip_grup = False
         with ModReader(modInfo.name, modInfo.abs_path.open(u'rb')) as ins:
-            while not ins.atEnd():
-                header = ins.unpackRecHeader()
-                rtyp = header.recType
-                rsiz = header.size
-                if rtyp == b'GRUP':
-                    label = header.label
-                    progress(1.0 * ins.tell() / modInfo.size,
+            for entry in xrange(len(rec_index)):
+                parent_entry = parents[entry]
+                if rec_index.is_group(entry):
+                    if parent_entry != -1: continue # only top groups matter
+                    label = rec_index.header(entry).label
+                    progress(1.0 * offsets[entry] / modInfo.size,
                              _(u'Scanning: %s') % label.decode(u'ascii'))
                     records = group_records[label]
-                    if label in complex_groups: # skip these groups
-                        header.skip_group(ins)
-                else:
+                    skip_grup = label in complex_groups # skip these groups
+                elif parent_entry == -1 or not skip_grup:
                     eid = u''
-                    next_record = ins.tell() + rsiz
-                    recs = getRecordReader(header.flags1, rsiz)
+                    ins.seek(rec_index.data_offset(entry))
+                    recs = getRecordReader(rec_index.args1[entry],
+                                           rec_index.sizes[entry])
                     while not recs.atEnd():
-                        subrec = SubrecordBlob(recs, rtyp, mel_sigs={b'EDID'})
+                        subrec = SubrecordBlob(recs, rec_index.sig(entry),
+                                               mel_sigs={b'EDID'})
                         if subrec.mel_data is not None:
                             # FIXME copied from readString
                             eid = u'\n'.join(bolt.decoder(
@@ -576,6 +606,5 @@ def getRecordReader(flags, size):
                                 avoidEncodings=(u'utf8', u'utf-8')) for x
                                 in subrec.mel_data.rstrip(null1).split(b'\n'))
                             break
-                    records.append((header.fid, eid))
-                    ins.seek(next_record) # we may have break'd at EDID
+                    records.append((rec_index.args2[entry], eid))
         del group_records[bush.game.Esp.plugin_header_sig]
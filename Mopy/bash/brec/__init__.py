@@ -36,5 +36,7 @@
 from .record_structs import *
 from .utils_constants import *
 
+from .basic_elements import _get_class_slots
+from .record_structs import _compressed_flag_mask
 # HACK for now - _coerce will disappear in parsers ABC merge
 from .utils_constants import _coerce
@@ -31,6 +31,8 @@
 __author__ = u'Infernio'
 
 import copy
+import re
+from array import array
 from collections import OrderedDict
 from itertools import chain, izip
 
@@ -38,6 +40,12 @@
 from .. import exception
 from ..bolt import GPath, structs_cache
 
+# Optional, PackedArray.as_numpy needs it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 #------------------------------------------------------------------------------
 class _MelDistributor(MelNull):
     """Implements a distributor that can handle duplicate record signatures.
@@ -400,6 +408,268 @@ def pack_subrecord_data(self, record):
                               for arr_entry in array_val])
         return sub_data
 
+#------------------------------------------------------------------------------
+# Struct format characters -> numpy dtypes / array.array typecodes. Plugins
+# are little endian, just like every platform Wrye Bash runs on
+_numpy_types = {u'b': u'i1', u'B': u'u1', u'?': u'b1', u'h': u'<i2',
+                u'H': u'<u2', u'i': u'<i4', u'I': u'<u4', u'l': u'<i4',
+                u'L': u'<u4', u'q': u'<i8', u'Q': u'<u8', u'f': u'<f4',
+                u'd': u'<f8'}
+_array_types = {u'b': u'b', u'B': u'B', u'h': u'h', u'H': u'H', u'i': u'i',
+                u'I': u'I', u'l': u'i', u'L': u'I', u'f': u'f', u'd': u'd'}
+_format_item = re.compile(u'(\\d*)([xcbB?hHiIlLqQfds])')
+
+class _PackedLayout(object):
+    """The layout of the elements of a PackedArray: their struct and the
+    names, numpy dtypes and offsets of their fields. Shared by all arrays of
+    a MelPackedArray."""
+    __slots__ = (u'element_format', u'element_struct', u'field_names',
+                 u'_field_types', u'_field_offsets', u'_array_type',
+                 u'_numpy_dtype')
+
+    def __init__(self, element_format, field_names):
+        self.element_format = element_format
+        # Elements are stored without any padding
+        self.element_struct = structs_cache[
+            u'=' + element_format.lstrip(u'=<')]
+        self._field_types, self._field_offsets = [], []
+        array_types, item_offset = set(), 0
+        for item_count, item_char in _format_item.findall(
+                element_format.lstrip(u'=<')):
+            item_count = int(item_count or 1)
+            if item_char in u'sc':
+                # One field per byte string
+                if item_char == u'c': item_count = 1
+                self._field_types.append(u'S%u' % item_count)
+                self._field_offsets.append(item_offset)
+                array_types.add(None)
+                item_offset += item_count
+                continue
+            if item_char == u'x':
+                item_offset += item_count
+                array_types.add(None)
+                continue
+            item_size = structs_cache[u'=' + item_char].size
+            for x in xrange(item_count):
+                self._field_types.append(_numpy_types[item_char])
+                self._field_offsets.append(item_offset)
+                item_offset += item_size
+            array_types.add(_array_types.get(item_char))
+        if len(self._field_types) != len(field_names):
+            raise SyntaxError(u"Struct format '%s' has %u field(s), but %u "
+                              u'name(s) were given' % (element_format,
+                len(self._field_types), len(field_names)))
+        self.field_names = tuple(field_names)
+        # Formats made up of a single numeric type can be handed out as
+        # typed arrays - see PackedArray.as_array
+        self._array_type = (array_types.pop() if len(array_types) == 1
+                            else None)
+        self._numpy_dtype = None
+
+    def __reduce__(self):
+        # Structs and numpy dtypes can't be pickled
+        return _PackedLayout, (self.element_format, self.field_names)
+
+    @property
+    def numpy_dtype(self):
+        """The numpy structured dtype of the elements."""
+        if self._numpy_dtype is None:
+            self._numpy_dtype = numpy.dtype({
+                # PY3: drop the str calls
+                u'names': [str(n) for n in self.field_names],
+                u'formats': [str(t) for t in self._field_types],
+                u'offsets': self._field_offsets,
+                u'itemsize': self.element_struct.size})
+        return self._numpy_dtype
+
+class PackedArray(object):
+    """A mutable array of fixed-size elements that only hold numbers (and
+    fixed-size byte strings), kept packed exactly as they are stored in the
+    plugin - see MelPackedArray. Single elements are handed out as tuples,
+    but bulk operations should use as_numpy, which returns a numpy structured
+    array sharing memory with this array, or as_array, which returns a typed
+    array.array copy. Any data that follows the last element is kept as is in
+    trailer."""
+    __slots__ = (u'_layout', u'_data', u'trailer')
+
+    def __init__(self, layout, raw_data=b'', num_elements=None):
+        """Creates a new PackedArray with the elements packed in raw_data.
+
+        :type layout: _PackedLayout
+        :param num_elements: The number of elements raw_data holds, if only
+            that many are stored in it."""
+        self._layout = layout
+        elements_size = len(raw_data)
+        elements_size -= elements_size % layout.element_struct.size
+        if num_elements is not None:
+            elements_size = min(elements_size,
+                                num_elements * layout.element_struct.size)
+        self._data = bytearray(raw_data[:elements_size])
+        self.trailer = bytes(raw_data[elements_size:])
+
+    @property
+    def field_names(self):
+        """The names of the fields of each element, in order."""
+        return self._layout.field_names
+
+    def __len__(self):
+        return len(self._data) // self._layout.element_struct.size
+
+    def _element_offset(self, index):
+        num_elements = len(self)
+        if index < 0: index += num_elements
+        if not 0 <= index < num_elements:
+            raise IndexError(u'PackedArray index out of range')
+        return index * self._layout.element_struct.size
+
+    def __getitem__(self, index):
+        """Returns the element at the specified index as a tuple."""
+        return self._layout.element_struct.unpack_from(
+            self._data, self._element_offset(index))
+
+    def __setitem__(self, index, element_values):
+        self._layout.element_struct.pack_into(
+            self._data, self._element_offset(index), *element_values)
+
+    def __iter__(self):
+        unpack_from = self._layout.element_struct.unpack_from
+        packed_data = self._data
+        for element_offset in xrange(0, len(packed_data),
+                                     self._layout.element_struct.size):
+            yield unpack_from(packed_data, element_offset)
+
+    def append(self, element_values):
+        """Adds an element, given as a tuple of its field values."""
+        self._data += self._layout.element_struct.pack(*element_values)
+
+    def get_field(self, field_name):
+        """Returns a list of the values of the specified field of all
+        elements."""
+        if numpy is not None:
+            return self.as_numpy()[str(field_name)].tolist() # PY3: drop str
+        field_index = self._layout.field_names.index(field_name)
+        return [e[field_index] for e in self]
+
+    def as_numpy(self):
+        """Returns a numpy structured array of the elements, with one field
+        per field name, that shares memory with this array: changing it
+        changes the data that will be dumped. Appending to this array while
+        it is in use will fail. Requires numpy."""
+        return numpy.frombuffer(self._data, dtype=self._layout.numpy_dtype)
+
+    def as_array(self):
+        """Returns a copy of the field values of all elements, in order, as
+        an array.array - only possible if all fields are numbers of the same
+        type, e.g. for three-float vertices."""
+        array_type = self._layout._array_type
+        if array_type is None:
+            raise exception.StateError(u'Elements of a PackedArray with '
+                                       u'mixed fields can not be packed into '
+                                       u'an array.array')
+        return array(array_type, bytes(self._data))
+
+    def get_data(self):
+        """Returns the packed elements and the trailer, as stored in the
+        plugin."""
+        return bytes(self._data) + self.trailer
+
+    def __copy__(self):
+        array_copy = PackedArray.__new__(PackedArray)
+        array_copy._layout = self._layout
+        array_copy._data = bytearray(self._data)
+        array_copy.trailer = self.trailer
+        return array_copy
+
+    def __deepcopy__(self, memo):
+        return self.__copy__()
+
+    def __eq__(self, other):
+        return (isinstance(other, PackedArray) and
+                self._layout.element_struct.format ==
+                other._layout.element_struct.format and
+                self._data == other._data and self.trailer == other.trailer)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None # mutable
+
+    def __repr__(self):
+        return u'<PackedArray: %u element(s) of (%s)>' % (
+            len(self), u', '.join(self._layout.field_names))
+
+class MelPackedArray(MelBase):
+    """Like MelArray, but for big arrays whose elements only hold numbers,
+    e.g. the vertices of navmeshes or the normals of landscapes. Instead of
+    decoding every element into a MelObject, the whole array is stored in a
+    PackedArray - loading and dumping it involves no per-element work and it
+    can be processed with numpy. Elements can't contain FormIDs."""
+    def __init__(self, mel_sig, array_attr, element_format, field_names,
+                 prelude=None, num_elements=None, drop_empty=False):
+        """Creates a new MelPackedArray.
+
+        :param array_attr: The attribute name to give the entire array.
+        :type array_attr: unicode
+        :param element_format: The struct format of each element. Elements
+            are stored without any padding.
+        :type element_format: unicode
+        :param field_names: The names of the fields of each element, one per
+            value of element_format (one per byte string for 's').
+        :type field_names: tuple[unicode]
+        :param prelude: An optional element that will be loaded and dumped once
+            before the array, see MelArray.
+        :type prelude: MelBase
+        :param num_elements: If set, only this many elements are read, the
+            rest of the subrecord ends up in the trailer of the array.
+        :type num_elements: int
+        :param drop_empty: If True, the array defaults to an empty PackedArray
+            and is not dumped while empty, like a MelArray. Otherwise, it
+            defaults to None like a MelBase and is dumped unless it is None,
+            so that present but empty subrecords are kept.
+        :type drop_empty: bool"""
+        super(MelPackedArray, self).__init__(mel_sig, array_attr)
+        self._layout = _PackedLayout(element_format, field_names)
+        if prelude and prelude.mel_sig != mel_sig:
+            raise SyntaxError(u'MelPackedArray preludes must have the same '
+                              u'signature as the array')
+        self._prelude = prelude
+        try:
+            self._prelude_size = prelude.static_size if prelude else 0
+        except exception.AbstractError:
+            raise SyntaxError(u'MelPackedArray preludes must have a static '
+                              u'size')
+        self._num_elements = num_elements
+        self._drop_empty = drop_empty
+
+    def getSlotsUsed(self):
+        slots_ret = self._prelude.getSlotsUsed() if self._prelude else ()
+        return super(MelPackedArray, self).getSlotsUsed() + slots_ret
+
+    def setDefault(self, record):
+        if self._prelude:
+            self._prelude.setDefault(record)
+        setattr(record, self.attr, PackedArray(self._layout)
+                if self._drop_empty else None)
+
+    def load_mel(self, record, ins, sub_type, size_, readId):
+        if self._prelude:
+            self._prelude.load_mel(record, ins, sub_type, self._prelude_size,
+                                   readId)
+            size_ -= self._prelude_size
+        setattr(record, self.attr, PackedArray(
+            self._layout, ins.read(size_, readId), self._num_elements))
+
+    def pack_subrecord_data(self, record):
+        array_val = getattr(record, self.attr)
+        if array_val is None: return None
+        if self._drop_empty and not array_val and not array_val.trailer:
+            return None # don't dump out empty arrays
+        if self._prelude:
+            sub_data = self._prelude.pack_subrecord_data(record)
+        else:
+            sub_data = b''
+        return sub_data + array_val.get_data()
+
 #------------------------------------------------------------------------------
 class MelTruncatedStruct(MelStruct):
     """Works like a MelStruct, but automatically upgrades certain older,
@@ -532,6 +802,14 @@ def decide_dump(self, record):
         if self.__class__.can_decide_at_dump:
             raise exception.AbstractError()
 
+    def load_dependencies(self):
+        """Returns the record attributes that decide_load reads. Only the
+        subrecords of these get loaded for records that are loaded partially,
+        see MelSet.get_skipped_sigs.
+
+        :rtype: tuple[unicode]"""
+        return ()
+
 class ACommonDecider(ADecider):
     """Abstract class for deciders that can decide at both load and dump-time,
     based only on the record. Provides a single method, _decide_common, that
@@ -558,6 +836,9 @@ def __init__(self, target_attr):
         :type target_attr: unicode"""
         self._target_attr = target_attr
 
+    def load_dependencies(self):
+        return self._target_attr,
+
     def _decide_common(self, record):
         ##: Wasteful, but bush imports brec which uses this decider, so we
         # can't import bush in __init__...
@@ -590,6 +871,9 @@ def __init__(self, target_attr, transformer=None,
         self.transformer = transformer
         self.assign_missing = assign_missing
 
+    def load_dependencies(self):
+        return self.target_attr,
+
     def _decide_common(self, record):
         if self.assign_missing is not self._assign_missing_sentinel:
             # We have a valid assign_missing, default to it
@@ -612,6 +896,9 @@ def __init__(self, flags_attr, *required_flags):
         self._flags_attr = flags_attr
         self._required_flags = required_flags
 
+    def load_dependencies(self):
+        return self._flags_attr,
+
     def _decide_common(self, record):
         flags_val = getattr(record, self._flags_attr)
         return all(getattr(flags_val, flag_name)
@@ -658,6 +945,9 @@ def decide_load(self, record, ins, sub_type, rec_size):
         # the delegate decider
         return self._decider.decide_load(target, ins, sub_type, rec_size)
 
+    def load_dependencies(self):
+        return self._decider.load_dependencies()
+
     def decide_dump(self, record):
         if not self.can_decide_at_dump:
             raise exception.AbstractError()
@@ -804,6 +1094,13 @@ def getSlotsUsed(self):
         if self.fallback: slots_ret.update(self.fallback.getSlotsUsed())
         return tuple(slots_ret)
 
+    def load_dependencies(self):
+        deps_ret = set(self.decider.load_dependencies())
+        for element in self.element_mapping.itervalues():
+            deps_ret.update(element.load_dependencies())
+        if self.fallback: deps_ret.update(self.fallback.load_dependencies())
+        return tuple(deps_ret)
+
     def getLoaders(self, loaders):
         # We need to collect all signatures and assign ourselves for them all
         # to handle unions with different signatures
@@ -25,7 +25,9 @@
 
 from __future__ import division, print_function
 
+import re
 from itertools import izip
+from keyword import iskeyword
 
 from .utils_constants import FID, null1, _make_hashable, FixedString, \
     _int_unpacker, get_structs
@@ -34,18 +36,61 @@
     struct_error
 
 #------------------------------------------------------------------------------
+# Types of values that are never modified in place
+_immutable_types = frozenset((type(None), bool, int, long, float, bytes,
+                              unicode, buffer, bolt.Path))
+_class_slots = {}
+
+def _get_class_slots(obj_class):
+    """Returns the names of all slots defined by obj_class and its bases."""
+    try:
+        return _class_slots[obj_class]
+    except KeyError:
+        all_slots = []
+        for klass in reversed(obj_class.__mro__):
+            klass_slots = klass.__dict__.get(u'__slots__', ())
+            if isinstance(klass_slots, basestring):
+                klass_slots = (klass_slots,)
+            all_slots.extend(s for s in klass_slots if s not in all_slots
+                             and s not in (u'__dict__', u'__weakref__'))
+        return _class_slots.setdefault(obj_class, tuple(all_slots))
+
 class MelObject(object):
-    """An empty class used by group and structure elements for data storage."""
+    """An empty class used by group and structure elements for data storage.
+    MelGroup and MelGroups use subclasses that store their attributes in
+    slots instead - see MelGroup.get_object_class."""
+    # The attributes of such a subclass - only those are compared, hashed and
+    # copied for its instances
+    _mel_attrs = None
+
+    def _get_attrs(self):
+        """Returns a dict mapping the names of the attributes set on this
+        object to their values."""
+        mel_attrs = self._mel_attrs
+        if mel_attrs is None:
+            obj_attrs = self.__dict__.copy()
+            obj_attrs.pop(u'__slots__', None)
+            return obj_attrs
+        obj_attrs = {}
+        for obj_attr in mel_attrs:
+            try:
+                obj_attrs[obj_attr] = getattr(self, obj_attr)
+            except AttributeError:
+                pass # e.g. the internal attributes of unions
+        return obj_attrs
+
     def __eq__(self,other):
         """Operator: =="""
-        return isinstance(other,MelObject) and self.__dict__ == other.__dict__
+        return isinstance(other,MelObject) and \
+               self._get_attrs() == other._get_attrs()
 
     def __ne__(self,other):
         """Operator: !="""
-        return not isinstance(other,MelObject) or self.__dict__ != other.__dict__
+        return not isinstance(other,MelObject) or \
+               self._get_attrs() != other._get_attrs()
 
     def __hash__(self):
-        return hash(_make_hashable(self.__dict__))
+        return hash(_make_hashable(self._get_attrs()))
 
     def __repr__(self):
         """Carefully try to show as much info about ourselves as possible."""
@@ -156,6 +201,11 @@ def __init__(self, mel_sig, attr, default=None):
     def getSlotsUsed(self):
         return self.attr,
 
+    def load_dependencies(self):
+        """Returns the attributes of the host record that load_mel reads, i.e.
+        the ones that have to be loaded before this element can be loaded."""
+        return ()
+
     def getDefaulters(self,defaulters,base):
         """Registers self as a getDefault(attr) provider."""
         pass
@@ -441,10 +491,13 @@ def dumpData(self, record, out): pass
 #------------------------------------------------------------------------------
 class MelGroup(MelSequential):
     """Represents a group record."""
+    _valid_slot = re.compile(u'^[A-Za-z_][A-Za-z0-9_]*$')
+
     def __init__(self,attr,*elements):
         """:type attr: unicode"""
         super(MelGroup, self).__init__(*elements)
         self.attr, self.loaders = attr, {}
+        self._object_class = None
 
     def getDefaulters(self,defaulters,base):
         defaulters[base+self.attr] = self
@@ -462,12 +515,54 @@ def setDefault(self,record):
         setattr(record, self.attr, None)
 
     def getDefault(self):
-        target = MelObject()
-        target.__slots__ = [s for element in self.elements for s in
-                            element.getSlotsUsed()]
+        return self.get_object_class()()
+
+    def get_object_class(self):
+        """Returns the MelObject subclass this group stores its attributes
+        in, creating it the first time this is called. Its instances keep
+        their attributes in slots and get initialized with our elements'
+        defaults by a generated __init__ - immutable defaults and empty lists
+        are inlined, other elements have their setDefault called."""
+        if self._object_class is not None: return self._object_class
+        obj_attrs = []
         for element in self.elements:
-            element.setDefault(target)
-        return target
+            obj_attrs.extend(s for s in element.getSlotsUsed()
+                             if s not in obj_attrs)
+        # Attributes that can't be slots (e.g. name-mangled ones) go into
+        # the instance's __dict__ as before
+        obj_slots = [s for s in obj_attrs if self._valid_slot.match(s)
+                     and not s.startswith(u'__')]
+        namespace = {}
+        src = [u'def __init__(self):']
+        probe = MelObject()
+        for index, element in enumerate(self.elements):
+            probe.__dict__.clear()
+            element.setDefault(probe)
+            defaults = sorted(probe.__dict__.iteritems())
+            # Keywords (e.g. 'global') can't be assigned to in the source
+            if all(a in obj_slots and not iskeyword(a) and (
+                    type(v) in _immutable_types or (
+                    type(v) is list and not v)) for a, v in defaults):
+                for attr, default in defaults:
+                    if type(default) is list:
+                        src.append(u'    self.%s = []' % attr)
+                    else:
+                        default_name = u'_default%u_%s' % (index, attr)
+                        namespace[default_name] = default
+                        src.append(u'    self.%s = %s' % (attr,
+                                                          default_name))
+            else:
+                setter_name = u'_set_default%u' % index
+                namespace[setter_name] = element.setDefault
+                src.append(u'    %s(self)' % setter_name)
+        if len(src) == 1: src.append(u'    pass')
+        exec(u'\n'.join(src), namespace)
+        self._object_class = type(str(u'MelObject_%s' % self.attr),
+            (MelObject,), {u'__slots__': obj_slots,
+                           u'_mel_attrs': tuple(obj_attrs),
+                           u'__init__': namespace[u'__init__'],
+                           u'__module__': __name__})
+        return self._object_class
 
     def load_mel(self, record, ins, sub_type, size_, readId):
         target = getattr(record, self.attr)
@@ -510,9 +605,7 @@ def load_mel(self, record, ins, sub_type, size_, readId):
     def _new_object(self, record):
         """Creates a new MelObject, initializes it and appends it to this
         MelGroups' attribute."""
-        target = self.getDefault()
-        target.__slots__ = [s for element in self.elements for s in
-                            element.getSlotsUsed()]
+        target = self.get_object_class()()
         getattr(record, self.attr).append(target)
         return target
 
@@ -29,7 +29,7 @@
 from operator import attrgetter
 
 from .advanced_elements import FidNotNullDecider, AttrValDecider, MelArray, \
-    MelUnion
+    MelPackedArray, MelUnion
 from .basic_elements import MelBase, MelFid, MelFids, MelFloat, MelGroups, \
     MelLString, MelNull, MelStruct, MelUInt32, MelSInt32, MelFixedString, \
     MelUnicode
@@ -236,9 +236,16 @@ class MreLand(MelRecord):
 
     melSet = MelSet(
         MelBase('DATA', 'unknown'),
-        MelBase('VNML', 'vertex_normals'),
-        MelBase('VHGT', 'vertex_height_map'),
-        MelBase('VCLR', 'vertex_colors'),
+        # 33x33 grids of vertices, see MelPackedArray
+        MelPackedArray(b'VNML', u'vertex_normals', u'3B',
+                       (u'normal_x', u'normal_y', u'normal_z')),
+        # The heights are stored as gradients, followed by 3 unused bytes
+        MelPackedArray(b'VHGT', u'vertex_height_map', u'b',
+                       (u'height_gradient',),
+                       prelude=MelFloat(b'VHGT', u'height_offset'),
+                       num_elements=33 * 33),
+        MelPackedArray(b'VCLR', u'vertex_colors', u'3B',
+                       (u'red', u'green', u'blue')),
         MelGroups('layers',
             # Start a new layer each time we hit one of these
             MelUnion({
@@ -249,7 +256,8 @@ class MreLand(MelRecord):
             }),
             # VTXT only exists for ATXT layers, i.e. if ATXT's FormID is valid
             MelUnion({
-                True:  MelBase(b'VTXT', u'alpha_layer_data'),
+                True:  MelPackedArray(b'VTXT', u'alpha_layer_data', u'H2sf',
+                                      (u'position', u'unused1', u'opacity')),
                 False: MelNull(b'VTXT'),
             }, decider=FidNotNullDecider(u'atxt_texture')),
         ),
@@ -24,7 +24,11 @@
 files."""
 
 from __future__ import division, print_function
+import mmap
 import os
+import zlib
+from collections import deque
+from struct import Struct
 
 # no local imports beyond this, imported everywhere in brec
 from .utils_constants import _int_unpacker, group_types, null1, strFid
@@ -211,6 +215,12 @@ def __init__(self,inName,ins):
     def __enter__(self): return self
     def __exit__(self, exc_type, exc_value, exc_traceback): self.ins.close()
 
+    def take_decompressed(self):
+        """Returns the decompressed data of the compressed record whose data
+        starts at the current position if it was decompressed in advance,
+        None otherwise. See MmapModReader.prefetch_decompressed."""
+        return None
+
     def setStringTable(self, string_table):
         self.hasStrings = bool(string_table)
         self.strings = string_table or {} # table may be None
@@ -261,7 +271,7 @@ def readLString(self, size, recType='----', __unpacker=_int_unpacker):
         zero-terminated string."""
         if self.hasStrings:
             if size != 4:
-                endPos = self.ins.tell() + size
+                endPos = self.tell() + size
                 raise exception.ModReadError(self.inName, recType, endPos, self.size)
             id_, = self.unpack(__unpacker, 4, recType)
             if id_ == 0: return u''
@@ -298,3 +308,168 @@ def unpackRef(self, __unpacker=_int_unpacker):
 
     def unpackRecHeader(self, __head_unpack=unpack_header):
         return __head_unpack(self)
+
+class MmapModReader(ModReader):
+    """ModReader backed by a read-only memory map of the whole file. Keeps
+    track of its own read position and unpacks straight from the map via
+    Struct.unpack_from, so that reading headers and subrecords does not call
+    into the file object nor allocate intermediate bytes objects.
+
+    Everything that is read out of the map is copied, so that no record
+    keeps the map (and, on Windows, the file) open once the reader has been
+    closed."""
+
+    def __init__(self, inName, ins):
+        self.inName = inName
+        self.ins = ins
+        self.size = os.fstat(ins.fileno()).st_size
+        # mmap can't map empty files - use an empty string instead, which
+        # supports all the operations we need
+        self._map = mmap.mmap(ins.fileno(), 0, access=mmap.ACCESS_READ) \
+            if self.size else b''
+        self._pos = ins.tell()
+        # Data positions and results of records being decompressed in the
+        # background, see prefetch_decompressed
+        self._prefetched = None
+        self.strings = {}
+        self.hasStrings = False
+
+    def __exit__(self, exc_type, exc_value, exc_traceback): self.close()
+
+    #--Background decompression ---------------------------
+    # At most this many batches of this many records each are decompressed
+    # ahead of the record being loaded, more only get queued once
+    # take_decompressed has consumed the earlier ones - keeps the memory used
+    # by decompressed data that is waiting to be loaded bounded
+    prefetch_batches = 16
+    prefetch_batch_size = 16
+
+    def prefetch_decompressed(self, pool, data_chunks):
+        """Starts decompressing the data of compressed records in the threads
+        of the specified pool (zlib releases the GIL while decompressing). The
+        results are handed out in file order by take_decompressed, records
+        that get skipped just have their results dropped.
+
+        :param pool: A multiprocessing.pool.ThreadPool.
+        :param data_chunks: (position, size) tuples, one for the data of every
+            compressed record to decompress, sorted by position."""
+        self.drop_prefetched()
+        if not data_chunks: return
+        # pool, chunks still to queue, (positions, AsyncResult) of the queued
+        # batches, (position, result) of the records of the batch taken last
+        self._prefetched = (pool, deque(data_chunks), deque(), deque())
+        self._queue_prefetch()
+
+    def _queue_prefetch(self):
+        pool, waiting, queued, _taken = self._prefetched
+        the_map = self._map
+        batch_size = self.prefetch_batch_size
+        while waiting and len(queued) < self.prefetch_batches:
+            batch = [waiting.popleft() for _x in xrange(
+                min(batch_size, len(waiting)))]
+            # The first 4 bytes are the decompressed size, checked by
+            # MreRecord
+            queued.append(([pos for pos, _size in batch], pool.apply_async(
+                _decompress_chunks, ([buffer(the_map, pos + 4, size - 4)
+                                      for pos, size in batch],))))
+
+    def take_decompressed(self):
+        if self._prefetched is None: return None
+        _pool, _waiting, queued, taken = self._prefetched
+        pos = self._pos
+        while True:
+            while taken and taken[0][0] < pos: taken.popleft()
+            if taken:
+                if taken[0][0] != pos: return None
+                result = taken.popleft()[1]
+                if isinstance(result, zlib.error): raise result
+                return result
+            # Don't wait for a batch that starts past the current record
+            if not queued or queued[0][0][0] > pos: return None
+            positions, async_result = queued.popleft()
+            self._queue_prefetch()
+            taken.extend(zip(positions, async_result.get()))
+
+    def drop_prefetched(self):
+        """Waits for any background decompression to finish and drops its
+        results. Must be done before the map goes away."""
+        if self._prefetched is not None:
+            for _positions, async_result in self._prefetched[2]:
+                async_result.wait()
+            self._prefetched = None
+
+    #--I/O Stream -----------------------------------------
+    def seek(self, offset, whence=os.SEEK_SET, recType=b'----'):
+        """Map seek."""
+        if whence == os.SEEK_CUR:
+            newPos = self._pos + offset
+        elif whence == os.SEEK_END:
+            newPos = self.size + offset
+        else:
+            newPos = offset
+        if newPos < 0 or newPos > self.size:
+            raise exception.ModReadError(self.inName, recType, newPos,
+                                         self.size)
+        self._pos = newPos
+
+    def tell(self):
+        """Map tell."""
+        return self._pos
+
+    def close(self):
+        """Close file and map."""
+        self.drop_prefetched()
+        if self.size:
+            self._map.close()
+        self._map = b''
+        self.ins.close()
+
+    def atEnd(self, endPos=-1, recType=b'----'):
+        """Return True if current read position is at EOF."""
+        if endPos == -1:
+            return self._pos == self.size
+        elif self._pos > endPos:
+            raise exception.ModError(self.inName,
+                                     u'Exceeded limit of: ' + recType)
+        else:
+            return self._pos == endPos
+
+    #--Read/Unpack ----------------------------------------
+    def read(self, size, recType=b'----'):
+        """Read from map."""
+        pos = self._pos
+        endPos = pos + size
+        if endPos > self.size:
+            raise exception.ModSizeError(self.inName, recType, (endPos,),
+                                         self.size)
+        self._pos = endPos
+        return self._map[pos:endPos]
+
+    def unpack(self, struct_unpacker, size, recType=b'----'):
+        """Unpack size bytes at the current position according to format of
+        struct_unpacker, without reading them out of the map first."""
+        pos = self._pos
+        endPos = pos + size
+        if endPos > self.size:
+            raise exception.ModReadError(self.inName, recType, endPos,
+                                         self.size)
+        # struct_unpacker is the bound unpack method of a precompiled Struct
+        # - unpack_from would silently accept a size mismatch, so let unpack
+        # raise in that case
+        st = getattr(struct_unpacker, u'__self__', None)
+        if not isinstance(st, Struct) or st.size != size:
+            return struct_unpacker(self.read(size, recType))
+        self._pos = endPos
+        return st.unpack_from(self._map, pos)
+
+def _decompress_chunks(data_chunks):
+    """Run in a worker thread by MmapModReader.prefetch_decompressed. Errors
+    are returned instead of raised, so that they only get raised if the
+    record in question is actually loaded."""
+    results = []
+    for data_chunk in data_chunks:
+        try:
+            results.append(zlib.decompress(data_chunk))
+        except zlib.error as e:
+            results.append(e)
+    return results
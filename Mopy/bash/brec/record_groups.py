@@ -26,23 +26,193 @@
 from __future__ import division, print_function
 
 import io
+import zlib
+from array import array
 from collections import deque
 from itertools import chain, izip
 from operator import itemgetter, attrgetter
 
 # Wrye Bash imports
+from .basic_elements import unpackSubHeader
 from .mod_io import GrupHeader, ModReader, RecordHeader, TopGrupHeader
+from .record_structs import MreRecord, _compressed_flag_mask
 from .utils_constants import group_types
 from ..bolt import GPath, pack_int, structs_cache
+
+# Optional, vectorizes the queries of RefColumns
+try:
+    import numpy
+except ImportError:
+    numpy = None
 from ..exception import AbstractError, ModError, ModFidMismatchError
 
+def _start_group(out, group_header):
+    """Writes group_header to out and returns its position. The size in the
+    header is only a placeholder, see _finish_group."""
+    group_pos = out.tell()
+    out.write(group_header.pack_head())
+    return group_pos
+
+def _finish_group(out, group_pos):
+    """Fills in the size of the group whose header was written at group_pos,
+    assuming out is now at the end of the group, and returns that size."""
+    end_pos = out.tell()
+    group_size = end_pos - group_pos
+    out.seek(group_pos + 4) # skip the signature
+    pack_int(out, group_size)
+    out.seek(end_pos)
+    return group_size
+
+_get_fid = attrgetter(u'fid')
+
+def _rec_key_getter(null_fid):
+    """Returns a function computing the key records are indexed by in a
+    MobObjects block - their fid, except for records that are keyed by EDID
+    and have a null fid."""
+    def _rec_key(record):
+        rec_id = record.fid
+        if record.isKeyedByEid and rec_id == null_fid:
+            return record.eid
+        return rec_id
+    return _rec_key
+
+class IndexedRecords(object):
+    """An ordered collection of records (or record blocks), indexed by a key
+    computed from each entry - usually the fid of the record. Iterating
+    yields the entries in order, like a list would, while 'in', [] and get
+    look entries up by key. Setting, replacing and popping an entry by key
+    are O(1) - popped entries leave holes behind, which are compacted once
+    they make up half of the entries. The index is only built once a lookup
+    needs it, so loading a block does not pay for it.
+
+    If an owner block is given, its record counts are invalidated whenever
+    entries are added or removed. If adopt is True as well, the entries are
+    record blocks, whose parent_block is set to the owner."""
+    __slots__ = (u'_entries', u'_index', u'_holes', u'_get_key', u'_owner',
+                 u'_adopt')
+
+    def __init__(self, get_key, entries=(), owner=None, adopt=False):
+        self._get_key = get_key
+        self._entries = list(entries)
+        self._index = None
+        self._holes = 0
+        self._owner = owner
+        self._adopt = adopt
+
+    def _entries_changed(self, new_entries=()):
+        """Lets our owner know that entries were added or removed - see
+        MobBase.invalidate_counts."""
+        owner = self._owner
+        if owner is not None:
+            if self._adopt:
+                for entry in new_entries:
+                    entry.parent_block = owner
+            owner.invalidate_counts()
+
+    def _get_index(self):
+        if self._index is None:
+            get_key = self._get_key
+            self._index = {get_key(e): i for i, e in enumerate(self._entries)
+                           if e is not None}
+        return self._index
+
+    def __iter__(self):
+        if self._holes:
+            return (e for e in self._entries if e is not None)
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries) - self._holes
+
+    def __contains__(self, key):
+        return key in self._get_index()
+
+    def __getitem__(self, key):
+        return self._entries[self._get_index()[key]]
+
+    def get(self, key, default=None):
+        """Returns the entry with the specified key, or default if there is
+        no such entry."""
+        try:
+            return self._entries[self._get_index()[key]]
+        except KeyError:
+            return default
+
+    def append(self, entry):
+        """Adds entry at the end, without checking for an existing entry with
+        the same key - use set_entry for that."""
+        if self._index is not None:
+            self._index[self._get_key(entry)] = len(self._entries)
+        self._entries.append(entry)
+        self._entries_changed((entry,))
+
+    def set_entry(self, entry):
+        """Replaces the entry with the same key as the specified one in place,
+        or adds it at the end if there is no such entry."""
+        key = self._get_key(entry)
+        index = self._get_index()
+        entry_pos = index.get(key)
+        if entry_pos is None:
+            index[key] = len(self._entries)
+            self._entries.append(entry)
+        else:
+            self._entries[entry_pos] = entry
+            # Replacing a record does not change any counts, replacing a
+            # block does
+            if not self._adopt: return
+        self._entries_changed((entry,))
+
+    def pop(self, key):
+        """Removes the entry with the specified key and returns it. Raises a
+        KeyError if there is no such entry."""
+        entry_pos = self._get_index().pop(key)
+        entry = self._entries[entry_pos]
+        self._entries[entry_pos] = None
+        self._holes += 1
+        if self._holes * 2 > len(self._entries):
+            self._compact()
+        self._entries_changed()
+        return entry
+
+    def _compact(self):
+        """Drops all holes, keeping the index up to date without recomputing
+        the keys of the entries."""
+        new_positions = {}
+        new_entries = []
+        for entry_pos, entry in enumerate(self._entries):
+            if entry is not None:
+                new_positions[entry_pos] = len(new_entries)
+                new_entries.append(entry)
+        self._entries = new_entries
+        self._holes = 0
+        if self._index is not None:
+            self._index = {k: new_positions[p] for k, p
+                           in self._index.iteritems()}
+
+    def replace_entries(self, new_entries):
+        """Replaces all entries with the specified ones, in their order."""
+        self._entries = list(new_entries)
+        self._index = None
+        self._holes = 0
+        self._entries_changed(self._entries)
+
+    def reindex(self):
+        """Discards the index, so that it is rebuilt the next time a lookup
+        needs it. Must be called when the keys of the entries changed, e.g.
+        after converting their fids."""
+        if self._holes: self._compact()
+        self._index = None
+
+    def __repr__(self):
+        return u'%s(%r)' % (self.__class__.__name__, list(self))
+
 class MobBase(object):
     """Group of records and/or subgroups. This basic implementation does not
     support unpacking, but can report its number of records and be written."""
 
     __slots__ = [u'header',u'size',u'label',u'groupType', u'stamp', u'debug',
                  u'data', u'changed', u'numRecords', u'loadFactory',
-                 u'inName'] ##: nice collection of forbidden names, including header -> group_header
+                 u'inName', u'parent_block', u'_cached_counts'] ##: nice collection of forbidden names, including header -> group_header
 
     def __init__(self, header, loadFactory, ins=None, do_unpack=False):
         self.header = header
@@ -60,6 +230,10 @@ def __init__(self, header, loadFactory, ins=None, do_unpack=False):
         self.numRecords = -1
         self.loadFactory = loadFactory
         self.inName = ins and ins.inName
+        # The block containing this one, if any - see invalidate_counts
+        self.parent_block = None
+        # getNumRecords results for includeGroups False and True
+        self._cached_counts = [None, None]
         if ins: self.load_rec_group(ins, do_unpack)
 
     def load_rec_group(self, ins=None, do_unpack=False):
@@ -67,8 +241,8 @@ def load_rec_group(self, ins=None, do_unpack=False):
         if self.debug: print(u'GRUP load:',self.label)
         #--Read, but don't analyze.
         if not do_unpack:
-            self.data = ins.read(self.size - RecordHeader.rec_header_size,
-                                 type(self))
+            self.data = ins.read(
+                self.size - RecordHeader.rec_header_size, type(self))
         #--Analyze ins.
         elif ins is not None:
             self._load_rec_group(ins,
@@ -92,8 +266,33 @@ def getSize(self):
         return self.size
 
     def getNumRecords(self,includeGroups=True):
+        """Returns number of records, including self and all children - the
+        group headers only if includeGroups is True. The result is cached
+        until invalidate_counts is called."""
+        includeGroups = bool(includeGroups)
+        count = self._cached_counts[includeGroups]
+        if count is None:
+            count = self._cached_counts[includeGroups] = \
+                self._count_records(includeGroups)
+        return count
+
+    def invalidate_counts(self):
+        """Discards the cached record counts of this block and of all blocks
+        containing it. Must be called whenever records are added to or
+        removed from this block - containers and attributes holding records
+        take care of that."""
+        block = self
+        while block is not None:
+            cached_counts = block._cached_counts
+            # If a block's counts are not cached, neither are its parent's
+            if cached_counts[0] is None and cached_counts[1] is None: break
+            cached_counts[0] = cached_counts[1] = None
+            block = block.parent_block
+
+    def _count_records(self, includeGroups):
         """Returns number of records, including self (if plusSelf), unless
-        there's no subrecords, in which case, it returns 0."""
+        there's no subrecords, in which case, it returns 0. See
+        getNumRecords."""
         if self.changed:
             raise AbstractError
         elif self.numRecords > -1: #--Cached value.
@@ -201,12 +400,20 @@ class MobObjects(MobBase):
     all top groups except CELL, WRLD and DIAL."""
 
     def __init__(self, header, loadFactory, ins=None, do_unpack=False):
-        self.records = []
-        self.id_records = {}
-        from .. import bosh
-        self._null_fid = (bosh.modInfos.masterName, 0)
+        # Not modInfos.masterName, so that plugins can be loaded before
+        # modInfos has been set up
+        from .. import bush
+        self._null_fid = (GPath(bush.game.master_file), 0)
+        self.records = IndexedRecords(_rec_key_getter(self._null_fid),
+                                      owner=self)
         super(MobObjects, self).__init__(header, loadFactory, ins, do_unpack)
 
+    @property
+    def id_records(self):
+        """The records of this block, indexed by fid (or EDID, see
+        _rec_key_getter)."""
+        return self.records
+
     def get_all_signatures(self):
         return {self.label}
 
@@ -231,7 +438,7 @@ def getActiveRecords(self):
         """Returns non-ignored records."""
         return [record for record in self.records if not record.flags1.ignored]
 
-    def getNumRecords(self,includeGroups=True):
+    def _count_records(self, includeGroups):
         """Returns number of records, including self."""
         numRecords = len(self.records)
         if numRecords: numRecords += includeGroups #--Count self
@@ -254,11 +461,12 @@ def dump(self,out):
                                     self.stamp).pack_head())
             out.write(self.data)
         else:
-            size = self.getSize()
-            if size == RecordHeader.rec_header_size: return
-            out.write(TopGrupHeader(size,self.label,0,self.stamp).pack_head())
+            if not self.records: return
+            group_pos = _start_group(out, TopGrupHeader(0, self.label, 0,
+                                                        self.stamp))
             for record in self.records:
                 record.dump(out)
+            _finish_group(out, group_pos)
 
     def updateMasters(self, masterset_add):
         """Updates set of master names according to masters actually used."""
@@ -271,39 +479,20 @@ def convertFids(self,mapper,toLong):
         converting to short format."""
         for record in self.records:
             record.convertFids(mapper,toLong)
-        self.id_records.clear()
+        self.records.reindex()
 
     def indexRecords(self):
         """Indexes records by fid."""
-        self.id_records.clear()
-        for record in self.records:
-            self.id_records[record.fid] = record
+        self.records.reindex()
 
     def getRecord(self,fid,default=None):
         """Gets record with corresponding id.
         If record doesn't exist, returns None."""
-        if not self.records: return default
-        if not self.id_records: self.indexRecords()
-        return self.id_records.get(fid,default)
+        return self.records.get(fid, default)
 
     def setRecord(self,record):
         """Adds record to record list and indexed."""
-        self_recs = self.records
-        if self_recs and not self.id_records:
-            self.indexRecords()
-        record_id = record.fid
-        if record.isKeyedByEid and record_id == self._null_fid:
-            record_id = record.eid
-        self_id_recs = self.id_records
-        # This check fails fairly often, so do this instead of try/except
-        if record_id in self_id_recs:
-            ##: Building a fid -> index mapping in indexRecords could make this
-            # O(1) instead of O(n) - see if that's worth it (memory!)
-            self_recs[self_recs.index(
-                self_id_recs[record_id])] = record
-        else:
-            self_recs.append(record)
-        self_id_recs[record_id] = record
+        self.records.set_entry(record)
 
     def copy_records(self, records):
         """Copies the specified records into this block, overwriting existing
@@ -318,18 +507,15 @@ def copy_records(self, records):
 
     def keepRecords(self, p_keep_ids):
         """Keeps records with fid in set p_keep_ids. Discards the rest."""
-        self.records = [record for record in self.records if (
+        self.records.replace_entries([record for record in self.records if (
                 record.isKeyedByEid and record.fid == self._null_fid
-                and record.eid in p_keep_ids) or record.fid in p_keep_ids]
-        self.id_records.clear()
+                and record.eid in p_keep_ids) or record.fid in p_keep_ids])
         self.setChanged()
 
     def updateRecords(self, srcBlock, mergeIds):
-        if self.records and not self.id_records:
-            self.indexRecords()
         merge_ids_discard = mergeIds.discard
         copy_to_self = self.setRecord
-        dest_rec_fids = self.id_records
+        dest_rec_fids = self.records
         for record in srcBlock.getActiveRecords():
             src_rec_fid = record.fid
             if src_rec_fid in dest_rec_fids:
@@ -378,8 +564,7 @@ def merge_records(self, block, loadSet, mergeIds, iiSkipMerge, doFilter):
         # Apply any merge filtering we've done above to the record block in
         # question. That way, patchers won't see the records that have been
         # filtered out here.
-        block.records = filtered
-        block.indexRecords()
+        block.records.replace_entries(filtered)
 
     def iter_records(self):
         return iter(self.records)
@@ -427,7 +612,7 @@ def getSize(self):
             size += hsize + sum(hsize + i.getSize() for i in self.records)
         return size
 
-    def getNumRecords(self,includeGroups=True):
+    def _count_records(self, includeGroups):
         # DIAL record + GRUP + INFOs
         self.numRecords = 1 + (includeGroups + len(self.records)
                                if self.records else 0)
@@ -437,7 +622,6 @@ def dump(self, out):
         # Update TIFC if needed (i.e. Skyrim+)
         if hasattr(self.dial, u'info_count'):
             self.dial.info_count = len(self.records)
-        self.dial.getSize()
         self.dial.dump(out)
         if not self.changed:
             out.write(self.header.pack_head())
@@ -445,16 +629,14 @@ def dump(self, out):
         else:
             if not self.records: return
             # Sort our INFOs by PNAM just before writing them out
-            self.records = self._sort_by_pnam()
-            # Now we're ready to dump out the headers and each INFO child
-            hsize = RecordHeader.rec_header_size
-            infos_size = hsize + sum(hsize + i.getSize() for i in self.records)
+            self.records.replace_entries(self._sort_by_pnam())
             # Write out a GRUP header (needed in order to know the number of
             # bytes to read for all the INFOs), then dump all the INFOs
-            out.write(GrupHeader(infos_size, self.dial.fid, 7, self.stamp,
-                self.stamp2).pack_head())
+            group_pos = _start_group(out, GrupHeader(0, self.dial.fid, 7,
+                self.stamp, self.stamp2))
             for info in self.records:
                 info.dump(out)
+            _finish_group(out, group_pos)
 
     def get_all_signatures(self):
         return {self.dial.recType} | {i.recType for i in self.records}
@@ -467,12 +649,12 @@ def iter_records(self):
         return chain([self.dial], self.records)
 
     def keepRecords(self, p_keep_ids):
-        self.records = [i for i in self.records if i.fid in p_keep_ids]
+        self.records.replace_entries(
+            [i for i in self.records if i.fid in p_keep_ids])
         if self.records:
             p_keep_ids.add(self.dial.fid) # must keep parent around
         if self.dial.fid not in p_keep_ids:
             self.dial = None # will drop us from MobDials
-        self.id_records.clear()
         self.setChanged()
 
     def merge_records(self, block, loadSet, mergeIds, iiSkipMerge, doFilter):
@@ -591,10 +773,15 @@ def __repr__(self):
 class MobDials(MobBase):
     """DIAL top block of mod file."""
     def __init__(self, header, loadFactory, ins=None, do_unpack=True):
-        self.dialogues = []
-        self.id_dialogues = {}
+        self.dialogues = IndexedRecords(attrgetter(u'dial.fid'), owner=self,
+                                        adopt=True)
         super(MobDials, self).__init__(header, loadFactory, ins, do_unpack)
 
+    @property
+    def id_dialogues(self):
+        """The dialogues of this block, indexed by the fid of their DIAL."""
+        return self.dialogues
+
     def _load_rec_group(self, ins, endPos):
         """Loads data from input stream. Called by load()."""
         dial_class = self.loadFactory.getRecClass(b'DIAL')
@@ -635,7 +822,6 @@ def _load_rec_group(self, ins, endPos):
             else:
                 raise ModError(ins.inName,
                     u'Unexpected %r in %s top block.' % (dial_header, expType))
-        self.id_dialogues.clear()
         self.setChanged()
 
     def getSize(self):
@@ -647,7 +833,7 @@ def getSize(self):
             size += dialogue.getSize()
         return size
 
-    def getNumRecords(self,includeGroups=True):
+    def _count_records(self, includeGroups):
         """Returns number of records, including self plus info records."""
         self.numRecords = sum(d.getNumRecords(includeGroups)
                               for d in self.dialogues)
@@ -659,23 +845,26 @@ def dump(self, out):
             out.write(self.header.pack_head())
             out.write(self.data)
         else:
-            dial_size = self.getSize()
-            if dial_size == RecordHeader.rec_header_size: return
-            out.write(TopGrupHeader(dial_size, self.label, 0,
-                self.stamp).pack_head())
+            if not self.dialogues: return
+            group_pos = _start_group(out, TopGrupHeader(0, self.label, 0,
+                                                        self.stamp))
             for dialogue in self.dialogues:
+                # Resynchronize the stamps (##: unsure if needed)
+                dialogue.stamp = self.stamp
                 dialogue.dump(out)
+            _finish_group(out, group_pos)
 
     def convertFids(self, mapper, toLong):
         for dialogue in self.dialogues:
             dialogue.convertFids(mapper, toLong)
+        self.dialogues.reindex()
 
     def get_all_signatures(self):
         return set(chain.from_iterable(d.get_all_signatures()
                                        for d in self.dialogues))
 
     def indexRecords(self):
-        self.id_dialogues = {d.dial.fid: d for d in self.dialogues}
+        self.dialogues.reindex()
 
     def iter_records(self):
         return chain.from_iterable(d.iter_records() for d in self.dialogues)
@@ -683,15 +872,12 @@ def iter_records(self):
     def keepRecords(self, p_keep_ids):
         for dialogue in self.dialogues:
             dialogue.keepRecords(p_keep_ids)
-        self.dialogues = [d for d in self.dialogues if d.dial]
-        self.id_dialogues.clear()
+        self.dialogues.replace_entries([d for d in self.dialogues if d.dial])
         self.setChanged()
 
     def merge_records(self, block, loadSet, mergeIds, iiSkipMerge, doFilter):
         from ..mod_files import MasterSet # YUCK
-        if self.dialogues and not self.id_dialogues:
-            self.indexRecords()
-        lookup_dial = self.id_dialogues.get
+        lookup_dial = self.dialogues.get
         filtered_dials = []
         filtered_append = filtered_dials.append
         loadSetIsSuperset = loadSet.issuperset
@@ -728,40 +914,32 @@ def merge_records(self, block, loadSet, mergeIds, iiSkipMerge, doFilter):
             # We're either not Filter-tagged or we want to keep this dialogue
             filtered_append(src_dialogue)
         # Apply any merge filtering we've done above to the record block
-        block.dialogues = filtered_dials
-        block.indexRecords()
+        block.dialogues.replace_entries(filtered_dials)
 
     def remove_dialogue(self, dialogue):
-        """Removes the specified DIAL from this block. The exact DIAL object
-        must be present, otherwise a ValueError is raised."""
-        if self.dialogues and not self.id_dialogues:
-            self.indexRecords()
-        self.dialogues.remove(dialogue)
-        del self.id_dialogues[dialogue.fid]
+        """Removes the DIAL block of the specified DIAL from this block. A
+        DIAL with the same FormID must be present, otherwise a KeyError is
+        raised."""
+        self.dialogues.pop(dialogue.fid)
 
     def set_dialogue(self, dialogue):
         """Adds the specified DIAL to self, overriding an existing one with
         the same FormID or creating a new DIAL block."""
-        if self.dialogues and not self.id_dialogues:
-            self.indexRecords()
-        dial_fid = dialogue.fid
-        if dial_fid in self.id_dialogues:
-            self.id_dialogues[dial_fid].dial = dialogue
+        dial_block = self.dialogues.get(dialogue.fid)
+        if dial_block:
+            dial_block.dial = dialogue
         else:
             dial_block = MobDial(GrupHeader(0, 0, 7, self.stamp),
                 self.loadFactory, dialogue)
             dial_block.setChanged()
             self.dialogues.append(dial_block)
-            self.id_dialogues[dial_fid] = dial_block
 
     def updateMasters(self, masterset_add):
         for dialogue in self.dialogues:
             dialogue.updateMasters(masterset_add)
 
     def updateRecords(self, srcBlock, mergeIds):
-        if self.dialogues and not self.id_dialogues:
-            self.indexRecords()
-        lookup_dial = self.id_dialogues.get
+        lookup_dial = self.dialogues.get
         for src_dial in srcBlock.dialogues:
             # Check if we have a corresponding DIAL record in the destination
             dest_dial = lookup_dial(src_dial.dial.fid)
@@ -771,21 +949,313 @@ def updateRecords(self, srcBlock, mergeIds):
     def __repr__(self):
         return u'<DIAL GRUP: %u record(s)>' % len(self.dialogues)
 
+#------------------------------------------------------------------------------
+_ref_3d_attrs = (u'ref_pos_x', u'ref_pos_y', u'ref_pos_z', u'ref_rot_x',
+                 u'ref_rot_y', u'ref_rot_z')
+
+# Variants of record classes that only load the subrecords holding fids, see
+# MobCell._raw_fids_unchanged
+_fid_projections = {}
+
+def _get_fid_projection(rec_class):
+    try:
+        return _fid_projections[rec_class]
+    except KeyError:
+        fid_attrs = {a for element in rec_class.melSet.formElements
+                     for a in element.getSlotsUsed()}
+        return _fid_projections.setdefault(
+            rec_class, rec_class.get_projected_class(fid_attrs))
+
+def _chain_mappers(mappers):
+    """Returns a fid mapper applying all the specified mappers in order, or
+    None if there are none."""
+    if not mappers: return None
+    if len(mappers) == 1: return mappers[0]
+    def mapper(fid):
+        for m in mappers:
+            fid = m(fid)
+        return fid
+    return mapper
+
+def _scan_ref_data(inName, rec_sig, rec_data, __unpack_6f=structs_cache[
+        u'6f'].unpack, __unpack_f=structs_cache[u'f'].unpack):
+    """Reads the base fid (NAME), position and rotation (DATA) and scale
+    (XSCL) from the (decompressed) data of a placed reference, skipping all
+    other subrecords. See RefColumns."""
+    base_fid, pos_rot, ref_scale = 0, (0.0,) * 6, 1.0
+    with ModReader(inName, io.BytesIO(rec_data)) as reader:
+        reader_at_end = reader.atEnd
+        reader_unpack = reader.unpack
+        data_size = reader.size
+        while not reader_at_end(data_size, rec_sig):
+            mel_sig, mel_size = unpackSubHeader(reader, rec_sig)
+            if mel_sig == b'NAME' and mel_size == 4:
+                base_fid = reader.unpackRef()
+            elif mel_sig == b'DATA' and mel_size == 24:
+                pos_rot = reader_unpack(__unpack_6f, 24, rec_sig + b'.DATA')
+            elif mel_sig == b'XSCL' and mel_size == 4:
+                ref_scale, = reader_unpack(__unpack_f, 4, rec_sig + b'.XSCL')
+            else:
+                reader.seek(mel_size, 1)
+    return base_fid, pos_rot, ref_scale
+
+class RefColumns(object):
+    """Columnar view of the placed references (REFR, ACHR, ACRE) in the
+    persistent, temporary and distant children groups of a cell block, see
+    MobCell.get_ref_columns. The group types, signatures, fids, base fids,
+    record flags, positions and rotations (DATA, six floats per reference)
+    and scales (XSCL) of the references are stored in parallel columns, so
+    that bulk queries scan the columns instead of record objects - they are
+    vectorized if numpy is installed. Full records are only materialized by
+    get_record.
+
+    The fid columns hold integer codes, which fid_mapper maps to fids in the
+    format of the cell block's fids when they are handed out - for columns
+    read from raw data the codes are the short fids stored in the plugin."""
+    __slots__ = (u'group_types', u'signatures', u'fids', u'base_fids',
+                 u'flags', u'pos_rot', u'scales', u'fid_mapper', u'_records',
+                 u'_raw_source')
+
+    def __init__(self, fid_mapper=None):
+        self.group_types = array(u'B')
+        self.signatures = []
+        self.fids = array(u'I')
+        self.base_fids = array(u'I')
+        self.flags = array(u'I')
+        self.pos_rot = array(u'f')
+        self.scales = array(u'f')
+        # None if the codes are the fids themselves
+        self.fid_mapper = fid_mapper
+        # The records the columns were read from, or their positions in the
+        # raw data they were read from - see get_record
+        self._records = []
+        self._raw_source = None
+
+    def append_ref(self, group_type, rec_sig, fid_code, base_code, rec_flags,
+                   pos_rot, scale, rec_or_pos):
+        """Adds a reference to the columns. rec_or_pos is the record itself,
+        or the position of its header in the raw data passed to
+        set_raw_source."""
+        self.group_types.append(group_type)
+        self.signatures.append(rec_sig)
+        self.fids.append(fid_code)
+        self.base_fids.append(base_code)
+        self.flags.append(rec_flags)
+        self.pos_rot.extend(pos_rot)
+        self.scales.append(scale)
+        self._records.append(rec_or_pos)
+
+    def set_raw_source(self, inName, raw_data, string_table, rec_classes,
+                       pending_conversions):
+        """Marks these columns as read from raw_data (the data of a cell
+        children group). Records are then materialized from it with the
+        specified classes, applying the specified fid conversions."""
+        self._raw_source = (inName, raw_data, string_table, rec_classes,
+                            pending_conversions)
+
+    def __len__(self):
+        return len(self.fids)
+
+    def _map_fid(self, fid_code):
+        return self.fid_mapper(fid_code) if self.fid_mapper else fid_code
+
+    def get_fid(self, ref_index):
+        """Returns the fid of the reference at the specified index."""
+        return self._map_fid(self.fids[ref_index])
+
+    def get_base(self, ref_index):
+        """Returns the base fid of the reference at the specified index."""
+        return self._map_fid(self.base_fids[ref_index])
+
+    def get_pos_rot(self, ref_index):
+        """Returns the position and rotation of the reference at the
+        specified index, as a tuple of six floats."""
+        return tuple(self.pos_rot[ref_index * 6:ref_index * 6 + 6])
+
+    def get_record(self, ref_index):
+        """Returns the record of the reference at the specified index. For
+        columns read from raw data, this decodes a new record each time,
+        which is not part of the cell block - changing it won't change the
+        cell block."""
+        if self._raw_source is None:
+            return self._records[ref_index]
+        inName, raw_data, string_table, rec_classes, pending_conversions = \
+            self._raw_source
+        with ModReader(inName, io.BytesIO(raw_data)) as reader:
+            reader.setStringTable(string_table)
+            reader.seek(self._records[ref_index])
+            header = reader.unpackRecHeader()
+            record = rec_classes[header.recType](header, reader, True)
+        for mapper, toLong in pending_conversions:
+            record.convertFids(mapper, toLong)
+        return record
+
+    def indices_with_base(self, base_fid):
+        """Returns a sorted list of the indices of all references whose base
+        is the specified fid."""
+        base_codes = [c for c in set(self.base_fids)
+                      if self._map_fid(c) == base_fid]
+        if not base_codes: return []
+        if numpy is not None:
+            return numpy.flatnonzero(numpy.in1d(
+                numpy.frombuffer(self.base_fids, dtype=numpy.uint32),
+                base_codes)).tolist()
+        if len(base_codes) == 1:
+            base_code = base_codes[0]
+            return [i for i, c in enumerate(self.base_fids) if c == base_code]
+        base_codes = set(base_codes)
+        return [i for i, c in enumerate(self.base_fids) if c in base_codes]
+
+    def position_deltas(self, other_columns):
+        """Compares the positions and rotations of the references in these
+        columns with those of the references with the same fids in
+        other_columns. Returns a dict mapping the fids of the references that
+        differ to a tuple of six floats, the difference between the position
+        and rotation here and the one in other_columns."""
+        map_other = other_columns._map_fid
+        other_indices = {map_other(c): i for i, c
+                         in enumerate(other_columns.fids)}
+        map_self = self._map_fid
+        common_fids, self_indices, matched_indices = [], [], []
+        for i, fid_code in enumerate(self.fids):
+            ref_fid = map_self(fid_code)
+            if ref_fid in other_indices:
+                common_fids.append(ref_fid)
+                self_indices.append(i)
+                matched_indices.append(other_indices[ref_fid])
+        if not common_fids: return {}
+        if numpy is not None:
+            deltas = (numpy.frombuffer(self.pos_rot, dtype=numpy.float32
+                                       ).reshape(-1, 6)[self_indices] -
+                      numpy.frombuffer(other_columns.pos_rot,
+                                       dtype=numpy.float32
+                                       ).reshape(-1, 6)[matched_indices])
+            return {common_fids[i]: tuple(deltas[i].tolist()) for i in
+                    numpy.flatnonzero(numpy.any(deltas != 0, axis=1))}
+        self_pos_rot, other_pos_rot = self.pos_rot, other_columns.pos_rot
+        ret = {}
+        for ref_fid, i, j in izip(common_fids, self_indices, matched_indices):
+            delta = tuple(a - b for a, b in izip(
+                self_pos_rot[i * 6:i * 6 + 6], other_pos_rot[j * 6:j * 6 + 6]))
+            if any(delta): ret[ref_fid] = delta
+        return ret
+
+    def __repr__(self):
+        return u'<RefColumns: %u reference(s)>' % len(self)
+
 #------------------------------------------------------------------------------
 class MobCell(MobBase):
     """Represents cell block structure -- including the cell and all
-    subrecords."""
-    __slots__ = [u'cell', u'persistent_refs', u'distant_refs', u'temp_refs',
-                 u'land', u'pgrd']
+    subrecords.
+
+    If created from a stream without unpacking, the cell children group is
+    only read as raw data, and decoded the first time one of the children
+    attributes (persistent_refs, distant_refs, temp_refs, land, pgrd) is
+    accessed. FormID conversions are deferred until then, and if they leave
+    all fids unchanged (see _can_dump_raw), dump copies the raw data straight
+    to the output instead."""
+    __slots__ = [u'cell', u'_persistent_refs', u'_distant_refs',
+                 u'_temp_refs', u'_land', u'_pgrd', u'_lazy_children',
+                 u'_raw_fids_checked']
 
     def __init__(self, header, loadFactory, cell, ins=None, do_unpack=False):
         self.cell = cell
-        self.persistent_refs = []
-        self.distant_refs = []
-        self.temp_refs = []
-        self.land = None
-        self.pgrd = None
+        self._persistent_refs = IndexedRecords(_get_fid, owner=self)
+        self._distant_refs = IndexedRecords(_get_fid, owner=self)
+        self._temp_refs = IndexedRecords(_get_fid, owner=self)
+        self._land = None
+        self._pgrd = None
+        # The string table and (mapper, toLong) tuples of the fid conversions
+        # to apply once our children get decoded
+        self._lazy_children = None
+        # The number of deferred fid conversions that were checked to leave
+        # the fids of our children unchanged, see _can_dump_raw
+        self._raw_fids_checked = 0
         super(MobCell, self).__init__(header, loadFactory, ins, do_unpack)
+        if ins and not do_unpack:
+            self._lazy_children = (ins.strings if ins.hasStrings else None,
+                                   [])
+
+    def _load_children(self):
+        """Decodes our children from the raw data read when we were created,
+        applying any deferred fid conversions."""
+        string_table, pending_conversions = self._lazy_children
+        self._lazy_children = None
+        with self.getReader() as reader:
+            reader.setStringTable(string_table)
+            self._load_rec_group(reader, reader.size)
+        self.data = None
+        for mapper, toLong in pending_conversions:
+            self._convert_children(mapper, toLong)
+        # Our raw data may have held e.g. empty groups
+        self.invalidate_counts()
+
+    def _can_dump_raw(self):
+        """Returns True if our children have not been decoded and the fid
+        conversions deferred for them leave all their fids unchanged. Even
+        converting to long fids and back does not always do that - the long
+        mapper clamps HITMEs and the short mapper may map hardcoded object
+        IDs to the game master - so this is checked against the fids in our
+        raw data, decoding our children if the check fails."""
+        if self._lazy_children is None: return False
+        pending_conversions = self._lazy_children[1]
+        num_conversions = len(pending_conversions)
+        if num_conversions == self._raw_fids_checked: return True
+        # Still in long format, can't be dumped either way
+        if pending_conversions[-1][1]: return False
+        if self._raw_fids_unchanged():
+            self._raw_fids_checked = num_conversions
+            return True
+        self._load_children()
+        return False
+
+    def _raw_fids_unchanged(self):
+        """Returns True if the fid conversions deferred for our undecoded
+        children map each of their fids back to itself. Only the subrecords
+        holding fids get decoded for this, see _get_fid_projection."""
+        if not self.data: return True
+        string_table, pending_conversions = self._lazy_children
+        round_trip = _chain_mappers(
+            [mapper for mapper, _toLong in pending_conversions])
+        changed_fids = []
+        def _check_fid(fid):
+            if round_trip(fid) != fid: changed_fids.append(fid)
+            return fid
+        cellType_class = self.loadFactory.getCellTypeClass()
+        with self.getReader() as reader:
+            reader.setStringTable(string_table)
+            reader_at_end = reader.atEnd
+            reader_rec_header = reader.unpackRecHeader
+            reader_seek = reader.seek
+            while not reader_at_end(reader.size, u'Cell Block'):
+                header = reader_rec_header()
+                if header.recType == b'GRUP': continue
+                rec_class = cellType_class.get(header.recType)
+                if rec_class:
+                    _check_fid(header.fid)
+                if not rec_class or rec_class is MreRecord:
+                    reader_seek(header.size, 1)
+                else:
+                    _get_fid_projection(rec_class)(
+                        header, reader, True).mapFids(_check_fid, False)
+                if changed_fids: return False
+        return True
+
+    def _children_property(attr):
+        def _get_children(self):
+            if self._lazy_children is not None: self._load_children()
+            return getattr(self, attr)
+        def _set_children(self, value):
+            if self._lazy_children is not None: self._load_children()
+            setattr(self, attr, value)
+            self.invalidate_counts()
+        return property(_get_children, _set_children)
+    persistent_refs = _children_property(u'_persistent_refs')
+    distant_refs = _children_property(u'_distant_refs')
+    temp_refs = _children_property(u'_temp_refs')
+    land = _children_property(u'_land')
+    pgrd = _children_property(u'_pgrd')
+    del _children_property
 
     def _load_rec_group(self, ins, endPos):
         """Loads data from input stream. Called by load()."""
@@ -840,6 +1310,7 @@ def getSize(self):
     def getChildrenSize(self):
         """Returns size of all children, including the group header.  This
         does not include the cell itself."""
+        if self._can_dump_raw(): return self.size if self.data else 0
         size = self.getPersistentSize() + self.getTempSize() + \
                self.getDistantSize()
         return size + RecordHeader.rec_header_size * bool(size)
@@ -867,9 +1338,11 @@ def getDistantSize(self):
         size = sum(hsize + x.getSize() for x in self.distant_refs)
         return size + hsize * bool(size)
 
-    def getNumRecords(self,includeGroups=True):
+    def _count_records(self, includeGroups):
         """Returns number of records, including self and all children."""
         count = 1 # CELL record, always present
+        if self._can_dump_raw():
+            return count + self._count_raw_children(includeGroups)
         if self.persistent_refs:
             count += len(self.persistent_refs) + includeGroups
         if self.temp_refs or self.pgrd or self.land:
@@ -882,6 +1355,26 @@ def getNumRecords(self,includeGroups=True):
             count += includeGroups
         return count
 
+    def _count_raw_children(self, includeGroups):
+        """Counts the records in our undecoded children group, including the
+        group headers if includeGroups is True."""
+        if not self.data: return 0
+        num_records = num_groups = 0
+        with self.getReader() as reader:
+            reader_at_end = reader.atEnd
+            reader_rec_header = reader.unpackRecHeader
+            reader_seek = reader.seek
+            while not reader_at_end(reader.size, u'Cell Block'):
+                header = reader_rec_header()
+                if header.recType == b'GRUP':
+                    num_groups += 1
+                else:
+                    num_records += 1
+                    reader_seek(header.size, 1)
+        if includeGroups: # +1 for the children group itself
+            num_records += num_groups + 1
+        return num_records
+
     def getBsb(self):
         """Returns tesfile block and sub-block indices for cells in this group.
         For interior cell, bsb is (blockNum,subBlockNum). For exterior cell,
@@ -898,33 +1391,108 @@ def getBsb(self):
             if y is None: y = 0
             return (y // 32, x // 32), (y // 8, x // 8)
 
+    def get_ref_columns(self):
+        """Returns a RefColumns view of the placed references of this cell
+        block. If our children have not been decoded yet, the columns are
+        read straight from their raw data and they stay undecoded."""
+        if self._lazy_children is None:
+            return self._ref_columns_from_records()
+        string_table, pending_conversions = self._lazy_children
+        ref_columns = RefColumns(_chain_mappers(
+            [mapper for mapper, _toLong in pending_conversions]))
+        if not self.data: return ref_columns
+        cellType_class = self.loadFactory.getCellTypeClass()
+        ref_classes = {s: cellType_class[s] for s
+                       in (b'REFR', b'ACHR', b'ACRE') if cellType_class[s]}
+        ref_columns.set_raw_source(self.inName, self.data, string_table,
+                                   ref_classes, pending_conversions[:])
+        append_ref = ref_columns.append_ref
+        compressed_mask = _compressed_flag_mask()
+        with self.getReader() as reader:
+            reader_at_end = reader.atEnd
+            reader_rec_header = reader.unpackRecHeader
+            reader_seek = reader.seek
+            reader_tell = reader.tell
+            group_type = None
+            while not reader_at_end(reader.size, u'Cell Block'):
+                rec_pos = reader_tell()
+                header = reader_rec_header()
+                rec_sig = header.recType
+                if rec_sig == b'GRUP':
+                    group_type = header.groupType
+                elif rec_sig not in ref_classes:
+                    reader_seek(header.size, 1)
+                else:
+                    rec_data = reader.read(header.size, rec_sig)
+                    if header.flags1 & compressed_mask:
+                        rec_data = zlib.decompress(buffer(rec_data, 4))
+                    base_fid, pos_rot, ref_scale = _scan_ref_data(
+                        self.inName, rec_sig, rec_data)
+                    append_ref(group_type, rec_sig, header.fid, base_fid,
+                               header.flags1, pos_rot, ref_scale, rec_pos)
+        return ref_columns
+
+    def _ref_columns_from_records(self):
+        """Returns a RefColumns view of our decoded references, see
+        get_ref_columns."""
+        fid_codes = {}
+        code_fids = []
+        def _fid_code(ref_fid):
+            try:
+                return fid_codes[ref_fid]
+            except KeyError:
+                code_fids.append(ref_fid)
+                return fid_codes.setdefault(ref_fid, len(code_fids) - 1)
+        ref_columns = RefColumns(code_fids.__getitem__)
+        append_ref = ref_columns.append_ref
+        for group_type, ref_records in ((8, self.persistent_refs),
+                                        (9, self.temp_refs),
+                                        (10, self.distant_refs)):
+            for record in ref_records:
+                pos_rot = [getattr(record, a, None) or 0.0
+                           for a in _ref_3d_attrs]
+                append_ref(group_type, record.recType, _fid_code(record.fid),
+                    _fid_code(record.base), int(record.flags1), pos_rot,
+                    getattr(record, u'ref_scale', None) or 1.0, record)
+        return ref_columns
+
     def dump(self,out):
         """Dumps group header and then records."""
-        self.cell.getSize()
         self.cell.dump(out)
-        childrenSize = self.getChildrenSize()
-        if not childrenSize: return
-        self._write_group_header(out, childrenSize, 6)
+        if self._can_dump_raw():
+            if self.data:
+                self.header.size = self.size
+                out.write(self.header.pack_head())
+                out.write(self.data)
+            return
+        has_temp = self.temp_refs or self.pgrd or self.land
+        if not (self.persistent_refs or has_temp or self.distant_refs):
+            return
+        children_pos = self._write_group_header(out, 6)
         if self.persistent_refs:
-            self._write_group_header(out, self.getPersistentSize(), 8)
+            group_pos = self._write_group_header(out, 8)
             for record in self.persistent_refs:
                 record.dump(out)
-        if self.temp_refs or self.pgrd or self.land:
-            self._write_group_header(out, self.getTempSize(), 9)
+            _finish_group(out, group_pos)
+        if has_temp:
+            group_pos = self._write_group_header(out, 9)
             if self.pgrd:
                 self.pgrd.dump(out)
             if self.land:
                 self.land.dump(out)
             for record in self.temp_refs:
                 record.dump(out)
+            _finish_group(out, group_pos)
         if self.distant_refs:
-            self._write_group_header(out, self.getDistantSize(), 10)
+            group_pos = self._write_group_header(out, 10)
             for record in self.distant_refs:
                 record.dump(out)
+            _finish_group(out, group_pos)
+        _finish_group(out, children_pos)
 
-    def _write_group_header(self, out, group_size, group_type):
-        out.write(GrupHeader(group_size, self.cell.fid, group_type,
-                             self.stamp).pack_head()) # FIXME was TESIV only - self.extra??
+    def _write_group_header(self, out, group_type):
+        return _start_group(out, GrupHeader(0, self.cell.fid, group_type,
+                                            self.stamp)) # FIXME was TESIV only - self.extra??
 
     #--Fid manipulation, record filtering ----------------------------------
     def convertFids(self,mapper,toLong):
@@ -932,16 +1500,22 @@ def convertFids(self,mapper,toLong):
         toLong should be True if converting to long format or False if
         converting to short format."""
         self.cell.convertFids(mapper,toLong)
-        for record in self.temp_refs:
-            record.convertFids(mapper,toLong)
-        for record in self.persistent_refs:
-            record.convertFids(mapper,toLong)
-        for record in self.distant_refs:
-            record.convertFids(mapper,toLong)
-        if self.land:
-            self.land.convertFids(mapper,toLong)
-        if self.pgrd:
-            self.pgrd.convertFids(mapper,toLong)
+        if self._lazy_children is not None:
+            self._lazy_children[1].append((mapper, toLong))
+        else:
+            self._convert_children(mapper, toLong)
+
+    def _convert_children(self, mapper, toLong):
+        """Converts the fids of our (decoded) children, see convertFids."""
+        for ref_records in (self._temp_refs, self._persistent_refs,
+                            self._distant_refs):
+            for record in ref_records:
+                record.convertFids(mapper,toLong)
+            ref_records.reindex()
+        if self._land:
+            self._land.convertFids(mapper,toLong)
+        if self._pgrd:
+            self._pgrd.convertFids(mapper,toLong)
 
     def get_all_signatures(self):
         cell_sigs = {self.cell.recType}
@@ -980,14 +1554,11 @@ def updateRecords(self, srcBlock, mergeIds, __attrget=attrgetter(
                     record = record.getTypeCopy()
                     setattr(self, attr, record)
                     mergeDiscard(src_rec_fid)
-        for attr, (self_rec_list, src_rec_list) in izip(
-                (u'persistent_refs', u'temp_refs', u'distant_refs'),
-                self_src_attrs[3:]):
-            fids = {record.fid: i for i, record in enumerate(self_rec_list)}
+        for self_rec_list, src_rec_list in self_src_attrs[3:]:
             for record in src_rec_list:
                 src_fid = record.fid
-                if not record.flags1.ignored and src_fid in fids:
-                    self_rec_list[fids[src_fid]] = record.getTypeCopy()
+                if not record.flags1.ignored and src_fid in self_rec_list:
+                    self_rec_list.set_entry(record.getTypeCopy())
                     mergeDiscard(src_fid)
 
     def iter_records(self):
@@ -1001,11 +1572,10 @@ def keepRecords(self, p_keep_ids):
             self.pgrd = None
         if self.land and self.land.fid not in p_keep_ids:
             self.land = None
-        self.temp_refs = [x for x in self.temp_refs if x.fid in p_keep_ids]
-        self.persistent_refs = [x for x in self.persistent_refs
-                                if x.fid in p_keep_ids]
-        self.distant_refs = [x for x in self.distant_refs
-                             if x.fid in p_keep_ids]
+        for ref_records in (self.temp_refs, self.persistent_refs,
+                            self.distant_refs):
+            ref_records.replace_entries(
+                [x for x in ref_records if x.fid in p_keep_ids])
         if (self.pgrd or self.land or self.persistent_refs or self.temp_refs or
                 self.distant_refs):
             p_keep_ids.add(self.cell.fid)
@@ -1042,13 +1612,9 @@ def merge_records(self, block, loadSet, mergeIds, iiSkipMerge, doFilter):
         for list_attr in (u'temp_refs', u'persistent_refs', u'distant_refs'):
             filtered_list = []
             filtered_append = filtered_list.append
-            # Build a mapping from fids in the current list to the index at
-            # which they're stored ##: cache? see also updateRecords above
-            dest_list = getattr(self, list_attr)
-            append_to_dest = dest_list.append
-            id_fids = {record.fid: i for i, record
-                       in enumerate(dest_list)}
-            for src_rec in getattr(block, list_attr):
+            set_in_dest = getattr(self, list_attr).set_entry
+            src_list = getattr(block, list_attr)
+            for src_rec in src_list:
                 if src_rec.flags1.ignored: continue
                 # If we're Filter-tagged, perform merge filtering first
                 if doFilter:
@@ -1063,15 +1629,10 @@ def merge_records(self, block, loadSet, mergeIds, iiSkipMerge, doFilter):
                 if iiSkipMerge: continue
                 # We're past all hurdles - stick a copy of this record into
                 # ourselves and mark it as merged
-                src_fid = src_rec.fid
-                rec_copy = src_rec.getTypeCopy()
-                mergeIdsAdd(src_fid)
-                if rec_copy.fid in id_fids:
-                    dest_list[id_fids[src_fid]] = rec_copy
-                else:
-                    append_to_dest(rec_copy)
+                mergeIdsAdd(src_rec.fid)
+                set_in_dest(src_rec.getTypeCopy())
             # Apply any merge filtering we've done here
-            setattr(block, list_attr, filtered_list)
+            src_list.replace_entries(filtered_list)
 
     def __repr__(self):
         return (u'<CELL (%r): %u persistent record(s), %u distant record(s), '
@@ -1092,36 +1653,39 @@ class MobCells(MobBase):
     are tuples of grid tuples."""
 
     def __init__(self, header, loadFactory, ins=None, do_unpack=False):
-        self.cellBlocks = [] #--Each cellBlock is a cell and its related
-        # records.
-        self.id_cellBlock = {}
+        #--Each cellBlock is a cell and its related records
+        self.cellBlocks = IndexedRecords(attrgetter(u'cell.fid'), owner=self,
+                                         adopt=True)
         super(MobCells, self).__init__(header, loadFactory, ins, do_unpack)
 
+    @property
+    def id_cellBlock(self):
+        """The cell blocks of this block, indexed by the fid of their
+        cell."""
+        return self.cellBlocks
+
     def indexRecords(self):
         """Indexes records by fid."""
-        self.id_cellBlock = {x.cell.fid: x for x in self.cellBlocks}
+        self.cellBlocks.reindex()
 
     def setCell(self,cell):
         """Adds record to record list and indexed."""
-        if self.cellBlocks and not self.id_cellBlock:
-            self.indexRecords()
-        fid = cell.fid
-        if fid in self.id_cellBlock:
-            self.id_cellBlock[fid].cell = cell
+        cellBlock = self.cellBlocks.get(cell.fid)
+        if cellBlock:
+            cellBlock.cell = cell
+            # The cell may have moved to another block or sub-block
+            self.invalidate_counts()
         else:
             cellBlock = MobCell(GrupHeader(0, 0, 6, self.stamp), ##: Note label is 0 here - specialized GrupHeader subclass?
                                 self.loadFactory, cell)
             cellBlock.setChanged()
             self.cellBlocks.append(cellBlock)
-            self.id_cellBlock[fid] = cellBlock
 
     def remove_cell(self, cell):
-        """Removes the specified cell from this block. The exact cell object
-        must be present, otherwise a ValueError is raised."""
-        if self.cellBlocks and not self.id_cellBlock:
-            self.indexRecords()
-        self.cellBlocks.remove(cell)
-        del self.id_cellBlock[cell.fid]
+        """Removes the cell block of the specified cell from this block. A
+        cell with the same FormID must be present, otherwise a KeyError is
+        raised."""
+        self.cellBlocks.pop(cell.fid)
 
     def getUsedBlocks(self):
         """Returns a set of blocks that exist in this group."""
@@ -1131,50 +1695,46 @@ def getUsedSubblocks(self):
         """Returns a set of block/sub-blocks that exist in this group."""
         return {x.getBsb() for x in self.cellBlocks}
 
-    def getBsbSizes(self):
-        """Returns the total size of the block, but also returns a
-        dictionary containing the sizes of the individual block,subblocks."""
+    def getBsbCellBlocks(self):
+        """Returns a list of (block/sub-block, cell block) tuples, sorted in
+        the order they have to be written out in."""
         bsbCellBlocks = [(x.getBsb(),x) for x in self.cellBlocks]
         bsbCellBlocks.sort(key=lambda y: y[1].cell.fid)
         bsbCellBlocks.sort(key=itemgetter(0))
-        bsb_size = {}
-        hsize = RecordHeader.rec_header_size
-        totalSize = hsize
-        bsb_set_default = bsb_size.setdefault
-        for bsb,cellBlock in bsbCellBlocks:
-            cellBlockSize = cellBlock.getSize()
-            totalSize += cellBlockSize
-            bsb0 = (bsb[0],None) #--Block group
-            bsb_set_default(bsb0,hsize)
-            if bsb_set_default(bsb, hsize) == hsize:
-                bsb_size[bsb0] += hsize
-            bsb_size[bsb] += cellBlockSize
-            bsb_size[bsb0] += cellBlockSize
-        totalSize += hsize * len(bsb_size)
-        return totalSize,bsb_size,bsbCellBlocks
-
-    def dumpBlocks(self,out,bsbCellBlocks,bsb_size,blockGroupType,
-                   subBlockGroupType):
+        return bsbCellBlocks
+
+    def dumpBlocks(self,out,blockGroupType,subBlockGroupType):
         """Dumps the cell blocks and their block and sub-block groups to
         out."""
         curBlock = None
         curSubblock = None
+        block_pos = subblock_pos = None
         stamp = self.stamp
-        outWrite = out.write
-        for bsb,cellBlock in bsbCellBlocks:
+        for bsb,cellBlock in self.getBsbCellBlocks():
             (block,subblock) = bsb
             bsb0 = (block,None)
             if block != curBlock:
+                if subblock_pos is not None:
+                    _finish_group(out, subblock_pos)
+                    subblock_pos = None
+                if block_pos is not None:
+                    _finish_group(out, block_pos)
                 curBlock,curSubblock = bsb0
-                outWrite(GrupHeader(bsb_size[bsb0], block, blockGroupType, ##: Here come the tuples - specialized GrupHeader subclass?
-                                    stamp).pack_head())
+                block_pos = _start_group(out, GrupHeader(0, block, blockGroupType, ##: Here come the tuples - specialized GrupHeader subclass?
+                                                         stamp))
             if subblock != curSubblock:
+                if subblock_pos is not None:
+                    _finish_group(out, subblock_pos)
                 curSubblock = subblock
-                outWrite(GrupHeader(bsb_size[bsb], subblock, subBlockGroupType, ##: Here come the tuples - specialized GrupHeader subclass?
-                                    stamp).pack_head())
+                subblock_pos = _start_group(out, GrupHeader(0, subblock, subBlockGroupType, ##: Here come the tuples - specialized GrupHeader subclass?
+                                                            stamp))
             cellBlock.dump(out)
+        if subblock_pos is not None:
+            _finish_group(out, subblock_pos)
+        if block_pos is not None:
+            _finish_group(out, block_pos)
 
-    def getNumRecords(self,includeGroups=True):
+    def _count_records(self, includeGroups):
         """Returns number of records, including self and all children."""
         count = sum(x.getNumRecords(includeGroups) for x in self.cellBlocks)
         if count and includeGroups:
@@ -1195,15 +1755,13 @@ def keepRecords(self, p_keep_ids):
         #--Note: this call will add the cell to p_keep_ids if any of its
         # related records are kept.
         for cellBlock in self.cellBlocks: cellBlock.keepRecords(p_keep_ids)
-        self.cellBlocks = [x for x in self.cellBlocks if x.cell.fid in p_keep_ids]
-        self.id_cellBlock.clear()
+        self.cellBlocks.replace_entries(
+            [x for x in self.cellBlocks if x.cell.fid in p_keep_ids])
         self.setChanged()
 
     def merge_records(self, block, loadSet, mergeIds, iiSkipMerge, doFilter):
         from ..mod_files import MasterSet # YUCK
-        if self.cellBlocks and not self.id_cellBlock:
-            self.indexRecords()
-        lookup_cell_block = self.id_cellBlock.get
+        lookup_cell_block = self.cellBlocks.get
         filtered_cell_blocks = []
         filtered_append = filtered_cell_blocks.append
         loadSetIsSuperset = loadSet.issuperset
@@ -1241,8 +1799,7 @@ def merge_records(self, block, loadSet, mergeIds, iiSkipMerge, doFilter):
             # We're either not Filter-tagged or we want to keep this cell
             filtered_append(src_cell_block)
         # Apply any merge filtering we've done above to the record block
-        block.cellBlocks = filtered_cell_blocks
-        block.indexRecords()
+        block.cellBlocks.replace_entries(filtered_cell_blocks)
 
     def convertFids(self,mapper,toLong):
         """Converts fids between formats according to mapper.
@@ -1250,12 +1807,11 @@ def convertFids(self,mapper,toLong):
         converting to short format."""
         for cellBlock in self.cellBlocks:
             cellBlock.convertFids(mapper,toLong)
+        self.cellBlocks.reindex()
 
     def updateRecords(self, srcBlock, mergeIds):
         """Updates any records in 'self' that exist in 'srcBlock'."""
-        if self.cellBlocks and not self.id_cellBlock:
-            self.indexRecords()
-        id_Get = self.id_cellBlock.get
+        id_Get = self.cellBlocks.get
         for srcCellBlock in srcBlock.cellBlocks:
             cellBlock = id_Get(srcCellBlock.cell.fid)
             if cellBlock:
@@ -1290,9 +1846,10 @@ def _load_rec_group(self, ins, endPos):
         insTell = ins.tell
         def build_cell_block(unpack_block=False, skip_delta=False):
             """Helper method that parses and stores a cell block for the
-            current cell."""
+            current cell. Its children are only read here, MobCell decodes
+            them on demand."""
             if unpack_block:
-                cellBlock = MobCell(header, selfLoadFactory, cell, ins, True)
+                cellBlock = MobCell(header, selfLoadFactory, cell, ins)
             else:
                 cellBlock = MobCell(header, selfLoadFactory, cell)
                 if skip_delta:
@@ -1352,10 +1909,9 @@ def dump(self,out):
             out.write(self.header.pack_head())
             out.write(self.data)
         elif self.cellBlocks:
-            (totalSize, bsb_size, blocks) = self.getBsbSizes()
-            self.header.size = totalSize
-            out.write(self.header.pack_head())
-            self.dumpBlocks(out,blocks,bsb_size,2,3)
+            group_pos = _start_group(out, self.header)
+            self.dumpBlocks(out,2,3)
+            self.header.size = _finish_group(out, group_pos)
 
 #------------------------------------------------------------------------------
 class MobWorld(MobCells):
@@ -1364,10 +1920,30 @@ def __init__(self, header, loadFactory, world, ins=None, do_unpack=False):
         self.world = world
         ##: rename to e.g. persistent_block, this is the cell block that houses
         # all persistent objects in the worldspace
-        self.worldCellBlock = None
-        self.road = None
+        self._world_cell_block = None
+        self._road = None
         super(MobWorld, self).__init__(header, loadFactory, ins, do_unpack)
 
+    @property
+    def worldCellBlock(self):
+        return self._world_cell_block
+
+    @worldCellBlock.setter
+    def worldCellBlock(self, cell_block):
+        if cell_block is not None:
+            cell_block.parent_block = self
+        self._world_cell_block = cell_block
+        self.invalidate_counts()
+
+    @property
+    def road(self):
+        return self._road
+
+    @road.setter
+    def road(self, road_rec):
+        self._road = road_rec
+        self.invalidate_counts()
+
     def _load_rec_group(self, ins, endPos, __packer=structs_cache[u'I'].pack,
                         __unpacker=structs_cache[u'2h'].unpack):
         """Loads data from input stream. Called by load()."""
@@ -1390,9 +1966,10 @@ def _load_rec_group(self, ins, endPos, __packer=structs_cache[u'I'].pack,
         cells = {}
         def build_cell_block(unpack_block=False, skip_delta=False):
             """Helper method that parses and stores a cell block for the
-            current cell."""
+            current cell. Its children are only read here, MobCell decodes
+            them on demand."""
             if unpack_block:
-                cellBlock = MobCell(header, selfLoadFactory, cell, ins, True)
+                cellBlock = MobCell(header, selfLoadFactory, cell, ins)
             else:
                 cellBlock = MobCell(header, selfLoadFactory, cell)
                 if skip_delta:
@@ -1468,45 +2045,36 @@ def build_cell_block(unpack_block=False, skip_delta=False):
             build_cell_block()
         self.setChanged()
 
-    def getNumRecords(self,includeGroups=True):
+    def _count_records(self, includeGroups):
         """Returns number of records, including self and all children."""
         if not self.changed:
-            return super(MobCells, self).getNumRecords() ##: includeGroups?
+            return MobBase._count_records(self, includeGroups)
         count = 1 # self.world, always present
         count += bool(self.road)
         if self.worldCellBlock:
             count += self.worldCellBlock.getNumRecords(includeGroups)
-        count += super(MobWorld, self).getNumRecords(includeGroups)
+        count += super(MobWorld, self)._count_records(includeGroups)
         return count
 
     def dump(self,out):
         """Dumps group header and then records.  Returns the total size of
         the world block."""
-        hsize = RecordHeader.rec_header_size
-        worldSize = self.world.getSize() + hsize
+        world_pos = out.tell()
         self.world.dump(out)
         if not self.changed:
             out.write(self.header.pack_head())
             out.write(self.data)
-            return self.size + worldSize
         elif self.cellBlocks or self.road or self.worldCellBlock:
-            (totalSize, bsb_size, blocks) = self.getBsbSizes()
-            if self.road:
-                totalSize += self.road.getSize() + hsize
-            if self.worldCellBlock:
-                totalSize += self.worldCellBlock.getSize()
-            self.header.size = totalSize
             self.header.label = self.world.fid
             self.header.groupType = 1
-            out.write(self.header.pack_head())
+            group_pos = _start_group(out, self.header)
             if self.road:
                 self.road.dump(out)
             if self.worldCellBlock:
                 self.worldCellBlock.dump(out)
-            self.dumpBlocks(out,blocks,bsb_size,4,5)
-            return totalSize + worldSize
-        else:
-            return worldSize
+            self.dumpBlocks(out,4,5)
+            self.header.size = _finish_group(out, group_pos)
+        return out.tell() - world_pos
 
     #--Fid manipulation, record filtering ----------------------------------
     def get_all_signatures(self):
@@ -1642,11 +2210,17 @@ class MobWorlds(MobBase):
     of world blocks."""
 
     def __init__(self, header, loadFactory, ins=None, do_unpack=False):
-        self.worldBlocks = []
-        self.id_worldBlocks = {}
+        self.worldBlocks = IndexedRecords(attrgetter(u'world.fid'),
+                                          owner=self, adopt=True)
         self.orphansSkipped = 0
         super(MobWorlds, self).__init__(header, loadFactory, ins, do_unpack)
 
+    @property
+    def id_worldBlocks(self):
+        """The world blocks of this block, indexed by the fid of their
+        world."""
+        return self.worldBlocks
+
     def _load_rec_group(self, ins, endPos):
         """Loads data from input stream. Called by load()."""
         expType = self.label
@@ -1706,7 +2280,6 @@ def _load_rec_group(self, ins, endPos):
         if world:
             # We have a last WRLD without children lying around, finish it
             self.setWorld(world)
-        self.id_worldBlocks.clear()
         self.setChanged()
 
     def getSize(self):
@@ -1721,16 +2294,13 @@ def dump(self,out):
             out.write(self.data)
         else:
             if not self.worldBlocks: return
-            worldHeaderPos = out.tell()
-            header = TopGrupHeader(0, self.label, 0, self.stamp)
-            out.write(header.pack_head())
-            totalSize = RecordHeader.rec_header_size + sum(
-                x.dump(out) for x in self.worldBlocks)
-            out.seek(worldHeaderPos + 4)
-            pack_int(out, totalSize)
-            out.seek(worldHeaderPos + totalSize)
+            group_pos = _start_group(out, TopGrupHeader(0, self.label, 0,
+                                                        self.stamp))
+            for world_block in self.worldBlocks:
+                world_block.dump(out)
+            _finish_group(out, group_pos)
 
-    def getNumRecords(self,includeGroups=True):
+    def _count_records(self, includeGroups):
         """Returns number of records, including self and all children."""
         count = sum(x.getNumRecords(includeGroups) for x in self.worldBlocks)
         return count + includeGroups * bool(count)
@@ -1741,6 +2311,7 @@ def convertFids(self,mapper,toLong):
         converting to short format."""
         for worldBlock in self.worldBlocks:
             worldBlock.convertFids(mapper,toLong)
+        self.worldBlocks.reindex()
 
     def get_all_signatures(self):
         return set(chain.from_iterable(w.get_all_signatures()
@@ -1748,7 +2319,7 @@ def get_all_signatures(self):
 
     def indexRecords(self):
         """Indexes records by fid."""
-        self.id_worldBlocks = {x.world.fid: x for x in self.worldBlocks}
+        self.worldBlocks.reindex()
 
     def updateMasters(self, masterset_add):
         """Updates set of master names according to masters actually used."""
@@ -1757,10 +2328,7 @@ def updateMasters(self, masterset_add):
 
     def updateRecords(self, srcBlock, mergeIds):
         """Updates any records in 'self' that exist in 'srcBlock'."""
-        if self.worldBlocks and not self.id_worldBlocks:
-            self.indexRecords()
-        id_worldBlocks = self.id_worldBlocks
-        idGet = id_worldBlocks.get
+        idGet = self.worldBlocks.get
         for srcWorldBlock in srcBlock.worldBlocks:
             worldBlock = idGet(srcWorldBlock.world.fid)
             if worldBlock:
@@ -1768,25 +2336,20 @@ def updateRecords(self, srcBlock, mergeIds):
 
     def setWorld(self, world):
         """Adds record to record list and indexed."""
-        if self.worldBlocks and not self.id_worldBlocks:
-            self.indexRecords()
-        fid = world.fid
-        if fid in self.id_worldBlocks:
-            self.id_worldBlocks[fid].world = world
+        worldBlock = self.worldBlocks.get(world.fid)
+        if worldBlock:
+            worldBlock.world = world
         else:
             worldBlock = MobWorld(GrupHeader(0, 0, 1, self.stamp), ##: groupType = 1
                                   self.loadFactory, world)
             worldBlock.setChanged()
             self.worldBlocks.append(worldBlock)
-            self.id_worldBlocks[fid] = worldBlock
 
     def remove_world(self, world):
-        """Removes the specified world from this block. The exact world object
-        must be present, otherwise a ValueError is raised."""
-        if self.worldBlocks and not self.id_worldBlocks:
-            self.indexRecords()
-        self.worldBlocks.remove(world)
-        del self.id_worldBlocks[world.fid]
+        """Removes the world block of the specified world from this block. A
+        world with the same FormID must be present, otherwise a KeyError is
+        raised."""
+        self.worldBlocks.pop(world.fid)
 
     def iter_records(self):
         return chain.from_iterable(w.iter_records() for w in self.worldBlocks)
@@ -1794,16 +2357,13 @@ def iter_records(self):
     def keepRecords(self, p_keep_ids):
         """Keeps records with fid in set p_keep_ids. Discards the rest."""
         for worldBlock in self.worldBlocks: worldBlock.keepRecords(p_keep_ids)
-        self.worldBlocks = [x for x in self.worldBlocks if
-                            x.world.fid in p_keep_ids]
-        self.id_worldBlocks.clear()
+        self.worldBlocks.replace_entries(
+            [x for x in self.worldBlocks if x.world.fid in p_keep_ids])
         self.setChanged()
 
     def merge_records(self, block, loadSet, mergeIds, iiSkipMerge, doFilter):
         from ..mod_files import MasterSet # YUCK
-        if self.worldBlocks and not self.id_worldBlocks:
-            self.indexRecords()
-        lookup_world_block = self.id_worldBlocks.get
+        lookup_world_block = self.worldBlocks.get
         filtered_world_blocks = []
         filtered_append = filtered_world_blocks.append
         loadSetIsSuperset = loadSet.issuperset
@@ -1841,8 +2401,7 @@ def merge_records(self, block, loadSet, mergeIds, iiSkipMerge, doFilter):
             # We're either not Filter-tagged or we want to keep this world
             filtered_append(src_world_block)
         # Apply any merge filtering we've done above to the record block
-        block.worldBlocks = filtered_world_blocks
-        block.indexRecords()
+        block.worldBlocks.replace_entries(filtered_world_blocks)
 
     def __repr__(self):
         return u'<WRLD GRUP: %u record(s)>' % len(self.worldBlocks)
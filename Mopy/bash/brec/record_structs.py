@@ -26,20 +26,66 @@
 from __future__ import division, print_function
 
 import copy
+import hashlib
 import io
+import os
+import re
 import zlib
+from collections import OrderedDict
 from functools import partial
+from itertools import izip
 
-from .basic_elements import SubrecordBlob, unpackSubHeader
-from .mod_io import ModReader
+from .basic_elements import MelBase, MelLString, MelObject, MelString, \
+    MelStruct, Subrecord, SubrecordBlob, _MelFlags, _MelNum, \
+    unpackSubHeader, _get_class_slots, _immutable_types
+from .mod_io import ModReader, RecordHeader
 from .utils_constants import strFid, _int_unpacker
 from .. import bolt, exception
-from ..bolt import decoder, struct_pack
+from ..bolt import decoder, struct_pack, structs_cache, struct_error
+
+#------------------------------------------------------------------------------
+# Copying ---------------------------------------------------------------------
+def _copy_value(value):
+    """Returns a copy of the specified record attribute value that shares
+    nothing mutable with it. Handles the types of values that elements store
+    in records directly and falls back to copy.deepcopy for anything else."""
+    value_type = type(value)
+    if value_type in _immutable_types: return value
+    if value_type is list:
+        return [_copy_value(v) for v in value]
+    if value_type is tuple:
+        return tuple([_copy_value(v) for v in value])
+    if isinstance(value, MelObject):
+        new_obj = value_type.__new__(value_type)
+        obj_attrs = value_type._mel_attrs
+        if obj_attrs is None:
+            # Don't touch the (lazily created) __dict__ of MelGroup objects
+            new_dict = new_obj.__dict__
+            for obj_attr, obj_val in value.__dict__.iteritems():
+                new_dict[obj_attr] = _copy_value(obj_val)
+            obj_attrs = _get_class_slots(value_type)
+        for obj_attr in obj_attrs:
+            try:
+                setattr(new_obj, obj_attr, _copy_value(getattr(value,
+                                                               obj_attr)))
+            except AttributeError:
+                pass # slot is not set
+        return new_obj
+    if isinstance(value, bolt.Flags):
+        return value()
+    if value_type is set:
+        return {_copy_value(v) for v in value}
+    if value_type is dict:
+        return {k: _copy_value(v) for k, v in value.iteritems()}
+    return copy.deepcopy(value)
 
 #------------------------------------------------------------------------------
 # Mod Element Sets ------------------------------------------------------------
 class MelSet(object):
     """Set of mod record elments."""
+    # If True, load records via a loader function generated for each MelSet
+    # that inlines the loading code of simple elements - see _compile_loader
+    use_generated_loaders = True
 
     def __init__(self,*elements):
         self.elements = elements
@@ -55,6 +101,13 @@ def __init__(self,*elements):
                 raise SyntaxError(u"Invalid signature '%s': Signatures must "
                                   u'be bytestrings and 4 bytes in '
                                   u'length.' % sig_candidate)
+        self._generated_loader = self._compile_loader()
+        # Loaders for partially loaded records, keyed by the signatures they
+        # skip - see get_skipped_sigs
+        self._projected_loaders = {}
+        self._has_distributor = False
+        # Record copying functions, keyed by record class - see copy_record
+        self._copiers = {}
 
     def getSlotsUsed(self):
         """This function returns all of the attributes used in record instances
@@ -93,8 +146,47 @@ def getDefault(self,attr):
         MelGroup and MelGroups."""
         return self.defaulters[attr].getDefault()
 
+    def get_skipped_sigs(self, wanted_attrs):
+        """Returns the signatures of all subrecords that do not need to be
+        loaded to get the specified attributes. Attributes of nested objects
+        may be specified as well (e.g. 'model.modPath'), the whole top level
+        attribute is loaded for those. Subrecords needed by unions to decide
+        how to load wanted subrecords are loaded too. Returns an empty set if
+        everything has to be loaded.
+
+        :type wanted_attrs: collections.Iterable[unicode]
+        :rtype: frozenset[bytes]"""
+        # Distributors depend on the exact sequence of loaded subrecords
+        if self._has_distributor: return frozenset()
+        wanted_attrs = {a.split(u'.', 1)[0] for a in wanted_attrs}
+        unwanted_loaders = set(self.loaders.itervalues())
+        while True:
+            new_wanted = [l for l in unwanted_loaders
+                          if not wanted_attrs.isdisjoint(l.getSlotsUsed())]
+            if not new_wanted: break
+            for loader in new_wanted:
+                unwanted_loaders.discard(loader)
+                wanted_attrs.update(loader.load_dependencies())
+        return frozenset(s for s, l in self.loaders.iteritems()
+                         if l in unwanted_loaders)
+
+    def load_projected(self, record, ins, endPos, skipped_sigs):
+        """Loads data from input stream like loadData, but seeks past the
+        subrecords with the specified signatures instead of loading them.
+        Their attributes keep their default values."""
+        try:
+            projected_loader = self._projected_loaders[skipped_sigs]
+        except KeyError:
+            # setdefault, another thread may have compiled one meanwhile
+            projected_loader = self._projected_loaders.setdefault(
+                skipped_sigs, self._compile_loader(skipped_sigs))
+        projected_loader(record, ins, endPos)
+
     def loadData(self,record,ins,endPos):
         """Loads data from input stream. Called by load()."""
+        if MelSet.use_generated_loaders:
+            self._generated_loader(record, ins, endPos)
+            return
         rec_type = record.recType
         loaders = self.loaders
         # Load each subrecord
@@ -116,10 +208,212 @@ def loadData(self,record,ins,endPos):
             except Exception as error:
                 self._handle_load_error(error, record, ins, sub_type, sub_size)
 
+    # Maps the load_mel implementations we know how to inline to the code
+    # they boil down to. The templates are formatted with the attribute to
+    # set and the names of the element's unpacker and flags type
+    _inline_templates = {
+        MelBase.load_mel.__func__:
+            u'record.%(attr)s = ins.read(sub_size, read_id)',
+        _MelNum.load_mel.__func__:
+            u'record.%(attr)s = ins.unpack(%(unpacker)s, sub_size, '
+            u'read_id)[0]',
+        _MelFlags.load_mel.__func__:
+            u'record.%(attr)s = %(flags)s(ins.unpack(%(unpacker)s, '
+            u'sub_size, read_id)[0])',
+        MelString.load_mel.__func__:
+            u'record.%(attr)s = ins.readString(sub_size, read_id)',
+        MelLString.load_mel.__func__:
+            u'record.%(attr)s = ins.readLString(sub_size, read_id)',
+        MelStruct.load_mel.__func__:
+            u'%(attr)s = ins.unpack(%(unpacker)s, sub_size, read_id)',
+    }
+    _valid_attr = re.compile(u'^[A-Za-z_][A-Za-z0-9_]*$')
+
+    def _compile_loader(self, skipped_sigs=frozenset()):
+        """Generates and compiles a function equivalent to the generic loop
+        in loadData. For every top level element that uses one of the load_mel
+        implementations in _inline_templates, a specialized load function is
+        generated, with the element's unpacking and attribute assignments
+        inlined - the rest (groups, unions, distributors, etc.) keep using
+        their load_mel. The loop itself has unpackSubHeader inlined and
+        dispatches to those via a dict, as before. Subrecords with one of the
+        signatures in skipped_sigs are seeked past."""
+        namespace = {u'_Subrecord': Subrecord,
+                     u'_int_unpacker': _int_unpacker,
+                     u'_handle_load_error': self._handle_load_error,
+                     u'_ModError': exception.ModError,
+                     u'_SEEK_CUR': os.SEEK_CUR}
+        src = [u'def _skip(record, ins, sub_type, sub_size, read_id):',
+               u'    ins.seek(sub_size, _SEEK_CUR, read_id)']
+        load_funcs = {sig: loader.load_mel for sig, loader
+                      in self.loaders.iteritems()}
+        generated = dict.fromkeys(skipped_sigs, u'_skip')
+        for index, element in enumerate(self.elements):
+            mel_sig = getattr(element, u'mel_sig', None)
+            # Skip elements that got overriden by a later one (e.g. a
+            # distributor) and ones we don't need to load at all
+            if (self.loaders.get(mel_sig) is not element or
+                    mel_sig in skipped_sigs): continue
+            load_func = type(element).load_mel.__func__
+            template = self._inline_templates.get(load_func)
+            if template is None: continue
+            fmt_args = {u'unpacker': u'_unpacker%u' % index,
+                        u'flags': u'_flags%u' % index}
+            if load_func is MelStruct.load_mel.__func__:
+                attrs, actions = element.attrs, element.actions
+                # izip in MelStruct.load_mel would silently truncate
+                unpacked_len = len(element._unpacker(
+                    b'\x00' * element.static_size))
+                if (len(attrs) != unpacked_len or not all(
+                        self._valid_attr.match(a) for a in attrs)):
+                    continue
+                body = [template % {u'attr': u'unpacked',
+                                    u'unpacker': fmt_args[u'unpacker']}]
+                if not any(actions):
+                    body.append(u'%s, = unpacked' % u', '.join(
+                        u'record.%s' % a for a in attrs))
+                else:
+                    for i, (attr, action) in enumerate(izip(attrs, actions)):
+                        if action:
+                            action_name = u'_action%u_%u' % (index, i)
+                            namespace[action_name] = action
+                            body.append(u'record.%s = %s(unpacked[%u])' % (
+                                attr, action_name, i))
+                        else:
+                            body.append(u'record.%s = unpacked[%u]' % (
+                                attr, i))
+                namespace[fmt_args[u'unpacker']] = element._unpacker
+            else:
+                if not self._valid_attr.match(element.attr): continue
+                fmt_args[u'attr'] = element.attr
+                if load_func is _MelFlags.load_mel.__func__:
+                    namespace[fmt_args[u'flags']] = element._flag_type
+                if u'%(unpacker)s' in template:
+                    namespace[fmt_args[u'unpacker']] = element._unpacker
+                body = [template % fmt_args]
+            func_name = u'_load%u' % index
+            src.append(u'def %s(record, ins, sub_type, sub_size, read_id):'
+                       % func_name)
+            src.extend(u'    ' + l for l in body)
+            generated[mel_sig] = func_name
+        src.extend([
+            u'def _generated_loader(record, ins, end_pos):',
+            u'    rec_type = record.recType',
+            u'    ins_tell = ins.tell',
+            u'    ins_unpack = ins.unpack',
+            u'    sub_head_unpack = _Subrecord.sub_header_unpack',
+            u'    sub_head_size = _Subrecord.sub_header_size',
+            u"    sub_head_id = rec_type + b'.SUB_HEAD'",
+            u"    read_id_prefix = rec_type + b'.'",
+            # Inlined ins.atEnd(end_pos, rec_type)
+            u'    while True:',
+            u'        ins_pos = ins_tell()',
+            u'        if ins_pos == end_pos: break',
+            u'        if ins_pos > end_pos:',
+            u"            raise _ModError(ins.inName, u'Exceeded limit of: ' "
+            u'+ rec_type)',
+            u'        sub_type, sub_size = ins_unpack(sub_head_unpack, '
+            u'sub_head_size, sub_head_id)',
+            u"        if sub_type == b'XXXX':",
+            u'            sub_size = ins_unpack(_int_unpacker, 4, '
+            u"rec_type + b'.XXXX.SIZE.')[0]",
+            u'            sub_type = ins_unpack(sub_head_unpack, '
+            u"sub_head_size, rec_type + b'.XXXX.TYPE')[0]",
+            u'        read_id = read_id_prefix + sub_type',
+            u'        try:',
+            u'            _load_funcs[sub_type](record, ins, sub_type, '
+            u'sub_size, read_id)',
+            u'        except KeyError:',
+            u'            _handle_load_error(_ModError(ins.inName, '
+            u"u'Unexpected subrecord: %s' % read_id), record, ins, "
+            u'sub_type, sub_size)',
+            u'        except Exception as error:',
+            u'            _handle_load_error(error, record, ins, sub_type, '
+            u'sub_size)'])
+        exec(u'\n'.join(src), namespace)
+        load_funcs.update((sig, namespace[func_name]) for sig, func_name
+                          in generated.iteritems())
+        namespace[u'_load_funcs'] = load_funcs
+        return namespace[u'_generated_loader']
+
+    def copy_record(self, record):
+        """Returns a copy of the specified record that shares nothing
+        mutable with it, including its raw data and changed state."""
+        rec_class = type(record)
+        try:
+            copier = self._copiers[rec_class]
+        except KeyError:
+            copier = self._copiers.setdefault(
+                rec_class, self._compile_copier(rec_class))
+        return copier(record)
+
+    # load_mel implementations that only ever set immutable values (for
+    # MelStruct, only those attributes without an action) - copies of records
+    # may share those instead of copying them
+    _immutable_loads = frozenset((
+        MelBase.load_mel.__func__, _MelNum.load_mel.__func__,
+        MelString.load_mel.__func__, MelLString.load_mel.__func__,
+        MelStruct.load_mel.__func__))
+    # MreRecord attributes that are always immutable
+    _immutable_rec_attrs = frozenset((u'recType', u'fid', u'size',
+        u'flags2', u'changed', u'data', u'inName', u'longFids'))
+
+    def _compile_copier(self, rec_class):
+        """Generates and compiles a function that copies records of the
+        specified class, replacing copy.deepcopy. Instead of introspecting
+        every value, it assigns the attributes of elements that only store
+        immutable values (see _immutable_loads) directly and copies the rest
+        with _copy_value, in the order given by the class' slots."""
+        shared_attrs, copied_attrs = set(), set()
+        for element in self.elements:
+            element_slots = element.getSlotsUsed()
+            load_func = type(element).load_mel.__func__
+            if load_func is MelStruct.load_mel.__func__:
+                element_shared = {a for a, action in izip(element.attrs,
+                    element.actions) if not action}
+            elif load_func in self._immutable_loads:
+                element_shared = set(element_slots)
+            else:
+                element_shared = set()
+            shared_attrs |= element_shared
+            copied_attrs.update(s for s in element_slots
+                                if s not in element_shared)
+        shared_attrs -= copied_attrs
+        shared_attrs |= self._immutable_rec_attrs
+        namespace = {u'_rec_class': rec_class, u'_copy_value': _copy_value,
+                     u'_copy': copy.copy}
+        src = [u'def _copier(src):',
+               u'    dst = _rec_class.__new__(_rec_class)',
+               u'    dst.header = _copy(src.header)',
+               u'    dst.flags1 = src.flags1()']
+        for index, attr in enumerate(_get_class_slots(rec_class)):
+            # Lazy records get decoded before they are copied
+            if attr in (u'header', u'flags1', u'_lazy_state'): continue
+            if self._valid_attr.match(attr):
+                get_value, set_value = u'src.%s' % attr, u'dst.%s = ' % attr
+            else:
+                namespace[u'_attr%u' % index] = attr
+                get_value = u'getattr(src, _attr%u)' % index
+                set_value = u'setattr(dst, _attr%u, ' % index
+            if attr not in shared_attrs:
+                get_value = u'_copy_value(%s)' % get_value
+            line = set_value + get_value + (
+                u')' if set_value.startswith(u'setattr') else u'')
+            if attr in shared_attrs:
+                src.append(u'    ' + line)
+            else:
+                # Internal attributes (e.g. of unions) may not be set at all
+                src.extend([u'    try:', u'        ' + line,
+                            u'    except AttributeError: pass'])
+        src.append(u'    return dst')
+        exec(u'\n'.join(src), namespace)
+        return namespace[u'_copier']
+
     def _handle_load_error(self, error, record, ins, sub_type, sub_size):
         eid = getattr(record, u'eid', u'<<NO EID>>')
-        bolt.deprint(u'Error loading %r record and/or subrecord: %08X' %
-                     (record.recType, record.fid))
+        # Lazy records get decoded after their fids were made long
+        bolt.deprint(u'Error loading %r record and/or subrecord: %s' %
+                     (record.recType, strFid(record.fid)))
         bolt.deprint(u'  eid = %r' % eid)
         bolt.deprint(u'  subrecord = %r' % sub_type)
         bolt.deprint(u'  subrecord size = %d' % sub_size)
@@ -185,14 +479,107 @@ def with_distributor(self, distributor_config):
         self.elements += (distributor,)
         distributor.getLoaders(self.loaders)
         distributor.set_mel_set(self)
+        self._has_distributor = True
+        # The distributor took over some signatures, regenerate our loader
+        self._generated_loader = self._compile_loader()
         return self
 
 #------------------------------------------------------------------------------
 # Records ---------------------------------------------------------------------
 #------------------------------------------------------------------------------
+class CompressionCache(object):
+    """On-disk cache mapping the uncompressed data of records to their
+    compressed form, so that saving the same records again (e.g. when
+    rebuilding a bashed patch) does not have to compress them all over again.
+    Entries are keyed by the SHA-1 digest of the uncompressed data. The cache
+    is read on first use and kept in least recently used order, so that once
+    it holds more than max_size bytes of compressed data the entries that
+    went unused the longest are dropped - in memory as well as on disk. It
+    is only written back when save is called, which callers should do once
+    per operation (e.g. after building a bashed patch), not once per saved
+    plugin."""
+    _magic = b'WBCC'
+    _version = 2
+    # magic, version, number of entries
+    _file_header = structs_cache[u'=4sII']
+    # SHA-1 of the uncompressed data, compressed size
+    _entry_header = structs_cache[u'=20sI']
+    # The level MreRecord has always used - the cache must produce the same
+    # bytes as compressing directly would
+    compress_level = 6
+    # Compressing small records is cheap, not worth a cache entry
+    min_data_size = 256
+    # The most bytes of compressed data the cache holds, in memory and on
+    # disk
+    max_size = 64 * 1024 * 1024
+
+    def __init__(self, cache_path):
+        """:type cache_path: bolt.Path"""
+        self.cache_path = cache_path
+        self._entries = None # read on demand, see _load
+        self._total_size = 0
+        self._changed = False
+
+    def _load(self):
+        self._entries = OrderedDict()
+        self._total_size = 0
+        try:
+            with self.cache_path.open(u'rb') as ins:
+                magic, version, num_entries = self._file_header.unpack(
+                    ins.read(self._file_header.size))
+                if (magic, version) != (self._magic, self._version): return
+                entry_size = self._entry_header.size
+                entry_unpack = self._entry_header.unpack
+                for _x in xrange(num_entries):
+                    data_key, comp_len = entry_unpack(ins.read(entry_size))
+                    if self._total_size + comp_len > self.max_size: break
+                    comp = ins.read(comp_len)
+                    if len(comp) != comp_len: break # truncated
+                    self._entries[data_key] = comp
+                    self._total_size += comp_len
+        except (OSError, IOError, struct_error):
+            pass # missing or corrupt, the entries read so far are fine
+
+    def compress(self, data, __compress=zlib.compress, __sha1=hashlib.sha1):
+        """Returns data compressed at compress_level, reusing the result of
+        an earlier compression of the same data if possible."""
+        if len(data) < self.min_data_size:
+            return __compress(data, self.compress_level)
+        if self._entries is None: self._load()
+        entries = self._entries
+        data_key = __sha1(data).digest()
+        try:
+            # Pop and reinsert to mark the entry as most recently used
+            comp = entries[data_key] = entries.pop(data_key)
+        except KeyError:
+            comp = entries[data_key] = __compress(data, self.compress_level)
+            self._total_size += len(comp)
+            while self._total_size > self.max_size:
+                self._total_size -= len(entries.popitem(last=False)[1])
+            self._changed = True
+        return comp
+
+    def save(self):
+        """Writes the cache back to disk if entries were added to it since it
+        was last read or saved. Entries are written least recently used
+        first, so that reading them back preserves their order."""
+        if not self._changed: return
+        self.cache_path.head.makedirs()
+        with self.cache_path.temp.open(u'wb') as out:
+            out.write(self._file_header.pack(self._magic, self._version,
+                                             len(self._entries)))
+            entry_pack = self._entry_header.pack
+            for data_key, comp in self._entries.iteritems():
+                out.write(entry_pack(data_key, len(comp)))
+                out.write(comp)
+        self.cache_path.untemp()
+        self._changed = False
+
 class MreRecord(object):
     """Generic Record. flags1 are game specific see comments."""
     subtype_attr = {b'EDID': u'eid', b'FULL': u'full', b'MODL': u'model'}
+    # A CompressionCache to compress records with, set by bosh.initBosh
+    compression_cache = None # type: CompressionCache
     flags1_ = bolt.Flags(0, bolt.Flags.getNames(
         # {Sky}, {FNV} 0x00000000 ACTI: Collision Geometry (default)
         ( 0,'esm'), # {0x00000001}
@@ -326,7 +713,13 @@ def getTypeCopy(self):
             myCopy.data = self.data
             myCopy.load(do_unpack=True)
         else:
-            myCopy = copy.deepcopy(self)
+            # data may be a view into a mapped file (see MmapModReader), which
+            # can't be deepcopied - and is discarded below anyways
+            self_data, self.data = self.data, None
+            try:
+                myCopy = copy.deepcopy(self)
+            finally:
+                self.data = self_data
         myCopy.changed = True
         myCopy.data = None
         return myCopy
@@ -338,11 +731,14 @@ def mergeFilter(self,modSet):
         removed from the list."""
         pass
 
-    def getDecompressed(self, __unpacker=_int_unpacker):
-        """Return self.data, first decompressing it if necessary."""
+    def getDecompressed(self, __unpacker=_int_unpacker, decomp=None):
+        """Return self.data, first decompressing it if necessary. If the data
+        has already been decompressed, pass the result as decomp to have it
+        checked."""
         if not self.flags1.compressed: return self.data
         decompressed_size, = __unpacker(self.data[:4])
-        decomp = zlib.decompress(self.data[4:])
+        if decomp is None:
+            decomp = zlib.decompress(buffer(self.data, 4))
         if len(decomp) != decompressed_size:
             raise exception.ModError(self.inName,
                 u'Mis-sized compressed data. Expected %d, got %d.'
@@ -363,10 +759,13 @@ def load(self, ins=None, do_unpack=False):
             self.loadData(ins,inPos+self.size)
         #--Buffered analysis (subclasses only)
         else:
+            decomp = None
             if ins:
+                # ModFile.load may have decompressed it in the background
+                decomp = ins.take_decompressed()
                 self.data = ins.read(self.size,type)
             if not self.__class__ == MreRecord:
-                with self.getReader() as reader:
+                with self.getReader(decomp) as reader:
                     # Check This
                     if ins and ins.hasStrings: reader.setStringTable(ins.strings)
                     self.loadData(reader,reader.size)
@@ -423,12 +822,20 @@ def getSize(self):
         self.data = out.getvalue()
         if self.flags1.compressed:
             dataLen = len(self.data)
-            comp = zlib.compress(self.data,6)
+            comp = self._compress(self.data)
             self.data = struct_pack('=I', dataLen) + comp
         self.size = len(self.data)
         self.setChanged(False)
         return self.size
 
+    @staticmethod
+    def _compress(data):
+        """Compresses the data of a compressed record, going through the
+        compression cache if one was set."""
+        comp_cache = MreRecord.compression_cache
+        if comp_cache is None: return zlib.compress(data, 6)
+        return comp_cache.compress(data)
+
     def dumpData(self,out):
         """Dumps state into data. Called by getSize(). This default version
         just calls subrecords to dump to out."""
@@ -439,8 +846,10 @@ def dumpData(self,out):
             subrecord.packSub(out, subrecord.mel_data)
 
     def dump(self,out):
-        """Dumps all data to output stream."""
-        if self.changed: raise exception.StateError(u'Data changed: ' + self.recType)
+        """Dumps all data to output stream. Changed records get packed first,
+        which leaves them unchanged, with their packed data and size - just
+        like after a getSize call."""
+        if self.changed: self.getSize()
         if not self.data and not self.flags1.deleted and self.size > 0:
             raise exception.StateError(u'Data undefined: ' + self.recType + u' ' + hex(self.fid))
         #--Update the header so it 'packs' correctly
@@ -451,9 +860,11 @@ def dump(self,out):
         out.write(self.header.pack_head())
         if self.size > 0: out.write(self.data)
 
-    def getReader(self):
-        """Returns a ModReader wrapped around (decompressed) self.data."""
-        return ModReader(self.inName, io.BytesIO(self.getDecompressed()))
+    def getReader(self, decomp=None):
+        """Returns a ModReader wrapped around (decompressed) self.data. See
+        getDecompressed for decomp."""
+        return ModReader(self.inName, io.BytesIO(
+            self.getDecompressed(decomp=decomp)))
 
     #--Accessing subrecords ---------------------------------------------------
     def getSubString(self, mel_sig_):
@@ -471,6 +882,13 @@ def getSubString(self, mel_sig_):
             break
         return decoder(value)
 
+# TODO(inf) Use this for a bunch of stuff in mods_metadata.py (e.g. UDRs)
+def _compressed_flag_mask():
+    """Returns the bit of the record flags that marks compressed records."""
+    rec_flags = MreRecord.flags1_(0)
+    rec_flags.compressed = True
+    return int(rec_flags)
+
 #------------------------------------------------------------------------------
 class MelRecord(MreRecord):
     """Mod record built from mod record elements."""
@@ -480,11 +898,40 @@ class MelRecord(MreRecord):
     # If set to False, skip the check for duplicate attributes for this
     # subrecord. See MelSet.check_duplicate_attrs for more information.
     _has_duplicate_attrs = False
-    __slots__ = []
+    # Only used by lazily loaded records, see get_lazy_class
+    __slots__ = [u'_lazy_state']
 
     def __init__(self, header, ins=None, do_unpack=False):
         self.__class__.melSet.initRecord(self, header, ins, do_unpack)
 
+    @classmethod
+    def get_lazy_class(cls):
+        """Returns a variant of this record class whose instances, when
+        loaded with do_unpack=True, only keep their raw data and decode it the
+        first time one of their element attributes is read or written. After
+        that, the instance is turned into an instance of this class."""
+        try:
+            return _lazy_classes[cls]
+        except KeyError:
+            # No new slots, so that instances can switch back to cls
+            lazy_class = type(cls.__name__, (_LazyMelRecord, cls), {
+                u'__slots__': (), u'__module__': cls.__module__,
+                u'_rec_class': cls,
+                u'_lazy_slots': frozenset(cls.melSet.getSlotsUsed())})
+            lazy_class.__slots__ = cls.__slots__ # for introspecting code
+            return _lazy_classes.setdefault(cls, lazy_class)
+
+    @classmethod
+    def get_projected_class(cls, wanted_attrs):
+        """Returns a variant of this record class whose instances only load
+        the subrecords needed for the specified attributes, the others keep
+        their default values. Such records are only fit for reading those
+        attributes - they can't be dumped or copied. Returns this class if
+        every subrecord would have to be loaded anyways."""
+        skipped_sigs = cls.melSet.get_skipped_sigs(wanted_attrs)
+        if not skipped_sigs: return cls
+        return _get_projected_class(cls, skipped_sigs)
+
     @classmethod
     def validate_record_syntax(cls):
         """Performs validations on this record's definition."""
@@ -501,6 +948,16 @@ def loadData(self,ins,endPos):
         """Loads data from input stream. Called by load()."""
         self.__class__.melSet.loadData(self, ins, endPos)
 
+    def __deepcopy__(self, memo):
+        return self.__class__.melSet.copy_record(self)
+
+    def getTypeCopy(self):
+        """Returns a type class copy of self - see MelSet.copy_record."""
+        myCopy = self.__class__.melSet.copy_record(self)
+        myCopy.changed = True
+        myCopy.data = None
+        return myCopy
+
     def dumpData(self,out):
         """Dumps state into out. Called by getSize()."""
         self.__class__.melSet.dumpData(self,out)
@@ -517,3 +974,159 @@ def convertFids(self,mapper,toLong):
     def updateMasters(self, masterset_add):
         """Updates set of master names according to masters actually used."""
         self.__class__.melSet.updateMasters(self, masterset_add)
+
+_lazy_classes = {}
+_projected_classes = {}
+
+def _get_projected_class(rec_class, skipped_sigs):
+    """Returns the variant of rec_class whose instances skip loading the
+    specified subrecords - see MelRecord.get_projected_class."""
+    try:
+        return _projected_classes[rec_class, skipped_sigs]
+    except KeyError:
+        projected_class = type(rec_class.__name__,
+            (_ProjectedMelRecord, rec_class), {
+                u'__slots__': (), u'__module__': rec_class.__module__,
+                u'_full_class': rec_class, u'_skipped_sigs': skipped_sigs})
+        projected_class.__slots__ = rec_class.__slots__
+        return _projected_classes.setdefault((rec_class, skipped_sigs),
+                                             projected_class)
+
+def _new_projected(rec_class, skipped_sigs):
+    """Creates an empty instance of a projected class when unpickling - see
+    _ProjectedMelRecord.__reduce_ex__."""
+    projected_class = _get_projected_class(rec_class, skipped_sigs)
+    return projected_class.__new__(projected_class)
+
+def _compose_mappers(first_mapper, second_mapper):
+    """Returns a fid mapper that applies first_mapper, then second_mapper."""
+    return lambda fid: second_mapper(first_mapper(fid))
+
+class _LazyMelRecord(object):
+    """Mixin for the classes returned by MelRecord.get_lazy_class. Only
+    operations that need the decoded record data trigger decoding, FormID
+    conversion is deferred until then."""
+    __slots__ = ()
+    _rec_class = None # type: type[MelRecord]
+    _lazy_slots = frozenset()
+
+    def __init__(self, header, ins=None, do_unpack=False):
+        # Only plain unpacking from a stream is deferred
+        if ins is None or do_unpack is not True:
+            self.__class__ = self._rec_class
+            self._rec_class.__init__(self, header, ins, do_unpack)
+            return
+        MreRecord.__init__(self, header, ins, False)
+        # The string table and the fid mappers to apply once we are decoded
+        self._lazy_state = (ins.strings if ins.hasStrings else None, [])
+
+    def __getattr__(self, attr):
+        # Only called if attr is not set, which is the case for all element
+        # attributes until we are decoded
+        if attr in self._lazy_slots and self._decode():
+            return getattr(self, attr)
+        raise AttributeError(u"'%s' object has no attribute '%s'" % (
+            self.__class__.__name__, attr))
+
+    def __setattr__(self, attr, value):
+        if attr in self._lazy_slots: self._decode()
+        object.__setattr__(self, attr, value)
+
+    def _decode(self):
+        """Decode our raw data, apply any deferred fid conversions and turn
+        into an instance of the regular record class. Returns False if we had
+        already been decoded."""
+        lazy_state = getattr(self, u'_lazy_state', None)
+        self.__class__ = rec_class = self._rec_class
+        if lazy_state is None: return False
+        self._lazy_state = None
+        string_table, pending_mappers = lazy_state
+        mel_set = rec_class.melSet
+        for element in mel_set.elements:
+            element.setDefault(self)
+        with self.getReader() as reader:
+            reader.setStringTable(string_table)
+            self.loadData(reader, reader.size)
+        if pending_mappers:
+            # Map straight to the final format, in a single pass
+            mapper = reduce(_compose_mappers, pending_mappers)
+            for element in mel_set.formElements:
+                element.mapFids(self, mapper, True)
+        return True
+
+    def convertFids(self, mapper, toLong):
+        if getattr(self, u'_lazy_state', None) is None:
+            self._decode()
+            return self.convertFids(mapper, toLong)
+        if self.longFids == toLong: return
+        self.fid = mapper(self.fid)
+        self._lazy_state[1].append(mapper)
+        self.longFids = toLong
+        self.setChanged()
+
+    def _lazy_copy(self):
+        """Returns a copy of this record that is still undecoded, with its
+        own copy of the raw data and pending fid mappers. Records that are
+        only copied through to e.g. the Bashed Patch never get decoded this
+        way until they are written out, when their fids get mapped from the
+        source plugin's short fids to the target's in one go."""
+        lazy_state = getattr(self, u'_lazy_state', None)
+        if lazy_state is None: return None
+        string_table, pending_mappers = lazy_state
+        # Fill in a regular instance, bypassing our __setattr__, then turn it
+        # into a lazy one
+        my_copy = self._rec_class.__new__(self._rec_class)
+        my_copy.header = copy.copy(self.header)
+        my_copy.recType = self.recType
+        my_copy.fid = self.fid
+        my_copy.flags1 = self.flags1()
+        my_copy.size = self.size
+        my_copy.flags2 = self.flags2
+        my_copy.changed = self.changed
+        # Don't keep views into the source's mapped file alive (see
+        # MreRecord.getTypeCopy)
+        my_copy.data = bytes(self.data)
+        my_copy.inName = self.inName
+        my_copy.longFids = self.longFids
+        my_copy._lazy_state = (string_table, pending_mappers[:])
+        my_copy.__class__ = self.__class__
+        return my_copy
+
+    def getTypeCopy(self):
+        my_copy = self._lazy_copy()
+        if my_copy is None:
+            self._decode()
+            return self.getTypeCopy()
+        my_copy.changed = True
+        return my_copy
+
+    def __deepcopy__(self, memo):
+        my_copy = self._lazy_copy()
+        if my_copy is None:
+            self._decode()
+            return self.__deepcopy__(memo)
+        return my_copy
+
+class _ProjectedMelRecord(object):
+    """Mixin for the classes returned by MelRecord.get_projected_class."""
+    __slots__ = ()
+    _full_class = None # type: type[MelRecord]
+    _skipped_sigs = frozenset()
+
+    def __reduce_ex__(self, protocol):
+        # Our class is generated at runtime, so pickle can't find it by name
+        reduced = super(_ProjectedMelRecord, self).__reduce_ex__(protocol)
+        return (_new_projected, (self._full_class,
+                                 self._skipped_sigs)) + reduced[2:]
+
+    def loadData(self, ins, endPos):
+        self.__class__.melSet.load_projected(self, ins, endPos,
+                                             self._skipped_sigs)
+
+    def dumpData(self, out):
+        raise exception.StateError(u'%r was only partially loaded and can '
+                                   u'not be dumped' % self)
+
+    def getTypeCopy(self):
+        raise exception.StateError(u'%r was only partially loaded and can '
+                                   u'not be copied' % self)
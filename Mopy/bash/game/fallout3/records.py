@@ -44,7 +44,7 @@
     MelDecalData, MelDescription, MelLists, MelPickupSound, MelDropSound, \
     MelActivateParents, BipedFlags, MelSpells, MelUInt8Flags, MelUInt16Flags, \
     MelUInt32Flags, MelOptUInt32Flags, MelOptUInt8Flags, MelOwnership, \
-    MelDebrData
+    MelDebrData, MelPackedArray
 from ...exception import ModSizeError
 # Set MelModel in brec but only if unset
 if brec.MelModel is None:
@@ -1881,13 +1881,12 @@ class MreNavm(MelRecord):
         MelEdid(),
         MelUInt32(b'NVER', u'version', 11),
         MelStruct('DATA','I5I',(FID,'cell'),'vertexCount','triangleCount','enternalConnectionsCount','nvcaCount','doorsCount'),
-        MelArray('vertices',
-            MelStruct('NVVX', '3f', 'vertexX', 'vertexY', 'vertexZ'),
-        ),
-        MelArray('triangles',
-            MelStruct('NVTR', '6hI', 'vertex0', 'vertex1', 'vertex2',
-                      'triangle0', 'triangle1', 'triangle2', 'flags'),
-        ),
+        MelPackedArray(b'NVVX', u'vertices', u'3f',
+                       (u'vertexX', u'vertexY', u'vertexZ'), drop_empty=True),
+        MelPackedArray(b'NVTR', u'triangles', u'6hI',
+                       (u'vertex0', u'vertex1', u'vertex2', u'triangle0',
+                        u'triangle1', u'triangle2', u'flags'),
+                       drop_empty=True),
         MelOptSInt16('NVCA', 'nvca_p'),
         MelArray('doors',
             MelStruct('NVDP', 'IH2s', (FID, 'doorReference'), 'door_triangle',
@@ -21,8 +21,6 @@
 #
 # =============================================================================
 from .special import _ExSpecial ##: ugh
-from ....brec import MreRecord
-from ....mod_files import ModFile, LoadFactory
 from ....patcher.patchers.base import ImportPatcher
 
 __all__ = [u'ImportRoadsPatcher']
@@ -36,21 +34,26 @@ class ImportRoadsPatcher(ImportPatcher, _ExSpecial):
 
     logMsg = u'\n=== ' + _(u'Worlds Patched')
     _read_write_records = (b'CELL', b'WRLD', b'ROAD')
+    _init_data_attrs = (u'world_road', u'isActive')
 
     def __init__(self, p_name, p_file, p_sources):
         super(ImportRoadsPatcher, self).__init__(p_name, p_file, p_sources)
         self.world_road = {}
 
+    def get_loaded_sigs(self):
+        return dict.fromkeys(self._read_write_records) if self.isActive \
+            else {}
+
+    def get_loaded_mods(self):
+        return self.srcs
+
     def initData(self,progress):
         """Get cells from source files."""
         if not self.isActive: return
-        loadFactory = LoadFactory(False, *[MreRecord.type_class[x] for x in
-                                           self._read_write_records])
         for srcMod in self.srcs:
             if srcMod not in self.patchFile.p_file_minfos: continue
-            srcInfo = self.patchFile.p_file_minfos[srcMod]
-            srcFile = ModFile(srcInfo,loadFactory)
-            srcFile.load(True)
+            srcFile = self.patchFile.get_loaded_mod(srcMod,
+                                                    self._read_write_records)
             for worldBlock in srcFile.tops[b'WRLD'].worldBlocks:
                 if worldBlock.road:
                     worldId = worldBlock.world.fid
@@ -40,7 +40,8 @@
     MelArray, MelWthrColors, MelObject, MreActorBase, MreWithItems, \
     MelReadOnly, MelCtda, MelRef3D, MelXlod, MelWorldBounds, MelEnableParent, \
     MelRefScale, MelMapMarker, MelActionFlags, MelPartialCounter, MelScript, \
-    MelDescription, BipedFlags, MelSpells, MelUInt8Flags, MelUInt32Flags
+    MelDescription, BipedFlags, MelSpells, MelUInt8Flags, MelUInt32Flags, \
+    MelPackedArray
 # Set brec MelModel to the one for Oblivion
 if brec.MelModel is None:
 
@@ -1487,14 +1488,19 @@ class MrePgrd(MelRecord):
     """Path Grid."""
     rec_sig = b'PGRD'
 
-    # Most of these MelBases could be loaded via MelArray, but they're really
-    # big, don't contain FormIDs and are too complex to manipulate
+    # These arrays are really big and don't contain FormIDs, so they are
+    # loaded via MelPackedArray instead of MelArray
     melSet = MelSet(
         MelUInt16(b'DATA', u'point_count'),
-        MelBase(b'PGRP', u'point_array'),
+        MelPackedArray(b'PGRP', u'point_array', u'3fB3s',
+                       (u'point_x', u'point_y', u'point_z',
+                        u'connection_count', u'unused1')),
         MelBase(b'PGAG', u'unknown1'),
-        MelBase(b'PGRR', u'point_to_point_connections'),
-        MelBase(b'PGRI', u'inter_cell_connections'),
+        MelPackedArray(b'PGRR', u'point_to_point_connections', u'h',
+                       (u'connected_point',)),
+        MelPackedArray(b'PGRI', u'inter_cell_connections', u'H2s3f',
+                       (u'point', u'unused1', u'point_x', u'point_y',
+                        u'point_z')),
         MelGroups(u'point_to_reference_mappings',
             MelArray(u'mapping_points', MelUInt32(b'PGRL', u'm_point'),
                 prelude=MelFid(b'PGRL', u'mapping_reference'))
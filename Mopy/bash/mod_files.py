@@ -25,13 +25,23 @@
 
 from __future__ import print_function
 
+import cPickle as pickle  # PY3
+import hashlib
+import io
 import re
+from array import array
+from binascii import crc32
 from collections import defaultdict
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from operator import attrgetter
 
-from . import bolt, bush, env, load_order
+from . import bass, bolt, bush, env, load_order
 from .bolt import deprint, GPath, SubProgress, structs_cache, struct_error
-from .brec import MreRecord, ModReader, RecordHeader, RecHeader, \
-    TopGrupHeader, MobBase, MobDials, MobICells, MobObjects, MobWorlds
+from .brec import MelGroup, MelRecord, MreRecord, MmapModReader, \
+    RecordHeader, RecHeader, GrupHeader, TopGrupHeader, MobBase, MobDials, \
+    MobICells, MobObjects, MobWorlds, _compressed_flag_mask, \
+    _get_class_slots
 from .exception import MasterMapError, ModError, StateError
 
 class MasterSet(set):
@@ -75,8 +85,18 @@ def __call__(self,fid,default=-1):
 
 class LoadFactory(object):
     """Factory for mod representation objects."""
-    def __init__(self,keepAll,*recClasses):
+    def __init__(self, keepAll, *recClasses, **kwargs):
+        """Pass lazy=True to get records that only decode their data when it
+        is first accessed - see MelRecord.get_lazy_class. Pass a dict mapping
+        record signatures to the attributes that will be read as projections
+        to only load the subrecords needed for those attributes - see
+        MelRecord.get_projected_class. Such records can't be saved, so this
+        can't be combined with keepAll."""
         self.keepAll = keepAll
+        self.lazy = kwargs.pop(u'lazy', False)
+        self.projections = kwargs.pop(u'projections', None) or {}
+        if keepAll and self.projections:
+            raise RuntimeError(u'Partially loaded records can not be kept!')
         self.recTypes = set()
         self.topTypes = set()
         self.type_class = {}
@@ -117,7 +137,14 @@ def addClass(self, recClass, __cell_rec_sigs=frozenset([b'WRLD', b'ROAD',
     def getRecClass(self,type):
         """Returns class for record type or None."""
         default = (self.keepAll and MreRecord) or None
-        return self.type_class.get(type,default)
+        rec_class = self.type_class.get(type,default)
+        if rec_class and issubclass(rec_class, MelRecord):
+            if type in self.projections:
+                rec_class = rec_class.get_projected_class(
+                    self.projections[type])
+            if self.lazy:
+                rec_class = rec_class.get_lazy_class()
+        return rec_class
 
     def getCellTypeClass(self):
         """Returns type_class dictionary for cell objects."""
@@ -148,10 +175,11 @@ def getTopClass(self, top_rec_type):
             return MobBase if self.keepAll else None
 
     def __repr__(self):
-        return u'<LoadFactory: load %u types (%s), %s others>' % (
+        return u'<LoadFactory: load %u types (%s), %s others%s>' % (
             len(self.recTypes),
             u', '.join(self.recTypes),
             u'keep' if self.keepAll else u'discard',
+            u', lazy' if self.lazy else u'',
         )
 
 class _RecGroupDict(dict):
@@ -178,6 +206,133 @@ def __missing__(self, top_grup_sig, __rh=RecordHeader):
         return self[top_grup_sig]
 
 
+# Thread pool shared by all ModFile.load calls - see _get_decompression_pool
+_decompression_pool = None
+
+def _get_decompression_pool():
+    """Returns the thread pool used to decompress records in the background
+    while loading plugins, creating it if needed. Returns None if background
+    decompression is disabled, i.e. if iDecompressionThreads is 1.
+
+    :rtype: ThreadPool | None"""
+    global _decompression_pool
+    num_threads = bass.inisettings[u'DecompressionThreads'] or cpu_count()
+    if num_threads <= 1: return None
+    if _decompression_pool is None:
+        _decompression_pool = ThreadPool(num_threads)
+    return _decompression_pool
+
+def _get_transport_keys(load_factory):
+    """Returns a dict mapping the classes whose instances pickle_record_data
+    stores as tuples of their slot values to keys that identify them across
+    runs.
+    Record and header classes are their own keys, but the MelObject
+    subclasses generated by MelGroups (see MelGroup.get_object_class) can't
+    be found by name, so they are keyed by the signature of their record and
+    the attribute path of their group."""
+    transport_keys = {c: c for c in (RecHeader, GrupHeader, TopGrupHeader)}
+    for rec_sig, rec_class in load_factory.type_class.iteritems():
+        transport_keys[rec_class] = rec_class
+        if not issubclass(rec_class, MelRecord): continue
+        for attr_path, element in rec_class.melSet.defaulters.iteritems():
+            if isinstance(element, MelGroup):
+                transport_keys.setdefault(element.get_object_class(),
+                                          (rec_sig, attr_path))
+    # Name mangled slots can't be accessed by their names
+    return {c: k for c, k in transport_keys.iteritems() if not any(
+        s.startswith(u'__') for s in _get_class_slots(c))}
+
+def _get_slot_values(obj_class):
+    """Returns a function returning a tuple of the values of all slots of an
+    instance of obj_class, raising an AttributeError if one is unset."""
+    obj_slots = _get_class_slots(obj_class)
+    if not obj_slots: return lambda obj: ()
+    if len(obj_slots) == 1:
+        get_slot = attrgetter(*obj_slots)
+        return lambda obj: (get_slot(obj),)
+    return attrgetter(*obj_slots)
+
+def _get_restorer(obj_class):
+    """Returns a function creating an instance of obj_class with the slot
+    values returned by _get_slot_values, without calling its __init__."""
+    obj_slots = _get_class_slots(obj_class)
+    if not obj_slots: return lambda slot_values: obj_class.__new__(obj_class)
+    restorer_source = u'\n'.join([
+        u'def restore(slot_values):',
+        u'    obj = new_obj(obj_class)',
+        u'    %s, = slot_values' % u', '.join(u'obj.%s' % s
+                                             for s in obj_slots),
+        u'    return obj',
+    ])
+    restorer_namespace = {u'new_obj': obj_class.__new__,
+                          u'obj_class': obj_class}
+    exec(restorer_source, restorer_namespace)
+    return restorer_namespace[u'restore']
+
+def pickle_record_data(rec_data, rec_classes):
+    """Pickles data read from records of the specified classes (e.g. the
+    values of some of their attributes) to store it on disk. The MelObject
+    subclasses generated by MelGroups can't be found by name, and pickling
+    records and MelObjects through __reduce_ex__ is slow, so instances of
+    the classes _get_transport_keys returns are stored as the key of their
+    class and a tuple of their slot values instead."""
+    transport_keys = _get_transport_keys(LoadFactory(False, *rec_classes))
+    slot_getters = {}
+    def inst_persistent_id(obj):
+        obj_class = type(obj)
+        try:
+            transport_key, get_values, has_dict = slot_getters[obj_class]
+        except KeyError:
+            transport_key = transport_keys.get(obj_class)
+            if transport_key is None: return None
+            transport_key, get_values, has_dict = slot_getters[obj_class] = (
+                transport_key, _get_slot_values(obj_class),
+                bool(obj_class.__dictoffset__))
+        obj_dict = (has_dict and obj.__dict__) or None
+        try:
+            return transport_key, get_values(obj), obj_dict
+        except AttributeError:
+            # Some slots are unset, store the set ones by name
+            return transport_key, None, obj_dict, {
+                s: getattr(obj, s) for s in _get_class_slots(obj_class)
+                if hasattr(obj, s)}
+    out = io.BytesIO()
+    pickler = pickle.Pickler(out, pickle.HIGHEST_PROTOCOL)
+    pickler.inst_persistent_id = inst_persistent_id
+    pickler.dump(rec_data)
+    return out.getvalue()
+
+def unpickle_record_data(pickled_data, rec_classes):
+    """Unpickles data pickled by pickle_record_data with the same record
+    classes."""
+    load_factory = LoadFactory(False, *rec_classes)
+    restorers = {}
+    def persistent_load(pid):
+        transport_key, slot_values, obj_dict = pid[:3]
+        try:
+            obj_class, restore = restorers[transport_key]
+        except KeyError:
+            if isinstance(transport_key, tuple):
+                rec_sig, attr_path = transport_key
+                obj_class = load_factory.type_class[rec_sig].melSet.defaulters[
+                    attr_path].get_object_class()
+            else:
+                obj_class = transport_key
+            obj_class, restore = restorers[transport_key] = (
+                obj_class, _get_restorer(obj_class))
+        if slot_values is not None:
+            obj = restore(slot_values)
+        else:
+            obj = obj_class.__new__(obj_class)
+            for slot_attr, slot_val in pid[3].iteritems():
+                setattr(obj, slot_attr, slot_val)
+        if obj_dict:
+            obj.__dict__.update(obj_dict)
+        return obj
+    unpickler = pickle.Unpickler(io.BytesIO(pickled_data))
+    unpickler.persistent_load = persistent_load
+    return unpickler.load()
+
 class ModFile(object):
     """Plugin file representation. Will load only the top record types
     specified in its LoadFactory."""
@@ -198,14 +353,15 @@ def load(self, do_unpack=False, progress=None, loadStrings=True,
         from . import bosh
         progress = progress or bolt.Progress()
         progress.setFull(1.0)
-        with ModReader(self.fileInfo.name,self.fileInfo.getPath().open(
+        with MmapModReader(self.fileInfo.name, self.fileInfo.getPath().open(
                 u'rb')) as ins:
             insRecHeader = ins.unpackRecHeader
             # Main header of the mod file - generally has 'TES4' signature
             header = insRecHeader()
             self.tes4 = bush.game.plugin_header_class(header,ins,True)
-            # Check if we need to handle strings
-            self.strings.clear()
+            # Check if we need to handle strings - use a new table, lazy
+            # records from an earlier load may still use the old one
+            self.strings = bolt.StringTable()
             if do_unpack and loadStrings and self.tes4.flags1.hasStrings:
                 stringsProgress = SubProgress(progress,0,0.1) # Use 10% of progress bar for strings
                 lang = bosh.oblivionIni.get_ini_language()
@@ -219,6 +375,9 @@ def load(self, do_unpack=False, progress=None, loadStrings=True,
             else:
                 ins.setStringTable(None)
                 subProgress = progress
+            # Lazy records decompress their data when they get decoded
+            decomp_pool = (not self.loadFactory.lazy and
+                           _get_decompression_pool())
             #--Raw data read
             subProgress.setFull(ins.size)
             insAtEnd = ins.atEnd
@@ -234,24 +393,12 @@ def load(self, do_unpack=False, progress=None, loadStrings=True,
                     if topClass:
                         new_top = topClass(header, self.loadFactory)
                         load_fully = do_unpack and (topClass != MobBase)
+                        if load_fully and decomp_pool:
+                            self._prefetch_decompressed(ins, header,
+                                                        decomp_pool)
                         new_top.load_rec_group(ins, load_fully)
-                        # Starting with FO4, some of Bethesda's official files
-                        # have duplicate top-level groups
-                        if label not in self.tops:
-                            self.tops[label] = new_top
-                        elif not load_fully:
-                            # Duplicate top-level group and we can't merge due
-                            # to not loading it fully. Log and replace the
-                            # existing one
-                            deprint(u'%s: Duplicate top-level %s group '
-                                    u'loaded as MobBase, replacing')
-                            self.tops[label] = new_top
-                        else:
-                            # Duplicate top-level group and we can merge
-                            deprint(u'%s: Duplicate top-level %s group, '
-                                    u'merging' % (self.fileInfo, label))
-                            self.tops[label].merge_records(new_top, set(),
-                                set(), False, False)
+                        ins.drop_prefetched()
+                        self._add_top(label, new_top, load_fully)
                     else:
                         self.topsSkipped.add(label)
                         header.skip_group(ins)
@@ -267,6 +414,65 @@ def load(self, do_unpack=False, progress=None, loadStrings=True,
         # Done reading - convert to long FormIDs at the IO boundary
         self._convert_fids(to_long=True)
 
+    def _add_top(self, label, new_top, load_fully):
+        """Adds a freshly loaded top block to self.tops."""
+        # Starting with FO4, some of Bethesda's official files have duplicate
+        # top-level groups
+        if label not in self.tops:
+            self.tops[label] = new_top
+        elif not load_fully:
+            # Duplicate top-level group and we can't merge due to not loading
+            # it fully. Log and replace the existing one
+            deprint(u'%s: Duplicate top-level %s group loaded as MobBase, '
+                    u'replacing' % (self.fileInfo, label))
+            self.tops[label] = new_top
+        else:
+            # Duplicate top-level group and we can merge
+            deprint(u'%s: Duplicate top-level %s group, merging' % (
+                self.fileInfo, label))
+            self.tops[label].merge_records(new_top, set(), set(), False,
+                                           False)
+
+    def _prefetch_decompressed(self, ins, top_header, decomp_pool,
+                               __rh=RecordHeader):
+        """Walks the headers in the top group whose header was just read from
+        ins and has ins start decompressing the compressed records we are
+        going to load in the threads of decomp_pool - see
+        MmapModReader.prefetch_decompressed. Leaves ins where it was."""
+        get_rec_class = self.loadFactory.getRecClass
+        rec_classes = {}
+        compressed_mask = _compressed_flag_mask()
+        header_unpack = __rh.header_unpack
+        header_size = __rh.rec_header_size
+        ins_unpack, ins_seek, ins_tell = ins.unpack, ins.seek, ins.tell
+        data_chunks = []
+        grup_start = ins_tell()
+        end_pos = grup_start + top_header.size - header_size
+        try:
+            while ins_tell() < end_pos:
+                args = ins_unpack(header_unpack, header_size, u'REC_HEADER')
+                rec_sig, rec_size = args[0], args[1]
+                if rec_sig == b'GRUP':
+                    # Cell children only get decoded on demand (see MobCell),
+                    # skip them - otherwise walk into nested groups
+                    if args[3] == 6: ins_seek(rec_size - header_size, 1)
+                    continue
+                if args[2] & compressed_mask:
+                    # Records loaded as MreRecord are not decompressed
+                    try:
+                        rec_class = rec_classes[rec_sig]
+                    except KeyError:
+                        rec_class = rec_classes[rec_sig] = get_rec_class(
+                            rec_sig)
+                    if rec_class and rec_class is not MreRecord:
+                        data_chunks.append((ins_tell(), rec_size))
+                ins_seek(rec_size, 1)
+        except ModError:
+            # Leave reporting this to the actual load
+            data_chunks = []
+        ins_seek(grup_start)
+        ins.prefetch_decompressed(decomp_pool, data_chunks)
+
     def safeSave(self):
         """Save data to file safely.  Works under UAC."""
         self.fileInfo.tempBackup()
@@ -296,9 +502,9 @@ def save(self,outPath=None):
             #--Mod Record
             self.tes4.setChanged()
             self.tes4.numRecords = sum(block.getNumRecords() for block in self.tops.values())
-            self.tes4.getSize()
             self.tes4.dump(out)
-            #--Blocks
+            #--Blocks - these get streamed into out record by record, going
+            # back to fill in the group sizes once each group is done
             selfTops = self.tops
             for rsig in RecordHeader.top_grup_sigs:
                 if rsig in selfTops:
@@ -414,7 +620,6 @@ def getMgefName(self):
     def __repr__(self):
         return u'ModFile<%s>' % self.fileInfo
 
-# TODO(inf) Use this for a bunch of stuff in mods_metadata.py (e.g. UDRs)
 class ModHeaderReader(object):
     """Allows very fast reading of a plugin's headers, skipping reading and
     decoding of anything but the headers."""
@@ -427,21 +632,10 @@ def read_mod_headers(mod_info):
 
         :rtype: defaultdict[bytes, list[RecordHeader]]"""
         ret_headers = defaultdict(list)
-        with ModReader(mod_info.name, mod_info.abs_path.open(u'rb')) as ins:
-            ins_at_end = ins.atEnd
-            ins_unpack_rec_header = ins.unpackRecHeader
-            ins_seek = ins.seek
-            try:
-                while not ins_at_end():
-                    header = ins_unpack_rec_header()
-                    # Skip GRUPs themselves, only process their records
-                    header_rec_sig = header.recType
-                    if header_rec_sig != b'GRUP':
-                        ret_headers[header_rec_sig].append(header)
-                        ins_seek(header.size, 1)
-            except (OSError, struct_error) as e:
-                raise ModError(ins.inName, u'Error scanning %s, file read '
-                    u"pos: %i\nCaused by: '%r'" % (mod_info, ins.tell(), e))
+        rec_index = mod_info.get_record_index()
+        index_sig, index_header = rec_index.sig, rec_index.header
+        for entry in rec_index.iter_records():
+            ret_headers[index_sig(entry)].append(index_header(entry))
         return ret_headers
 
     ##: The method above has to be very fast, but this one can afford to be
@@ -456,35 +650,375 @@ def read_temp_child_headers(mod_info):
         # We want to read only the children of these, so skip their tops
         interested_sigs = {b'CELL', b'WRLD'}
         tops_to_skip = interested_sigs | {bush.game.Esp.plugin_header_sig}
-        grup_header_size = RecordHeader.rec_header_size
-        with ModReader(mod_info.name, mod_info.abs_path.open(u'rb')) as ins:
-            ins_at_end = ins.atEnd
-            ins_unpack_rec_header = ins.unpackRecHeader
+        rec_index = mod_info.get_record_index()
+        grup_wanted = {}
+        def _is_wanted(grup_entry):
+            """We skip all top-level GRUPs we're not interested in (group type
+            == 0) and all persistent children and dialog topics (group type ==
+            7 or 8, respectively), as well as everything inside those."""
+            try:
+                return grup_wanted[grup_entry]
+            except KeyError:
+                grup_header = rec_index.header(grup_entry)
+                if grup_header.groupType == 0:
+                    wanted = grup_header.label in interested_sigs
+                else:
+                    wanted = grup_header.groupType not in (7, 8) and \
+                             _is_wanted(rec_index.parents[grup_entry])
+                return grup_wanted.setdefault(grup_entry, wanted)
+        for entry in rec_index.iter_records():
+            parent_entry = rec_index.parents[entry]
+            if (parent_entry != -1 and _is_wanted(parent_entry) and
+                    rec_index.sig(entry) not in tops_to_skip):
+                # We must be in a temp CELL children group, store the header
+                ret_headers.append(rec_index.header(entry))
+        return ret_headers
+
+def _long_fid_coder(masters_list, __pack=structs_cache[u'=I'].pack):
+    """Returns a function mapping the short fids of a plugin with the
+    specified masters (the plugin itself being the last one in masters_list)
+    to 32-bit codes of their long form, which are the same in every plugin -
+    see RecordIndex.compute_digests."""
+    master_crcs = [crc32(m.cs.encode(u'utf-8')) for m in masters_list]
+    max_master = len(masters_list) - 1
+    def fid_code(fid):
+        if not fid: return fid # None or null
+        mod_index = fid >> 24
+        if mod_index > max_master: mod_index = max_master # clamp HITMEs
+        return crc32(__pack(fid & 0xFFFFFF), master_crcs[mod_index]) \
+               & 0xFFFFFFFF
+    return fid_code
+
+class _StringIdTable(dict):
+    """Stands in for the string table of localized plugins when computing
+    record digests. The strings files of different plugins don't share
+    string IDs, so digests are computed over the IDs themselves."""
+    __slots__ = ()
+
+    def __nonzero__(self): return True # PY3: __bool__
+
+    def get(self, string_id, default=None):
+        return u'%08X' % string_id
+
+class RecordIndex(object):
+    """Compact index of all records and groups in a plugin, in file order.
+    For every one of them, we store its raw header fields, the offset of its
+    header and the index of the group it is in. That allows finding and
+    seeking to specific records (e.g. all CELLs, or a single FormID) without
+    walking the whole plugin. Indices are cached on disk, keyed by the size,
+    mtime and CRC of the plugin - see ModInfo.get_record_index."""
+    _magic = b'WBRI'
+    _version = 3
+    # magic, version, plugin size, plugin mtime, plugin CRC, number of
+    # entries, whether record digests follow the columns
+    _file_header = structs_cache[u'=4sIQdIIB']
+    _columns = (u'sizes', u'args1', u'args2', u'args3', u'args4', u'offsets',
+                u'parents')
+    # Kinds of record digests - see compute_digests
+    DIGEST_NONE = 0 # groups, the plugin header
+    DIGEST_LONG = 1 # FormIDs digested in long form
+    DIGEST_RAW = 2  # record data digested as is
+    _digest_size = 8
+    # Types of the groups whose label is the FormID of the topic/cell that
+    # the records in them belong to
+    _child_grup_types = {7, 8, 9, 10}
+
+    def __init__(self, cache_key):
+        self.cache_key = cache_key
+        self.sigs = b''
+        self.sizes, self.args1, self.args2, self.args3, self.args4, \
+            self.offsets = [array(u'I') for _x in xrange(6)]
+        self.parents = array(u'i')
+        # Computed on demand, see compute_digests
+        self.digests = self.digest_kinds = None
+        self._fid_entries = None
+
+    def __len__(self): return len(self.offsets)
+
+    @classmethod
+    def build(cls, mod_info, cache_key, __rh=RecordHeader):
+        """Walks the headers of the specified plugin and returns an index of
+        it.
+
+        :type mod_info: bosh.ModInfo"""
+        index = cls(cache_key)
+        sigs = []
+        sizes_append, args1_append, args2_append, args3_append, \
+            args4_append, offsets_append, parents_append = [
+            getattr(index, c).append for c in cls._columns]
+        header_unpack = __rh.header_unpack
+        header_size = __rh.rec_header_size
+        valid_sigs = __rh.valid_header_sigs
+        # Stack of (entry index, end offset) tuples for the groups we are in
+        open_grups = []
+        with MmapModReader(mod_info.name,
+                           mod_info.abs_path.open(u'rb')) as ins:
+            ins_unpack = ins.unpack
             ins_seek = ins.seek
+            ins_tell = ins.tell
+            ins_size = ins.size
             try:
-                while not ins_at_end():
-                    header = ins_unpack_rec_header()
-                    header_rec_sig = header.recType
-                    if header_rec_sig == b'GRUP':
-                        header_group_type = header.groupType
-                        # Skip all top-level GRUPs we're not interested in
-                        # (group type == 0) and all persistent children and
-                        # dialog topics (group type == 7 or 8, respectively).
-                        if ((header_group_type == 0 and
-                             header.label not in interested_sigs)
-                                or header_group_type in (7, 8)):
-                            # Note that GRUP sizes include their own header
-                            # size, so we need to subtract that
-                            ins_seek(header.size - grup_header_size, 1)
-                    elif header_rec_sig in tops_to_skip:
-                        # Skip TES4, CELL and WRLD to get to their contents
-                        ins_seek(header.size, 1)
+                while ins_tell() < ins_size:
+                    offset = ins_tell()
+                    while open_grups and offset >= open_grups[-1][1]:
+                        open_grups.pop()
+                    args = ins_unpack(header_unpack, header_size,
+                                      u'REC_HEADER')
+                    header_sig = args[0]
+                    if header_sig not in valid_sigs:
+                        raise ModError(ins.inName, u'Bad header type: %r' %
+                                       header_sig)
+                    sigs.append(header_sig)
+                    sizes_append(args[1])
+                    args1_append(args[2])
+                    args2_append(args[3])
+                    # Morrowind's record headers only have four fields
+                    args3_append(args[4] if len(args) > 4 else 0)
+                    args4_append(args[5] if len(args) > 5 else 0)
+                    offsets_append(offset)
+                    parents_append(open_grups[-1][0] if open_grups else -1)
+                    if header_sig == b'GRUP':
+                        # Group sizes include their header - walk into them
+                        open_grups.append((len(sigs) - 1, offset + args[1]))
                     else:
-                        # We must be in a temp CELL children group, store the
-                        # header and skip the record body
-                        ret_headers.append(header)
-                        ins_seek(header.size, 1)
+                        ins_seek(args[1], 1)
             except (OSError, struct_error) as e:
-                raise ModError(ins.inName, u'Error scanning %s, file read '
+                raise ModError(ins.inName, u'Error indexing %s, file read '
                     u"pos: %i\nCaused by: '%r'" % (mod_info, ins.tell(), e))
-        return ret_headers
+        index.sigs = b''.join(sigs)
+        return index
+
+    @classmethod
+    def load(cls, idx_path, cache_key):
+        """Loads the index stored at idx_path, returning None if it does not
+        exist, is corrupt or does not match cache_key."""
+        try:
+            with idx_path.open(u'rb') as ins:
+                magic, version, size, mtime, crc, num_entries, \
+                has_digests = cls._file_header.unpack(
+                    ins.read(cls._file_header.size))
+                if (magic, version) != (cls._magic, cls._version) or (
+                        size, mtime, crc) != cache_key:
+                    return None
+                index = cls(cache_key)
+                index.sigs = ins.read(4 * num_entries)
+                for column in cls._columns:
+                    getattr(index, column).fromfile(ins, num_entries)
+                if len(index.sigs) != 4 * num_entries: return None
+                if has_digests:
+                    index.digests = ins.read(cls._digest_size * num_entries)
+                    index.digest_kinds = ins.read(num_entries)
+                    if len(index.digest_kinds) != num_entries: return None
+                return index
+        except (OSError, IOError, EOFError, struct_error):
+            return None
+
+    def save(self, idx_path):
+        """Stores this index at idx_path."""
+        idx_path.head.makedirs()
+        with idx_path.temp.open(u'wb') as out:
+            out.write(self._file_header.pack(
+                self._magic, self._version, self.cache_key[0],
+                self.cache_key[1], self.cache_key[2], len(self),
+                self.digests is not None))
+            out.write(self.sigs)
+            for column in self._columns:
+                getattr(self, column).tofile(out)
+            if self.digests is not None:
+                out.write(self.digests)
+                out.write(self.digest_kinds)
+        idx_path.untemp()
+
+    def compute_digests(self, mod_info, progress=None,
+                        __prefix=structs_cache[u'=4sI'].pack,
+                        __parent=structs_cache[u'=II'].pack):
+        """Computes a content digest of every record in the plugin, over its
+        signature, flags and decompressed data. The digests of records in
+        topic and cell children groups also cover the type and label of that
+        group, since moving e.g. a reference to another cell is not an ITM
+        even if its data is the same. FormIDs in the data (and labels) of
+        records that we have a definition for are replaced by codes of their
+        long form first (DIGEST_LONG), so that such digests are comparable
+        across plugins. Other records are digested as is (DIGEST_RAW), their
+        digests are only comparable if the masters of both plugins have the
+        same indices - see RecordDigests.
+
+        :type mod_info: bosh.ModInfo"""
+        progress = progress or bolt.Progress()
+        progress.setFull(max(len(self), 1))
+        digest_size = self._digest_size
+        digests = bytearray(digest_size * len(self))
+        digest_kinds = bytearray(len(self))
+        fid_code = _long_fid_coder(list(mod_info.masterNames) +
+                                   [mod_info.name])
+        type_class = MreRecord.type_class
+        flags_mask = ~_compressed_flag_mask() & 0xFFFFFFFF
+        parents = self.parents
+        with MmapModReader(mod_info.name,
+                           mod_info.abs_path.open(u'rb')) as ins:
+            if mod_info.header.flags1.hasStrings:
+                ins.setStringTable(_StringIdTable())
+            for rec_num, entry in enumerate(self.iter_records()):
+                # Skip the plugin header, the only record outside of groups
+                if parents[entry] == -1: continue
+                if not rec_num & 0x3FF:
+                    progress(entry, _(u'Digesting records...'))
+                header = self.header(entry)
+                data_offset = self.data_offset(entry)
+                rec_class = type_class.get(header.recType)
+                if rec_class is None or not issubclass(rec_class, MelRecord):
+                    digest_kind = self.DIGEST_RAW
+                elif rec_class.melSet.formElements:
+                    digest_kind = self.DIGEST_LONG
+                else:
+                    # No FormIDs in the data, so it's the same in every plugin
+                    digest_kind = self.DIGEST_LONG
+                    rec_class = None
+                digest_data = None
+                if digest_kind == self.DIGEST_LONG and rec_class is not None:
+                    ins.seek(data_offset)
+                    try:
+                        record = rec_class(header, ins, True)
+                        record.melSet.mapFids(record, fid_code, True)
+                        out = io.BytesIO()
+                        record.melSet.dumpData(record, out)
+                        digest_data = out.getvalue()
+                    except Exception:
+                        deprint(u'Failed to digest %s record %08X of %s, '
+                                u'digesting its raw data instead' % (
+                            header.recType, header.fid, mod_info),
+                                traceback=True)
+                        digest_kind = self.DIGEST_RAW
+                if digest_data is None:
+                    ins.seek(data_offset)
+                    digest_data = MreRecord(header, ins).getDecompressed()
+                digest_kinds[entry] = digest_kind
+                rec_digest = hashlib.md5(__prefix(
+                    header.recType, header.flags1 & flags_mask))
+                parent_header = self.header(parents[entry])
+                if parent_header.groupType in self._child_grup_types:
+                    parent_label = parent_header.label
+                    if digest_kind == self.DIGEST_LONG:
+                        parent_label = fid_code(parent_label)
+                    rec_digest.update(__parent(parent_header.groupType,
+                                               parent_label))
+                rec_digest.update(digest_data)
+                digests[digest_size * entry:digest_size * (entry + 1)] = \
+                    rec_digest.digest()[:digest_size]
+        self.digests = bytes(digests)
+        self.digest_kinds = bytes(digest_kinds)
+
+    # Queries -----------------------------------------------------------------
+    def sig(self, entry):
+        """Returns the signature of the specified entry."""
+        return self.sigs[4 * entry:4 * entry + 4]
+
+    def is_group(self, entry):
+        return self.sigs[4 * entry:4 * entry + 4] == b'GRUP'
+
+    def header(self, entry, __rh=RecordHeader):
+        """Returns the header of the specified entry, like unpack_header
+        would."""
+        rec_sig = self.sigs[4 * entry:4 * entry + 4]
+        args = [rec_sig, self.sizes[entry], self.args1[entry],
+                self.args2[entry], self.args3[entry], self.args4[entry]]
+        del args[len(__rh.rec_pack_format):]
+        if rec_sig != b'GRUP':
+            return RecHeader(*args)
+        elif args[3] == 0:
+            args[2] = structs_cache[u'I'].pack(args[2])
+            return TopGrupHeader(*args[1:])
+        return GrupHeader(*args[1:])
+
+    def ancestors(self, entry):
+        """Yields the entries of the groups that the specified entry is in,
+        innermost first."""
+        parents = self.parents
+        entry = parents[entry]
+        while entry != -1:
+            yield entry
+            entry = parents[entry]
+
+    def iter_records(self, rec_sigs=None):
+        """Yields the entries of all records (i.e. not groups) with one of the
+        specified signatures, or of all records if rec_sigs is None."""
+        sigs = self.sigs
+        for entry in xrange(len(self)):
+            rec_sig = sigs[4 * entry:4 * entry + 4]
+            if rec_sig != b'GRUP' and (rec_sigs is None or
+                                       rec_sig in rec_sigs):
+                yield entry
+
+    def find_fid(self, fid):
+        """Returns the entry of the record with the specified (short) FormID,
+        or None if there is no such record."""
+        if self._fid_entries is None:
+            fids = self.args2
+            self._fid_entries = {fids[e]: e for e in self.iter_records()}
+        return self._fid_entries.get(fid)
+
+    def digest(self, entry):
+        """Returns the kind and the digest of the specified entry - see
+        compute_digests, which must have been called."""
+        return ord(self.digest_kinds[entry]), self.digests[
+            self._digest_size * entry:self._digest_size * (entry + 1)]
+
+    def data_offset(self, entry, __rh=RecordHeader):
+        """Returns the offset of the data of the specified entry, i.e. what
+        follows its header."""
+        return self.offsets[entry] + __rh.rec_header_size
+
+class RecordDigests(object):
+    """Tracks the digests of the winning versions of records while being fed
+    plugins in load order, to find overrides that are identical to the
+    version they override (ITMs) with a hash join instead of loading and
+    comparing records - see RecordIndex.compute_digests."""
+    def __init__(self):
+        # Maps long fids to (digest kind, digest, masters list of the plugin
+        # it comes from) tuples
+        self._winners = {}
+        self._comparable_cache = {}
+
+    def _raw_comparable(self, winner_masters, masters_list):
+        """Returns True if raw digests of a plugin with masters_list (the
+        plugin itself being the last one) are comparable with those of a
+        plugin with winner_masters, i.e. if the latter is a prefix of the
+        former, so that each master has the same index in both."""
+        try:
+            return self._comparable_cache[winner_masters, masters_list]
+        except KeyError:
+            return self._comparable_cache.setdefault(
+                (winner_masters, masters_list),
+                masters_list[:len(winner_masters)] == winner_masters)
+
+    def add_plugin(self, mod_info, rec_sigs=None, progress=None):
+        """Makes the records of the specified plugin the winning ones and
+        returns a set of the long fids of those records that are identical
+        to the versions they override.
+
+        :type mod_info: bosh.ModInfo
+        :param rec_sigs: If set, only records with these signatures are
+            considered."""
+        rec_index = mod_info.get_record_index(with_digests=True,
+                                              progress=progress)
+        masters_list = tuple(mod_info.masterNames) + (mod_info.name,)
+        max_master = len(masters_list) - 1
+        winners = self._winners
+        index_fids, index_digest = rec_index.args2, rec_index.digest
+        digest_raw = RecordIndex.DIGEST_RAW
+        identical = set()
+        for entry in rec_index.iter_records(rec_sigs):
+            digest_kind, rec_digest = index_digest(entry)
+            if not digest_kind: continue
+            short_fid = index_fids[entry]
+            long_fid = (masters_list[min(short_fid >> 24, max_master)],
+                        short_fid & 0xFFFFFF) # clamp HITMEs
+            winner = winners.get(long_fid)
+            if (winner is not None and winner[0] == digest_kind and
+                    winner[1] == rec_digest and (
+                    digest_kind != digest_raw or
+                    self._raw_comparable(winner[2], masters_list))):
+                identical.add(long_fid)
+            else:
+                winners[long_fid] = (digest_kind, rec_digest, masters_list)
+        return identical
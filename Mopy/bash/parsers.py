@@ -463,7 +463,9 @@ def readFromMod(self,modInfo):
         """Imports actor level data from the specified mod and its masters."""
         from . import bosh
         mod_id_levels, gotLevels = self.mod_id_levels, self.gotLevels
-        loadFactory = LoadFactory(False,MreRecord.type_class[b'NPC_'])
+        loadFactory = LoadFactory(False, MreRecord.type_class[b'NPC_'],
+            projections={b'NPC_': (u'eid', u'flags', u'level', u'calcMin',
+                                   u'calcMax')})
         for modName in (modInfo.masterNames + (modInfo.name,)):
             if modName in gotLevels: continue
             modFile = ModFile(bosh.modInfos[modName],loadFactory)
@@ -581,7 +583,8 @@ def readFromMod(self,modInfo):
         """Imports eids from specified mod."""
         type_id_eid,types = self.type_id_eid,self.types
         classes = [MreRecord.type_class[x] for x in types]
-        loadFactory = LoadFactory(False,*classes)
+        loadFactory = LoadFactory(False, *classes,
+                                  projections={x: (u'eid',) for x in types})
         modFile = ModFile(modInfo,loadFactory)
         modFile.load(True)
         for type_ in types:
@@ -873,7 +876,8 @@ def readFromMod(self,modInfo):
         """Imports type_id_name from specified mod."""
         type_id_name,types = self.type_id_name, self.types
         classes = [MreRecord.type_class[x] for x in self.types]
-        loadFactory = LoadFactory(False,*classes)
+        loadFactory = LoadFactory(False, *classes, projections={
+            x: (u'eid', u'full') for x in types})
         modFile = ModFile(modInfo,loadFactory)
         modFile.load(True)
         for type_ in types:
@@ -1054,7 +1058,8 @@ def __init__(self, types=None, aliases_=None):
     def readFromMod(self,modInfo):
         """Reads stats from specified mod."""
         typeClasses = [MreRecord.type_class[x] for x in self.class_attrs]
-        loadFactory = LoadFactory(False,*typeClasses)
+        loadFactory = LoadFactory(False, *typeClasses,
+                                  projections=self.class_attrs)
         modFile = ModFile(modInfo,loadFactory)
         modFile.load(True)
         for top_grup_sig, attrs in self.class_attrs.iteritems():
@@ -1203,7 +1208,8 @@ def writeToText(self, skip, folder, deprefix, fileName, skipcomments,
     def readFromMod(self, modInfo, file_):
         """Reads stats from specified mod."""
         eid_data = self.eid_data
-        loadFactory = LoadFactory(False,MreRecord.type_class[b'SCPT'])
+        loadFactory = LoadFactory(False, MreRecord.type_class[b'SCPT'],
+            projections={b'SCPT': (u'eid', u'script_source')})
         modFile = ModFile(modInfo,loadFactory)
         modFile.load(True)
         with Progress(_(u'Export Scripts')) as progress:
@@ -1539,10 +1545,11 @@ def readFromMod(self,modInfo):
         """Reads data from specified mod."""
         class_fid_stats = self.class_fid_stats
         typeClasses = [MreRecord.type_class[x] for x in class_fid_stats]
-        loadFactory = LoadFactory(False,*typeClasses)
+        attrs = self.item_prices_attrs
+        loadFactory = LoadFactory(False, *typeClasses, projections={
+            x: attrs for x in class_fid_stats})
         modFile = ModFile(modInfo,loadFactory)
         modFile.load(True)
-        attrs = self.item_prices_attrs
         for top_grup_sig, fid_stats in class_fid_stats.iteritems():
             for record in modFile.tops[top_grup_sig].getActiveRecords():
                 fid_stats[record.fid] = [getattr(record, a) for a in attrs]
@@ -1638,7 +1645,8 @@ def readFromMod(self, modInfo, __attrgetters=attrgetter_cache):
         """Reads stats from specified mod."""
         fid_stats, attrs = self.fid_stats, self.attrs
         detailed = self.detailed
-        loadFactory= LoadFactory(False,MreRecord.type_class[b'SPEL'])
+        loadFactory = LoadFactory(False, MreRecord.type_class[b'SPEL'],
+            projections={b'SPEL': attrs + ((u'effects',) if detailed else ())})
         modFile = ModFile(modInfo,loadFactory)
         modFile.load(True)
         for record in modFile.tops[b'SPEL'].getActiveRecords():
@@ -57,6 +57,10 @@ def __init__(self, p_name, p_file):
 class Patcher(Abstract_Patcher):
     """Abstract base class for patcher elements performing a PBash patch - must
     be just before Abstract_Patcher in MRO.""" ##: "performing" ? how ?
+    # The attributes initData stores the data it reads from the sources of
+    # this patcher in. If set, they are cached across builds of the patch and
+    # initData is skipped while get_init_data_inputs stays the same
+    _init_data_attrs = ()
 
     def getReadClasses(self):
         """Returns load factory classes needed for reading."""
@@ -66,6 +70,23 @@ def getWriteClasses(self):
         """Returns load factory classes needed for writing."""
         return self.__class__._read_write_records if self.isActive else ()
 
+    def get_loaded_sigs(self):
+        """Returns a dict mapping the signatures of the records this patcher
+        loads from plugins via PatchFile.get_loaded_mod to the attributes it
+        needs from them, or to None if it needs the whole records."""
+        return {}
+
+    def get_loaded_mods(self):
+        """Returns the plugins this patcher loads via PatchFile.get_loaded_mod,
+        so that each of them can be loaded in one go with the record types
+        every patcher needs from it."""
+        return ()
+
+    def get_init_data_inputs(self):
+        """Returns a list of everything the data initData reads depends on,
+        which must have a stable repr - see _init_data_attrs."""
+        raise AbstractError(u'get_init_data_inputs not implemented')
+
     def initData(self,progress):
         """Compiles material, i.e. reads source text, esp's, etc. as
         necessary."""
@@ -136,6 +157,9 @@ class AMultiTweakItem(object):
     # The signatures of the record types this tweak wants to edit. Must be
     # bytestrings.
     tweak_read_classes = ()
+    # The signatures of the record types this tweak looks up in all plugins
+    # via PatchFile.get_loaded_mod. Must be bytestrings.
+    tweak_loaded_sigs = ()
     # The name of the tweak, shown in the GUI
     tweak_name = u'OVERRIDE'
     # The tooltip to show when hovering over the tweak in the GUI
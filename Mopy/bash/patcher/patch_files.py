@@ -21,8 +21,17 @@
 #
 # =============================================================================
 from __future__ import print_function
+import Queue  # PY3
+import cPickle as pickle  # PY3
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
 import time
-from collections import defaultdict, Counter
+from collections import defaultdict, Counter, OrderedDict
+from functools import partial
 from operator import attrgetter
 from .. import bush # for game etc
 from .. import bolt # for type hints
@@ -33,13 +42,250 @@
 from ..bolt import GPath, SubProgress, deprint, Progress
 from ..exception import BoltError, CancelError, ModError
 from ..localize import format_date
-from ..mod_files import ModFile, LoadFactory
+from ..mod_files import ModFile, LoadFactory, RecordDigests, \
+    pickle_record_data, unpickle_record_data
 
 # the currently executing patch set in _Mod_Patch_Update before showing the
 # dialog - used in getAutoItems, to get mods loading before the patch
 ##: HACK ! replace with method param once gui_patchers are refactored
 executing_patch = None # type: bolt.Path
 
+# Record types that are loaded into the CELL and WRLD top groups
+_cell_sigs = frozenset((b'CELL', b'WRLD', b'ROAD', b'REFR', b'ACHR', b'ACRE',
+                        b'PGRD', b'LAND'))
+
+class _PatcherDataCache(object):
+    """On-disk cache of the data the patchers of a bashed patch read from
+    their sources in initData, keyed by patcher class. Each entry is only
+    used while a digest of everything that data depends on stays the same,
+    so rebuilding the patch only has to read the sources of those patchers
+    whose inputs changed - see Patcher._init_data_attrs.
+
+    Only initData is cached. scanLoadMods still loads and scans every
+    plugin and every patcher still runs buildPatch, since the patchers edit
+    the same patch records in turn and their contributions can't be
+    replayed independently of each other."""
+    _version = 1
+
+    def __init__(self, cache_path):
+        """:type cache_path: bolt.Path"""
+        self.cache_path = cache_path
+        self._entries = {}
+        self._changed = False
+        self._rec_classes = MreRecord.type_class.values()
+        try:
+            with cache_path.open(u'rb') as ins:
+                version, entries = pickle.load(ins)
+            if version == self._version:
+                self._entries = entries
+        except (OSError, IOError):
+            pass # no cache yet
+        except Exception:
+            deprint(u'Failed to read %s' % cache_path, traceback=True)
+
+    @staticmethod
+    def inputs_digest(patcher):
+        return hashlib.md5(repr(patcher.get_init_data_inputs()).encode(
+            u'utf-8')).hexdigest()
+
+    def restore(self, patcher, inputs_digest, skip_counts):
+        """Sets the cached initData attributes of the specified patcher and
+        its counts of skipped records, returning True if the cache had them
+        for inputs_digest."""
+        cache_entry = self._entries.get(patcher.__class__.__name__)
+        if cache_entry is None or cache_entry[0] != inputs_digest:
+            return False
+        try:
+            attr_values, patcher_skips = unpickle_record_data(
+                cache_entry[1], self._rec_classes)
+        except Exception:
+            deprint(u'Failed to restore the data of %s' % patcher.getName(),
+                    traceback=True)
+            return False
+        for attr, value in attr_values.iteritems():
+            setattr(patcher, attr, value)
+        if patcher_skips:
+            skip_counts[patcher.getName()].update(patcher_skips)
+        return True
+
+    def store(self, patcher, inputs_digest, skip_counts):
+        """Caches the initData attributes of the specified patcher and its
+        counts of skipped records."""
+        try:
+            pickled_data = pickle_record_data((
+                {a: getattr(patcher, a) for a in patcher._init_data_attrs},
+                dict(skip_counts.get(patcher.getName(), {}))),
+                self._rec_classes)
+        except Exception:
+            # e.g. records of classes generated at runtime, don't cache them
+            deprint(u'Failed to cache the data of %s' % patcher.getName(),
+                    traceback=True)
+            self._entries.pop(patcher.__class__.__name__, None)
+        else:
+            self._entries[patcher.__class__.__name__] = (inputs_digest,
+                                                          pickled_data)
+        self._changed = True
+
+    def save(self):
+        if not self._changed: return
+        try:
+            self.cache_path.head.makedirs()
+            with self.cache_path.temp.open(u'wb') as out:
+                pickle.dump((self._version, self._entries), out,
+                            pickle.HIGHEST_PROTOCOL)
+            self.cache_path.untemp()
+        except (OSError, IOError):
+            deprint(u'Failed to save %s' % self.cache_path, traceback=True)
+        self._changed = False
+
+def _copy_factory(load_factory):
+    """Returns a new LoadFactory that loads the same records as the
+    specified one, which another thread may be adding record types to."""
+    type_class = load_factory.type_class
+    # tuple() copies the set in one go, without letting other threads run
+    return LoadFactory(load_factory.keepAll, *[
+        type_class[r] if type_class[r] is not MreRecord else r
+        for r in tuple(load_factory.recTypes)], lazy=load_factory.lazy,
+        projections=dict(load_factory.projections))
+
+if os.name == u'nt':
+    import ctypes
+    from ctypes import wintypes
+    # https://docs.microsoft.com/en-us/windows/win32/api/psapi/ns-psapi-process_memory_counters
+    class _ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [(u'cb', wintypes.DWORD),
+                    (u'PageFaultCount', wintypes.DWORD)] + [
+            (f, ctypes.c_size_t) for f in (
+                u'PeakWorkingSetSize', u'WorkingSetSize',
+                u'QuotaPeakPagedPoolUsage', u'QuotaPagedPoolUsage',
+                u'QuotaPeakNonPagedPoolUsage', u'QuotaNonPagedPoolUsage',
+                u'PagefileUsage', u'PeakPagefileUsage')]
+    _GetCurrentProcess = ctypes.windll.kernel32.GetCurrentProcess
+    _GetCurrentProcess.restype = wintypes.HANDLE
+    _GetProcessMemoryInfo = ctypes.windll.psapi.GetProcessMemoryInfo
+    _GetProcessMemoryInfo.argtypes = [
+        wintypes.HANDLE, ctypes.POINTER(_ProcessMemoryCounters),
+        wintypes.DWORD]
+
+    def _get_peak_memory():
+        """Returns the peak working set of this process so far in bytes, or
+        None if it can't be queried."""
+        mem_counters = _ProcessMemoryCounters()
+        mem_counters.cb = ctypes.sizeof(mem_counters)
+        if not _GetProcessMemoryInfo(_GetCurrentProcess(),
+                                     ctypes.byref(mem_counters),
+                                     mem_counters.cb):
+            return None
+        return mem_counters.PeakWorkingSetSize
+else:
+    import resource
+
+    def _get_peak_memory():
+        """Returns the peak resident set size of this process so far in
+        bytes."""
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes, except on macOS
+        return peak_rss if sys.platform == u'darwin' else peak_rss * 1024
+
+class _BuildProfile(object):
+    """Records how long each step of building a bashed patch took and how
+    long each patcher spent in initData, scanModFile and buildPatch, along
+    with how much each of those raised the peak memory usage of Wrye Bash -
+    the step and phase names are not translated, so that profiles can be
+    compared regardless of language."""
+    _patcher_phases = (u'initData', u'scanModFile', u'buildPatch')
+
+    def __init__(self):
+        self.step_times = OrderedDict()
+        self.patcher_times = defaultdict(Counter)
+        # Bytes by which each phase of each patcher raised the peak memory
+        # usage - only the first phase to need more memory than was used
+        # before gets blamed for it, so these are lower bounds
+        self.patcher_memory = defaultdict(Counter)
+
+    def add_step_time(self, step_name, step_time):
+        self.step_times[step_name] = self.step_times.get(
+            step_name, 0.0) + step_time
+
+    def run_patcher(self, patcher, phase, patcher_func, *args):
+        """Calls patcher_func (one of the patcher's phase methods) with the
+        specified arguments and records how long it took and how much it
+        raised the peak memory usage."""
+        start_peak = _get_peak_memory()
+        start_time = time.time()
+        try:
+            return patcher_func(*args)
+        finally:
+            patcher_name = patcher.getName()
+            self.patcher_times[patcher_name][phase] += (time.time() -
+                                                        start_time)
+            end_peak = _get_peak_memory()
+            if start_peak is not None and end_peak is not None:
+                self.patcher_memory[patcher_name][phase] += (end_peak -
+                                                             start_peak)
+
+    def _sorted_patchers(self):
+        return sorted(self.patcher_times, reverse=True,
+                      key=lambda p: sum(self.patcher_times[p].values()))
+
+    def log_profile(self, log):
+        """Writes the profile to the patch log, in a section that starts out
+        collapsed."""
+        log.setHeader(u'= ' + _(u'Build Profile'), True)
+        log(_(u'How long each step of building this patch took, followed by '
+              u'the time each patcher spent preparing (initData), scanning '
+              u'plugins (scanModFile) and building (buildPatch) and by how '
+              u'much that raised the peak memory usage. The same data is '
+              u'saved next to this log, as a JSON file.'))
+        log(u'<details><summary>%s</summary>' % _(u'Show'))
+        log.setHeader(u'=== ' + _(u'Steps'))
+        for step_name, step_time in self.step_times.iteritems():
+            log(u'* %s: %.2fs' % (step_name, step_time))
+        log.setHeader(u'=== ' + _(u'Patchers'))
+        for patcher_name in self._sorted_patchers():
+            patcher_times = self.patcher_times[patcher_name]
+            log(u'* __%s__: %.2fs' % (patcher_name,
+                                      sum(patcher_times.values())))
+            patcher_memory = self.patcher_memory[patcher_name]
+            for phase in self._patcher_phases:
+                if phase not in patcher_times: continue
+                phase_line = u'  * %s: %.2fs' % (phase, patcher_times[phase])
+                if phase in patcher_memory:
+                    phase_line += u', +%.1f MB' % (
+                        patcher_memory[phase] / 1048576.0)
+                log(phase_line)
+        peak_memory = _get_peak_memory()
+        if peak_memory is not None:
+            log.setHeader(u'=== ' + _(u'Peak Memory Usage'))
+            log(u'%.1f MB' % (peak_memory / 1048576.0))
+        log.setHeader(None)
+        log(u'</details>')
+
+    def save_json(self, json_path, patch_name):
+        """Saves the profile as JSON, to be attached to bug reports."""
+        profile_data = OrderedDict([
+            (u'app_version', bass.AppVersion),
+            (u'game', bush.game.fsName),
+            (u'patch', patch_name.s),
+            (u'date', format_date(time.time())),
+            (u'steps', self.step_times),
+            (u'patchers', OrderedDict(
+                (p, OrderedDict((ph, self.patcher_times[p][ph]) for ph in
+                                self._patcher_phases
+                                if ph in self.patcher_times[p]))
+                for p in self._sorted_patchers())),
+            # In bytes
+            (u'patcher_memory', OrderedDict(
+                (p, OrderedDict((ph, self.patcher_memory[p][ph]) for ph in
+                                self._patcher_phases
+                                if ph in self.patcher_memory[p]))
+                for p in self._sorted_patchers())),
+            (u'peak_memory', _get_peak_memory()),
+        ])
+        with io.open(json_path.s, u'w', encoding=u'utf-8') as out:
+            out.write(unicode(json.dumps(profile_data, indent=2,
+                                         ensure_ascii=False)))
+
 class PatchFile(ModFile):
     """Base class of patch files. Wraps an executing bashed Patch."""
 
@@ -132,14 +378,112 @@ def init_patchers_data(self, patchers, progress):
         """Gives each patcher a chance to get its source data."""
         self._patcher_instances = [p for p in patchers if p.isActive]
         if not self._patcher_instances: return
-        progress = progress.setFull(len(self._patcher_instances))
-        for index, patcher in enumerate(self._patcher_instances):
+        build_profile = self.build_profile
+        step_start = time.time()
+        # Restore what we can from the last build, see _PatcherDataCache
+        data_cache = _PatcherDataCache(bass.dirs[u'modsBash'].join(
+            u'Patch Data', u'%s.dat' % self.fileInfo.name))
+        init_patchers = []
+        inputs_digests = {}
+        for patcher in self._patcher_instances:
+            if patcher._init_data_attrs:
+                inputs_digest = inputs_digests[patcher] = \
+                    data_cache.inputs_digest(patcher)
+                if data_cache.restore(patcher, inputs_digest,
+                                      self.patcher_mod_skipcount):
+                    continue
+            init_patchers.append(patcher)
+        build_profile.add_step_time(u'Restoring cached patcher data',
+                                    time.time() - step_start)
+        self._plan_loaded_mods(init_patchers)
+        # Load every plugin the patchers need once, in load order, with
+        # everything they need from it - see get_loaded_mod
+        planned_mods = load_order.get_ordered(self._planned_sigs)
+        progress = progress.setFull(
+            max(len(planned_mods) + len(init_patchers), 1))
+        step_start = time.time()
+        for index, mod_name in enumerate(planned_mods):
+            progress(index, _(u'Loading') + u'\n' + mod_name.s)
+            self.get_loaded_mod(mod_name, ())
+        build_profile.add_step_time(u'Loading patcher sources',
+                                    time.time() - step_start)
+        for index, patcher in enumerate(init_patchers, len(planned_mods)):
             progress(index, _(u'Preparing') + u'\n' + patcher.getName())
-            patcher.initData(SubProgress(progress, index))
+            build_profile.run_patcher(patcher, u'initData', patcher.initData,
+                                      SubProgress(progress, index))
+            if patcher in inputs_digests:
+                data_cache.store(patcher, inputs_digests[patcher],
+                                 self.patcher_mod_skipcount)
+        self._loaded_mods.clear()
+        data_cache.save()
         progress(progress.full, _(u'Patchers prepared.'))
         # initData may set isActive to zero - TODO(ut) track down
         self._patcher_instances = [p for p in patchers if p.isActive]
 
+    def _plan_loaded_mods(self, init_patchers):
+        """Collects the plugins that the specified patchers are going to load
+        via get_loaded_mod, along with the record types they need from each
+        plugin and the attributes they need from those - see
+        Patcher.get_loaded_sigs and Patcher.get_loaded_mods."""
+        loaded_projections = {}
+        planned_sigs = defaultdict(set)
+        for patcher in init_patchers:
+            patcher_sigs = patcher.get_loaded_sigs()
+            if not patcher_sigs: continue
+            for mod_name in patcher.get_loaded_mods():
+                if mod_name in self.p_file_minfos:
+                    planned_sigs[mod_name].update(patcher_sigs)
+            for rec_sig, rec_attrs in patcher_sigs.iteritems():
+                if rec_attrs is None or (
+                        loaded_projections.get(rec_sig, ()) is None):
+                    loaded_projections[rec_sig] = None
+                else:
+                    loaded_projections.setdefault(rec_sig, set()).update(
+                        rec_attrs)
+        self._loaded_projections = loaded_projections
+        self._planned_sigs = planned_sigs
+
+    def get_loaded_mod(self, mod_name, rec_sigs):
+        """Returns a ModFile of the specified plugin with (at least) the
+        records of the specified types loaded. These are shared by all
+        patchers, so that each plugin gets loaded only once per build, with
+        all the record types and attributes the patchers registered for it.
+        They are dropped once every patcher has run initData, so they are
+        only meant to be read there:
+         - their records must not be modified
+         - mutable attribute values (lists, structs, etc.) that end up in
+           the patch must be copied first, since other patchers may keep
+           the very same objects"""
+        try:
+            loaded_mod = self._loaded_mods[mod_name]
+        except KeyError:
+            loaded_mod = self._loaded_mods[mod_name] = ModFile(
+                self.p_file_minfos[mod_name], LoadFactory(False))
+            loaded_mod.longFids = True
+            rec_sigs = self._planned_sigs.get(mod_name, set()).union(
+                rec_sigs)
+        loaded_sigs = loaded_mod.loadFactory.recTypes
+        missing_sigs = set(rec_sigs) - loaded_sigs
+        if not missing_sigs: return loaded_mod
+        projections = self._loaded_projections
+        if missing_sigs & _cell_sigs:
+            # These all share the CELL and WRLD top groups, which get
+            # replaced below - so load all of them that are or will be
+            # needed in one go
+            missing_sigs |= _cell_sigs & (loaded_sigs | set(projections))
+        type_class = MreRecord.type_class
+        load_factory = LoadFactory(False, *[type_class[s] for s in
+                                            missing_sigs], projections={
+            s: projections[s] for s in missing_sigs
+            if projections.get(s) is not None})
+        new_mod = ModFile(loaded_mod.fileInfo, load_factory)
+        new_mod.load(do_unpack=True)
+        loaded_mod.tes4 = new_mod.tes4
+        loaded_mod.tops.update(new_mod.tops)
+        for rec_sig in missing_sigs:
+            loaded_mod.loadFactory.addClass(type_class[rec_sig])
+        return loaded_mod
+
     #--Instance
     def __init__(self, modInfo, p_file_minfos):
         """Initialization."""
@@ -156,6 +500,11 @@ def __init__(self, modInfo, p_file_minfos):
         self.unFilteredMods = []
         self.compiledAllMods = []
         self.patcher_mod_skipcount = defaultdict(Counter)
+        # Plugins loaded for the patchers - see get_loaded_mod
+        self._loaded_mods = {}
+        self._loaded_projections = {}
+        self._planned_sigs = {}
+        self.build_profile = _BuildProfile()
         #--Config
         self.bodyTags = bush.game.body_tags
         #--Mods
@@ -193,29 +542,141 @@ def initFactories(self,progress):
                 MreRecord.type_class[x] for x in patcher.getReadClasses())
             writeClasses.update(
                 MreRecord.type_class[x] for x in patcher.getWriteClasses())
-        self.readFactory = LoadFactory(False, *readClasses)
+        self.readFactory = LoadFactory(False, *readClasses, lazy=True)
         self.loadFactory = LoadFactory(True, *writeClasses)
         #--Merge Factory
         self.mergeFactory = LoadFactory(False, *bush.game.mergeClasses)
 
     def scanLoadMods(self,progress):
         """Scans load+merge mods."""
-        nullProgress = Progress()
         progress = progress.setFull(len(self.allMods))
-        for index,modName in enumerate(self.allMods):
-            modInfo = self.p_file_minfos[modName]
-            bashTags = modInfo.getBashTags()
+        # See bSkipIdenticalOverrides in bash_default.ini
+        if bass.inisettings[u'SkipIdenticalOverrides']:
+            rec_digests = RecordDigests()
+            digested_sigs = ((self.readFactory.topTypes |
+                              self.mergeFactory.topTypes) -
+                             {b'CELL', b'WRLD', b'DIAL'})
+        else:
+            rec_digests = digested_sigs = None
+        loaded_mods = self._load_scan_mods(progress)
+        try:
+            self._scan_loaded_mods(loaded_mods, progress, rec_digests,
+                                   digested_sigs)
+        finally:
+            loaded_mods.close() # stops loading ahead if we failed
+        progress(progress.full,_(u'Load mods scanned.'))
+
+    def _load_scan_mods(self, progress):
+        """Loads each of allMods in load order, yielding its index, name and
+        ModFile - or the ModError raised while loading it. If
+        iScanPrefetchPlugins is set, a background thread loads the plugins
+        that follow while the caller scans the current one."""
+        prefetch_depth = bass.inisettings[u'ScanPrefetchPlugins']
+        add_load_time = partial(self.build_profile.add_step_time,
+                                u'Loading plugins')
+        if prefetch_depth <= 0:
+            for index, modName in enumerate(self.allMods):
+                progress(index, u'%s\n' % modName + _(u'Loading...'))
+                load_start = time.time()
+                try:
+                    modFile = self._load_scan_mod(
+                        modName, SubProgress(progress, index, index + 0.5))
+                except ModError as e:
+                    deprint(u'load error:', traceback=True)
+                    modFile = e
+                add_load_time(time.time() - load_start)
+                yield index, modName, modFile
+            return
+        # Bounded, so that at most prefetch_depth plugins wait in memory
+        loaded_queue = Queue.Queue(prefetch_depth)
+        stop_loading = threading.Event()
+        def load_ahead():
+            for mod_name in self.allMods:
+                try:
+                    # Merging adds record types to readFactory while we are
+                    # loading, so load with a copy of it - see below
+                    loaded = self._load_scan_mod(mod_name, Progress(),
+                                                 _copy_factory)
+                except ModError as e:
+                    deprint(u'load error:', traceback=True)
+                    loaded = e
+                except Exception as e:
+                    deprint(u'Error loading %s' % mod_name, traceback=True)
+                    loaded_queue.put(e) # aborts the scan
+                    return
+                loaded_queue.put(loaded)
+                if stop_loading.is_set(): return
+        loader = threading.Thread(target=load_ahead,
+                                  name=u'ScanPrefetchThread')
+        loader.daemon = True
+        loader.start()
+        try:
+            for index, modName in enumerate(self.allMods):
+                progress(index, u'%s\n' % modName + _(u'Loading...'))
+                # Only counts the time spent waiting for the loader
+                load_start = time.time()
+                loaded = loaded_queue.get()
+                add_load_time(time.time() - load_start)
+                if isinstance(loaded, Exception) and not isinstance(
+                        loaded, ModError):
+                    raise loaded
+                if (not isinstance(loaded, ModError) and
+                        loaded.loadFactory.recTypes !=
+                        self._scan_factory(modName).recTypes):
+                    # A plugin merged after this one got loaded added record
+                    # types it must be loaded with - load it again
+                    load_start = time.time()
+                    try:
+                        loaded = self._load_scan_mod(
+                            modName, SubProgress(progress, index, index + 0.5))
+                    except ModError as e:
+                        deprint(u'load error:', traceback=True)
+                        loaded = e
+                    add_load_time(time.time() - load_start)
+                yield index, modName, loaded
+        finally:
+            # Make room in the queue so that the loader can see it must stop
+            stop_loading.set()
+            while True:
+                try:
+                    loaded_queue.get_nowait()
+                except Queue.Empty:
+                    break
+
+    def _scan_factory(self, modName):
+        """Returns the load factory scanLoadMods needs for the specified
+        plugin."""
+        return (self.readFactory,self.mergeFactory)[modName in self.mergeSet]
+
+    def _load_scan_mod(self, modName, progress, wrap_factory=None):
+        """Loads the specified plugin with the load factory scanLoadMods
+        needs for it, passed through wrap_factory if given."""
+        loadFactory = self._scan_factory(modName)
+        if wrap_factory is not None: loadFactory = wrap_factory(loadFactory)
+        modFile = ModFile(self.p_file_minfos[modName], loadFactory)
+        modFile.load(True, progress)
+        return modFile
+
+    def _scan_loaded_mods(self, loaded_mods, progress, rec_digests,
+                          digested_sigs):
+        """Merges or scans the plugins yielded by _load_scan_mods, in load
+        order."""
+        nullProgress = Progress()
+        add_step_time = self.build_profile.add_step_time
+        run_patcher = self.build_profile.run_patcher
+        for index, modName, modFile in loaded_mods:
+            bashTags = self.p_file_minfos[modName].getBashTags()
             if modName in self.loadSet and u'Filter' in bashTags:
                 self.unFilteredMods.append(modName)
-            try:
-                loadFactory = (self.readFactory,self.mergeFactory)[modName in self.mergeSet]
-                progress(index, u'%s\n' % modName + _(u'Loading...'))
-                modFile = ModFile(modInfo,loadFactory)
-                modFile.load(True,SubProgress(progress,index,index+0.5))
-            except ModError as e:
-                deprint(u'load error:', traceback=True)
-                self.loadErrorMods.append((modName,e))
+            if isinstance(modFile, ModError):
+                self.loadErrorMods.append((modName, modFile))
                 continue
+            if rec_digests is not None:
+                step_start = time.time()
+                self._drop_identical_overrides(modFile, rec_digests,
+                                               digested_sigs)
+                add_step_time(u'Skipping identical overrides',
+                              time.time() - step_start)
             try:
                 #--Error checks
                 if b'WRLD' in modFile.tops and modFile.tops[b'WRLD'].orphansSkipped:
@@ -232,23 +693,41 @@ def scanLoadMods(self,progress):
                 doFilter = isMerged and u'Filter' in bashTags
                 #--iiMode is a hack to support Item Interchange. Actual key used is IIM.
                 iiMode = isMerged and u'IIM' in bashTags
+                step_start = time.time()
                 if isMerged:
                     progress(pstate, u'%s\n' % modName + _(u'Merging...'))
                     self.mergeModFile(modFile, doFilter, iiMode)
                 else:
                     progress(pstate, u'%s\n' % modName + _(u'Scanning...'))
                     self.update_patch_records_from_mod(modFile)
+                add_step_time(u'Merging and updating records',
+                              time.time() - step_start)
                 for patcher in sorted(self._patcher_instances,
                         key=attrgetter(u'patcher_order')):
                     if iiMode and not patcher.iiMode: continue
                     progress(pstate, u'%s\n%s' % (modName, patcher.getName()))
-                    patcher.scan_mod_file(modFile,nullProgress)
+                    run_patcher(patcher, u'scanModFile',
+                                patcher.scan_mod_file, modFile, nullProgress)
             except CancelError:
                 raise
             except:
                 print(u'MERGE/SCAN ERROR: %s' % modName)
                 raise
-        progress(progress.full,_(u'Load mods scanned.'))
+
+    @staticmethod
+    def _drop_identical_overrides(modFile, rec_digests, digested_sigs):
+        """Drops the records of modFile that are identical to the versions
+        they override (see RecordDigests) from its top groups, so that
+        merging and the patchers don't spend any time on them - they don't
+        change anything."""
+        identical_fids = rec_digests.add_plugin(modFile.fileInfo,
+                                                digested_sigs)
+        if not identical_fids: return
+        # Both are long fids, ModFile.load converted those of modFile
+        for top_sig, top_block in modFile.tops.iteritems():
+            if top_sig not in digested_sigs: continue
+            top_block.keepRecords({r.fid for r in top_block.records
+                                   if r.fid not in identical_fids})
 
     def mergeModFile(self, modFile, doFilter, iiMode):
         """Copies contents of modFile into self."""
@@ -289,11 +768,16 @@ def buildPatch(self,log,progress):
         for index,patcher in enumerate(sorted(self._patcher_instances,
                 key=attrgetter(u'patcher_order'))):
             subProgress(index,_(u'Completing')+u'\n%s...' % patcher.getName())
-            patcher.buildPatch(log,SubProgress(subProgress,index))
+            self.build_profile.run_patcher(patcher, u'buildPatch',
+                patcher.buildPatch, log, SubProgress(subProgress, index))
         # Trim records to only keep ones we actually changed
         progress(0.9,_(u'Completing')+u'\n'+_(u'Trimming records...'))
+        step_start = time.time()
         for block in self.tops.values():
             block.keepRecords(self.keepIds)
+        self.build_profile.add_step_time(u'Trimming records',
+                                         time.time() - step_start)
+        self.build_profile.log_profile(log)
         progress(0.95,_(u'Completing')+u'\n'+_(u'Converting fids...'))
         # Convert masters to short fids
         self.tes4.masters = self.getMastersUsed()
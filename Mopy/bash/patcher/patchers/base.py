@@ -28,13 +28,47 @@
 # Internal
 from .. import getPatchesPath
 from ..base import AMultiTweakItem, AMultiTweaker, Patcher, AListPatcher
-from ... import load_order, bush
+from ... import bass, bush, load_order
 from ...bolt import GPath, CsvReader, deprint
 from ...brec import MreRecord
 from ...exception import AbstractError
 
 # Patchers 1 ------------------------------------------------------------------
-class ListPatcher(AListPatcher,Patcher): pass
+class ListPatcher(AListPatcher,Patcher):
+
+    def _srcs_and_masters(self, src_mods):
+        """Returns a set of the specified source plugins and their masters,
+        skipping missing ones."""
+        minfs = self.patchFile.p_file_minfos
+        loaded_mods = set()
+        for src_mod in src_mods:
+            if src_mod not in minfs: continue
+            loaded_mods.add(src_mod)
+            loaded_mods.update(m for m in minfs[src_mod].masterNames
+                               if m in minfs)
+        return loaded_mods
+
+    def get_init_data_inputs(self):
+        """The sources, their tags, the plugins loaded from them (by size,
+        mtime and CRC) and the load order, which decides which FormIDs can be
+        imported."""
+        minfs = self.patchFile.p_file_minfos
+        init_inputs = [bass.AppVersion, bush.game.fsName,
+                       self.__class__.__name__, self.patchFile.loadMods,
+                       sorted(self.patchFile.pfile_aliases.iteritems())]
+        for src in self.srcs:
+            if src in minfs:
+                init_inputs.append((src, sorted(minfs[src].getBashTags())))
+            else: # a CSV file
+                src_path = getPatchesPath(src)
+                init_inputs.append((src_path, src_path.exists() and (
+                    src_path.size, src_path.mtime)))
+        for mod_name in sorted(m for m in self.get_loaded_mods()
+                               if m in minfs):
+            mod_info = minfs[mod_name]
+            init_inputs.append((mod_name, mod_info.size, mod_info.mtime,
+                                mod_info.calculate_crc()[0]))
+        return init_inputs
 
 class MultiTweakItem(AMultiTweakItem):
     # If True, do not call tweak_scan_file and pool the records this tweak
@@ -53,6 +87,13 @@ def getWriteClasses(self):
         """Returns load factory classes needed for writing."""
         return self.__class__.tweak_read_classes
 
+    def init_tweak_data(self, patch_file):
+        """Gives this tweak a chance to read what it needs from the plugins it
+        loads via PatchFile.get_loaded_mod (see tweak_loaded_sigs). Called
+        from the initData of the parent 'tweaker', since those plugins are
+        dropped before the patch gets built. Default implementation does
+        nothing."""
+
     def prepare_for_tweaking(self, patch_file):
         """Gives this tweak a chance to use prepare for the phase where it gets
         its tweak_record calls using the specified patch file instance. At this
@@ -103,6 +144,7 @@ def initData(self,progress):
         for tweak in self.enabled_tweaks: # type: MultiTweakItem
             for read_sig in tweak.getReadClasses():
                 t_dict[read_sig][tweak.supports_pooling].append(tweak)
+            tweak.init_tweak_data(self.patchFile)
 
     def getReadClasses(self):
         """Returns load factory classes needed for reading."""
@@ -114,6 +156,14 @@ def getWriteClasses(self):
         return chain.from_iterable(tweak.getWriteClasses()
             for tweak in self.enabled_tweaks) if self.isActive else ()
 
+    def get_loaded_sigs(self):
+        return dict.fromkeys(chain.from_iterable(
+            tweak.tweak_loaded_sigs for tweak in self.enabled_tweaks)) \
+            if self.isActive else {}
+
+    def get_loaded_mods(self):
+        return self.patchFile.loadMods
+
     def scanModFile(self,modFile,progress):
         rec_pool = defaultdict(set)
         common_tops = set(modFile.tops) & set(self._tweak_dict)
@@ -262,25 +312,13 @@ def scanModFile(self,modFile,progress):
                         if not cellImported:
                             patchCells.setCell(cellBlock.cell)
                             cellImported = True
-                        for newRef in patchCells.id_cellBlock[cellBlock.cell.fid].temp_refs:
-                            if newRef.fid == record.fid:
-                                loc = patchCells.id_cellBlock[cellBlock.cell.fid].temp_refs.index(newRef)
-                                patchCells.id_cellBlock[cellBlock.cell.fid].temp_refs[loc] = record
-                                break
-                        else:
-                            patchCells.id_cellBlock[cellBlock.cell.fid].temp_refs.append(record)
+                        patchCells.id_cellBlock[cellBlock.cell.fid].temp_refs.set_entry(record)
                 for record in cellBlock.persistent_refs:
                     if record.base in self.old_new:
                         if not cellImported:
                             patchCells.setCell(cellBlock.cell)
                             cellImported = True
-                        for newRef in patchCells.id_cellBlock[cellBlock.cell.fid].persistent_refs:
-                            if newRef.fid == record.fid:
-                                loc = patchCells.id_cellBlock[cellBlock.cell.fid].persistent_refs.index(newRef)
-                                patchCells.id_cellBlock[cellBlock.cell.fid].persistent_refs[loc] = record
-                                break
-                        else:
-                            patchCells.id_cellBlock[cellBlock.cell.fid].persistent_refs.append(record)
+                        patchCells.id_cellBlock[cellBlock.cell.fid].persistent_refs.set_entry(record)
         if b'WRLD' in modFile.tops:
             for worldBlock in modFile.tops[b'WRLD'].worldBlocks:
                 worldImported = False
@@ -300,13 +338,7 @@ def scanModFile(self,modFile,progress):
                             if not cellImported:
                                 patchWorlds.id_worldBlocks[worldBlock.world.fid].setCell(cellBlock.cell)
                                 cellImported = True
-                            for newRef in patchWorlds.id_worldBlocks[worldBlock.world.fid].id_cellBlock[cellBlock.cell.fid].temp_refs:
-                                if newRef.fid == record.fid:
-                                    loc = patchWorlds.id_worldBlocks[worldBlock.world.fid].id_cellBlock[cellBlock.cell.fid].temp_refs.index(newRef)
-                                    patchWorlds.id_worldBlocks[worldBlock.world.fid].id_cellBlock[cellBlock.cell.fid].temp_refs[loc] = record
-                                    break
-                            else:
-                                patchWorlds.id_worldBlocks[worldBlock.world.fid].id_cellBlock[cellBlock.cell.fid].temp_refs.append(record)
+                            patchWorlds.id_worldBlocks[worldBlock.world.fid].id_cellBlock[cellBlock.cell.fid].temp_refs.set_entry(record)
                     for record in cellBlock.persistent_refs:
                         if record.base in self.old_new:
                             if not worldImported:
@@ -315,13 +347,7 @@ def scanModFile(self,modFile,progress):
                             if not cellImported:
                                 patchWorlds.id_worldBlocks[worldBlock.world.fid].setCell(cellBlock.cell)
                                 cellImported = True
-                            for newRef in patchWorlds.id_worldBlocks[worldBlock.world.fid].id_cellBlock[cellBlock.cell.fid].persistent_refs:
-                                if newRef.fid == record.fid:
-                                    loc = patchWorlds.id_worldBlocks[worldBlock.world.fid].id_cellBlock[cellBlock.cell.fid].persistent_refs.index(newRef)
-                                    patchWorlds.id_worldBlocks[worldBlock.world.fid].id_cellBlock[cellBlock.cell.fid].persistent_refs[loc] = record
-                                    break
-                            else:
-                                patchWorlds.id_worldBlocks[worldBlock.world.fid].id_cellBlock[cellBlock.cell.fid].persistent_refs.append(record)
+                            patchWorlds.id_worldBlocks[worldBlock.world.fid].id_cellBlock[cellBlock.cell.fid].persistent_refs.set_entry(record)
 
     def buildPatch(self,log,progress):
         """Adds merged fids to patchfile."""
@@ -391,6 +417,11 @@ class ImportPatcher(ListPatcher):
     # Override in subclasses as needed
     logMsg = u'\n=== ' + _(u'Modified Records')
 
+    def get_loaded_mods(self):
+        """Most importers load their sources and the masters of those to
+        compare against - override as needed."""
+        return self._srcs_and_masters(self.srcs)
+
     def _patchLog(self,log,type_count):
         log.setHeader(u'= %s' % self._patcher_name)
         self._srcMods(log)
@@ -31,7 +31,6 @@
 from ... import bush
 from ...brec import MreRecord
 from ...exception import ModSigMismatchError
-from ...mod_files import ModFile, LoadFactory
 
 #------------------------------------------------------------------------------
 ##: currently relies on the merged subrecord being sorted - fix that
@@ -48,6 +47,7 @@ class _AMerger(ImportPatcher):
     _remove_tag = None
     # Dict mapping each record type to the subrecord we want to merge for it
     _wanted_subrecord = {}
+    _init_data_attrs = (u'touched', u'_present_sigs', u'isActive')
 
     def __init__(self, p_name, p_file, p_sources):
         p_sources = [x for x in p_sources if
@@ -89,16 +89,19 @@ def getReadClasses(self):
     def getWriteClasses(self):
         return self.getReadClasses()
 
+    def get_loaded_sigs(self):
+        if not self.isActive or not self.srcs: return {}
+        return {s: (a,) for s, a in self._wanted_subrecord.iteritems()}
+
+    def get_loaded_mods(self):
+        return self.srcs
+
     def initData(self,progress):
         if not self.isActive or not self.srcs: return
         wanted_sigs = list(self._wanted_subrecord)
-        loadFactory = LoadFactory(False, *[MreRecord.type_class[x]
-                                           for x in wanted_sigs])
         progress.setFull(len(self.srcs))
         for index,srcMod in enumerate(self.srcs):
-            srcInfo = self.patchFile.p_file_minfos[srcMod]
-            srcFile = ModFile(srcInfo,loadFactory)
-            srcFile.load(True)
+            srcFile = self.patchFile.get_loaded_mod(srcMod, wanted_sigs)
             for block in wanted_sigs:
                 if block not in srcFile.tops: continue
                 self._present_sigs.add(block)
@@ -272,6 +275,7 @@ def _entry_key(self, subrecord_entry):
 #------------------------------------------------------------------------------
 class ImportActorsAIPackagesPatcher(ImportPatcher):
     logMsg = u'\n=== ' + _(u'AI Package Lists Changed') + u': %d'
+    _init_data_attrs = (u'id_merged_deleted',)
 
     def __init__(self, p_name, p_file, p_sources):
         super(ImportActorsAIPackagesPatcher, self).__init__(p_name, p_file, p_sources)
@@ -308,33 +312,25 @@ def initData(self,progress):
         """Get data from source files."""
         if not self.isActive: return
         target_rec_types = self.target_rec_types
-        loadFactory = LoadFactory(False, *[MreRecord.type_class[x] for x
-                                           in target_rec_types])
+        get_loaded_mod = self.patchFile.get_loaded_mod
         progress.setFull(len(self.srcs))
-        cachedMasters = {}
         mer_del = self.id_merged_deleted
         minfs = self.patchFile.p_file_minfos
         for index,srcMod in enumerate(self.srcs):
             tempData = {}
             if srcMod not in minfs: continue
             srcInfo = minfs[srcMod]
-            srcFile = ModFile(srcInfo,loadFactory)
+            srcFile = get_loaded_mod(srcMod, target_rec_types)
             bashTags = srcInfo.getBashTags()
-            srcFile.load(True)
             for recClass in (MreRecord.type_class[x] for x in target_rec_types):
                 if recClass.rec_sig not in srcFile.tops: continue
                 for record in srcFile.tops[
                     recClass.rec_sig].getActiveRecords():
-                    tempData[record.fid] = record.aiPackages
+                    # Copy, the merged lists get edited below
+                    tempData[record.fid] = record.aiPackages[:]
             for master in reversed(srcInfo.masterNames):
                 if master not in minfs: continue # or break filter mods
-                if master in cachedMasters:
-                    masterFile = cachedMasters[master]
-                else:
-                    masterInfo = minfs[master]
-                    masterFile = ModFile(masterInfo,loadFactory)
-                    masterFile.load(True)
-                    cachedMasters[master] = masterFile
+                masterFile = get_loaded_mod(master, target_rec_types)
                 blocks = (MreRecord.type_class[x] for x in target_rec_types)
                 for block in blocks:
                     if block.rec_sig not in srcFile.tops: continue
@@ -393,6 +389,10 @@ def initData(self,progress):
                                                         pkg, recordData)
             progress.plus()
 
+    def get_loaded_sigs(self):
+        return dict.fromkeys(self.target_rec_types, (u'aiPackages',)) \
+            if self.isActive else {}
+
     def getReadClasses(self):
         """Returns load factory classes needed for reading."""
         return bush.game.actor_types if self.isActive else ()
@@ -437,6 +437,7 @@ def _plog(self, log, mod_count): self._plog1(log, mod_count)
 #------------------------------------------------------------------------------
 class ImportActorsSpellsPatcher(ImportPatcher):
     logMsg = u'\n=== ' + _(u'Spell Lists Changed') + u': %d'
+    _init_data_attrs = (u'id_merged_deleted',)
 
     def __init__(self, p_name, p_file, p_sources):
         super(ImportActorsSpellsPatcher, self).__init__(p_name, p_file, p_sources)
@@ -444,36 +445,32 @@ def __init__(self, p_name, p_file, p_sources):
         self.id_merged_deleted = {}
         self._read_write_records = bush.game.actor_types
 
+    def get_loaded_sigs(self):
+        return dict.fromkeys(self._read_write_records, (u'spells',)) \
+            if self.isActive else {}
+
     def initData(self,progress):
         """Get data from source files."""
         if not self.isActive: return
         target_rec_types = self._read_write_records
-        loadFactory = LoadFactory(False, *[MreRecord.type_class[x] for x
-                                           in target_rec_types])
+        get_loaded_mod = self.patchFile.get_loaded_mod
         progress.setFull(len(self.srcs))
-        cachedMasters = {}
         mer_del = self.id_merged_deleted
         minfs = self.patchFile.p_file_minfos
         for index,srcMod in enumerate(self.srcs):
             tempData = {}
             if srcMod not in minfs: continue
             srcInfo = minfs[srcMod]
-            srcFile = ModFile(srcInfo,loadFactory)
+            srcFile = get_loaded_mod(srcMod, target_rec_types)
             bashTags = srcInfo.getBashTags()
-            srcFile.load(True)
             for recClass in (MreRecord.type_class[x] for x in target_rec_types):
                 if recClass.rec_sig not in srcFile.tops: continue
                 for record in srcFile.tops[recClass.rec_sig].getActiveRecords():
-                    tempData[record.fid] = record.spells
+                    # Copy, the merged lists get edited below
+                    tempData[record.fid] = record.spells[:]
             for master in reversed(srcInfo.masterNames):
                 if master not in minfs: continue # or break filter mods
-                if master in cachedMasters:
-                    masterFile = cachedMasters[master]
-                else:
-                    masterInfo = minfs[master]
-                    masterFile = ModFile(masterInfo,loadFactory)
-                    masterFile.load(True)
-                    cachedMasters[master] = masterFile
+                masterFile = get_loaded_mod(master, target_rec_types)
                 for block in (MreRecord.type_class[x] for x in target_rec_types):
                     if block.rec_sig not in srcFile.tops: continue
                     if block.rec_sig not in masterFile.tops: continue
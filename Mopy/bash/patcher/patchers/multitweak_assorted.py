@@ -28,9 +28,7 @@
 import re
 # Internal
 from ... import bush, load_order
-from ...brec import MreRecord  # yuck, see usage below
 from ...bolt import GPath, deprint, floats_equal
-from ...mod_files import LoadFactory, ModFile  # yuck, see usage below
 from ...patcher.patchers.base import MultiTweakItem, MultiTweaker, \
     CustomChoiceTweak
 
@@ -871,6 +869,7 @@ def tweak_record(self, record):
 class AssortedTweak_AbsorbSummonFix(MultiTweakItem):
     """Adds the 'No Absorb/Reflect' flag to summoning spells."""
     tweak_read_classes = b'SPEL',
+    tweak_loaded_sigs = b'MGEF',
     tweak_name = _(u'Magic: Summoning Absorption Fix')
     tweak_tip = _(u'Adds the "No Absorb/Reflect" flag to all summoning '
                   u'spells. Fixes those spells with spell absorption.')
@@ -879,15 +878,13 @@ class AssortedTweak_AbsorbSummonFix(MultiTweakItem):
     default_enabled = True
     _look_up_mgef = None
 
-    def prepare_for_tweaking(self, patch_file):
-        ##: Same HACK as in NamesTweak_Scrolls.prepare_for_tweaking
+    def init_tweak_data(self, patch_file):
+        ##: Same HACK as in NamesTweak_Scrolls.init_tweak_data
         self._look_up_mgef = id_mgef = {}
-        mgef_factory = LoadFactory(False, MreRecord.type_class[b'MGEF'])
         for pl_path in patch_file.loadMods:
-            ench_plugin = ModFile(patch_file.p_file_minfos[pl_path],
-                                  mgef_factory)
-            ench_plugin.load(do_unpack=True)
-            for record in ench_plugin.tops[b'MGEF'].getActiveRecords():
+            mgef_plugin = patch_file.get_loaded_mod(pl_path, (b'MGEF',))
+            if b'MGEF' not in mgef_plugin.tops: continue
+            for record in mgef_plugin.tops[b'MGEF'].getActiveRecords():
                 id_mgef[record.fid] = record
 
     def wants_record(self, record):
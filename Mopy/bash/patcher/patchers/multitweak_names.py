@@ -31,9 +31,7 @@
 
 # Internal
 from ...bolt import build_esub, RecPath
-from ...brec import MreRecord  # yuck, see usage below
 from ...exception import AbstractError
-from ...mod_files import LoadFactory, ModFile  # yuck, see usage below
 from ...patcher.patchers.base import MultiTweakItem
 from ...patcher.patchers.base import MultiTweaker
 
@@ -229,6 +227,7 @@ def _get_rename_params(self, record):
 class NamesTweak_Scrolls(_AMgefNamesTweak):
     """Names tweaker for scrolls."""
     tweak_read_classes = b'BOOK',
+    tweak_loaded_sigs = b'ENCH',
     tweak_name = _(u'Notes And Scrolls')
     tweak_tip = _(u'Mark notes and scrolls to sort separately from books.')
     tweak_key = u'scrolls'
@@ -268,18 +267,15 @@ def wants_record(self, record):
         return (record.flags.isScroll and not record.flags.isFixed and
                 super(NamesTweak_Scrolls, self).wants_record(record))
 
-    def prepare_for_tweaking(self, patch_file):
-        super(NamesTweak_Scrolls, self).prepare_for_tweaking(patch_file)
+    def init_tweak_data(self, patch_file):
         # HACK - and what an ugly one - we need a general API to express to the
         # BP that a patcher/tweak wants it to index all records for certain
         # record types in some central place (and NOT by forwarding all records
         # into the BP!)
         self._look_up_ench = id_ench = {}
-        ench_factory = LoadFactory(False, MreRecord.type_class[b'ENCH'])
         for pl_path in patch_file.loadMods:
-            ench_plugin = ModFile(patch_file.p_file_minfos[pl_path],
-                                  ench_factory)
-            ench_plugin.load(do_unpack=True)
+            ench_plugin = patch_file.get_loaded_mod(pl_path, (b'ENCH',))
+            if b'ENCH' not in ench_plugin.tops: continue
             for record in ench_plugin.tops[b'ENCH'].getActiveRecords():
                 id_ench[record.fid] = record
 
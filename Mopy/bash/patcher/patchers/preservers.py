@@ -34,7 +34,6 @@
 from ...bolt import attrgetter_cache, deprint, floats_equal, setattr_deep
 from ...brec import MreRecord
 from ...exception import ModSigMismatchError
-from ...mod_files import ModFile, LoadFactory
 
 #------------------------------------------------------------------------------
 class _APreserver(ImportPatcher):
@@ -57,6 +56,8 @@ class _APreserver(ImportPatcher):
     # without it being checked against the masters first. None means no such
     # tag exists for this patcher
     _force_full_import_tag = None
+    _init_data_attrs = (u'id_data', u'srcClasses', u'classestemp',
+                        u'isActive')
 
     def __init__(self, p_name, p_file, p_sources):
         super(_APreserver, self).__init__(p_name, p_file, p_sources)
@@ -159,20 +160,35 @@ def _init_data_loop(self, recClass, srcFile, srcMod, temp_id_data,
             temp_id_data[record.fid] = {attr: __attrgetters[attr](record)
                                         for attr in recAttrs}
 
+    def get_loaded_sigs(self):
+        if not self.isActive or not self.srcs: return {}
+        # We only read the attributes we import, so only load those
+        if self._multi_tag:
+            return {r.rec_sig: set(chain.from_iterable(d.itervalues()))
+                    for r, d in self.recAttrs_class.iteritems()}
+        return {r.rec_sig: a for r, a in self.recAttrs_class.iteritems()}
+
+    def get_loaded_mods(self):
+        minfs = self.patchFile.p_file_minfos
+        # Force-imported sources are not compared against their masters
+        forced_srcs = {s for s in self.srcs if s in minfs and
+                       self._force_full_import_tag in minfs[s].getBashTags()}
+        return self._srcs_and_masters(
+            s for s in self.srcs if s not in forced_srcs) | forced_srcs
+
     # noinspection PyDefaultArgument
     def initData(self, progress, __attrgetters=attrgetter_cache):
         if not self.isActive: return
         id_data = self.id_data
-        loadFactory = LoadFactory(False, *self.recAttrs_class)
+        loaded_sigs = [r.rec_sig for r in self.recAttrs_class]
+        get_loaded_mod = self.patchFile.get_loaded_mod
         progress.setFull(len(self.srcs) + len(self.csv_srcs))
-        cachedMasters = {}
         minfs = self.patchFile.p_file_minfos
         for index,srcMod in enumerate(self.srcs):
             temp_id_data = {}
             if srcMod not in minfs: continue
             srcInfo = minfs[srcMod]
-            srcFile = ModFile(srcInfo,loadFactory)
-            srcFile.load(do_unpack=True)
+            srcFile = get_loaded_mod(srcMod, loaded_sigs)
             for recClass in self.recAttrs_class:
                 if recClass.rec_sig not in srcFile.tops: continue
                 self.srcClasses.add(recClass)
@@ -186,12 +202,7 @@ def initData(self, progress, __attrgetters=attrgetter_cache):
                 continue
             for master in srcInfo.masterNames:
                 if master not in minfs: continue # or break filter mods
-                if master in cachedMasters:
-                    masterFile = cachedMasters[master]
-                else:
-                    masterFile = ModFile(minfs[master], loadFactory)
-                    masterFile.load(True)
-                    cachedMasters[master] = masterFile
+                masterFile = get_loaded_mod(master, loaded_sigs)
                 for recClass in self.recAttrs_class:
                     if recClass.rec_sig not in masterFile.tops: continue
                     if recClass not in self.classestemp: continue
@@ -444,12 +455,17 @@ class ImportWeaponModificationsPatcher(_APreserver):
 class ImportCellsPatcher(ImportPatcher):
     logMsg = u'\n=== ' + _(u'Cells/Worlds Patched')
     _read_write_records = (b'CELL', b'WRLD')
+    _init_data_attrs = (u'cellData',)
 
     def __init__(self, p_name, p_file, p_sources):
         super(ImportCellsPatcher, self).__init__(p_name, p_file, p_sources)
         self.cellData = defaultdict(dict)
         self.recAttrs = bush.game.cellRecAttrs # dict[unicode, tuple[unicode]]
 
+    def get_loaded_sigs(self):
+        return dict.fromkeys(self._read_write_records) if self.isActive \
+            else {}
+
     def initData(self, progress, __attrgetters=attrgetter_cache):
         """Get cells from source files."""
         if not self.isActive: return
@@ -487,10 +503,8 @@ def checkMasterCellBlockData(cellBlock):
                     master_attr = __attrgetters[attr](cellBlock.cell)
                     if tempCellData[rec_fid][attr] != master_attr:
                         cellData[rec_fid][attr] = tempCellData[rec_fid][attr]
-        loadFactory = LoadFactory(False, MreRecord.type_class[b'CELL'],
-                                         MreRecord.type_class[b'WRLD'])
+        get_loaded_mod = self.patchFile.get_loaded_mod
         progress.setFull(len(self.srcs))
-        cachedMasters = {}
         minfs = self.patchFile.p_file_minfos
         for srcMod in self.srcs:
             if srcMod not in minfs: continue
@@ -500,9 +514,7 @@ def checkMasterCellBlockData(cellBlock):
             # values from the value in any of srcMod's masters.
             tempCellData = defaultdict(dict)
             srcInfo = minfs[srcMod]
-            srcFile = ModFile(srcInfo,loadFactory)
-            srcFile.load(True)
-            cachedMasters[srcMod] = srcFile
+            srcFile = get_loaded_mod(srcMod, self._read_write_records)
             bashTags = srcInfo.getBashTags()
             # print bashTags
             tags = bashTags & set(self.recAttrs)
@@ -521,13 +533,7 @@ def checkMasterCellBlockData(cellBlock):
                         importCellBlockData(worldBlock.worldCellBlock)
             for master in srcInfo.masterNames:
                 if master not in minfs: continue # or break filter mods
-                if master in cachedMasters:
-                    masterFile = cachedMasters[master]
-                else:
-                    masterInfo = minfs[master]
-                    masterFile = ModFile(masterInfo,loadFactory)
-                    masterFile.load(True)
-                    cachedMasters[master] = masterFile
+                masterFile = get_loaded_mod(master, self._read_write_records)
                 if b'CELL' in masterFile.tops:
                     for cellBlock in masterFile.tops[b'CELL'].cellBlocks:
                         checkMasterCellBlockData(cellBlock)
@@ -30,6 +30,7 @@
 
 from __future__ import print_function
 
+import copy
 import random
 import re
 from collections import defaultdict, Counter
@@ -39,9 +40,8 @@
 from .base import MultiTweakItem, ListPatcher
 from ... import bosh, bush
 from ...bolt import GPath, deprint
-from ...brec import MreRecord, MelObject, strFid
+from ...brec import MelObject, strFid
 from ...exception import BoltError
-from ...mod_files import ModFile, LoadFactory
 from ...patcher.base import AMultiTweaker
 
 # Utilities & Constants -------------------------------------------------------
@@ -335,6 +335,12 @@ def __init__(self, p_name, p_file, p_sources, enabled_tweaks):
         self.vanilla_eyes = _find_vanilla_eyes()
         self.enabled_tweaks = enabled_tweaks
 
+    def get_loaded_sigs(self):
+        return {b'RACE': None} if self.srcs else {}
+
+    def get_loaded_mods(self):
+        return self._srcs_and_masters(self.srcs)
+
     def initData(self,progress):
         """Get data from source files."""
         # HACK - wholesale copy of MultiTweaker.initData, see #494
@@ -345,14 +351,12 @@ def initData(self,progress):
             for read_sig in tweak.getReadClasses():
                 t_dict[read_sig][tweak.supports_pooling].append(tweak)
         if not self.isActive or not self.srcs: return
-        loadFactory = LoadFactory(False,MreRecord.type_class[b'RACE'])
+        get_loaded_mod = self.patchFile.get_loaded_mod
         progress.setFull(len(self.srcs))
-        cachedMasters = {}
         for index,srcMod in enumerate(self.srcs):
             if srcMod not in bosh.modInfos: continue
             srcInfo = bosh.modInfos[srcMod]
-            srcFile = ModFile(srcInfo,loadFactory)
-            srcFile.load(True)
+            srcFile = get_loaded_mod(srcMod, (b'RACE',))
             bashTags = srcInfo.getBashTags()
             if b'RACE' not in srcFile.tops: continue
             self.tempRaceData = {} #so as not to carry anything over!
@@ -417,20 +421,14 @@ def initData(self,progress):
                 if u'R.AddSpells' in bashTags:
                     tempRaceData['AddSpells'] = race.spells
                 if u'R.ChangeSpells' in bashTags:
-                    raceData['spellsOverride'] = race.spells
+                    raceData['spellsOverride'] = race.spells[:]
                 if u'R.Description' in bashTags:
                     tempRaceData['text'] = race.text
             for master in srcInfo.masterNames:
                 if not master in bosh.modInfos: continue  # or break
                 # filter mods
-                if master in cachedMasters:
-                    masterFile = cachedMasters[master]
-                else:
-                    masterInfo = bosh.modInfos[master]
-                    masterFile = ModFile(masterInfo,loadFactory)
-                    masterFile.load(True)
-                    if b'RACE' not in masterFile.tops: continue
-                    cachedMasters[master] = masterFile
+                masterFile = get_loaded_mod(master, (b'RACE',))
+                if b'RACE' not in masterFile.tops: continue
                 for race in masterFile.tops[b'RACE'].getActiveRecords():
                     if race.fid not in self.tempRaceData: continue
                     tempRaceData = self.tempRaceData[race.fid]
@@ -442,9 +440,12 @@ def initData(self,progress):
                                 if spell not in raceData['AddSpells']:
                                     raceData['AddSpells'].append(spell)
                         del tempRaceData['AddSpells']
+                    # Copy, since buildPatch assigns these to the patch's
+                    # races and the loaded plugins must not be modified
                     for race_key in tempRaceData:
                         if tempRaceData[race_key] != getattr(race, race_key):
-                            raceData[race_key] = tempRaceData[race_key]
+                            raceData[race_key] = copy.deepcopy(
+                                tempRaceData[race_key])
             progress.plus()
 
     def scanModFile(self, modFile, progress):
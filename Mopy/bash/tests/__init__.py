@@ -25,8 +25,10 @@
 what."""
 
 import os
+import struct
 import toml
 import traceback
+import zlib
 
 class FailedTest(Exception):
     """Misc exception for when a test should fail for meta reasons."""
@@ -80,6 +82,69 @@ def iter_resources(resource_subfolder, filter_by_game=frozenset()):
         for resource_file in os.listdir(full_game_folder):
             yield os.path.join(full_game_folder, resource_file)
 
+# Plugin helpers --------------------------------------------------------------
+# These write plugins byte by byte instead of going through brec, so that
+# tests can compare what brec writes against them. They use the Oblivion
+# format (20-byte record and group headers).
+def pack_subrecord(sub_sig, sub_data):
+    """Returns the bytes of a subrecord with the specified data."""
+    return struct.pack(u'=4sH', sub_sig, len(sub_data)) + sub_data
+
+def pack_record(rec_sig, rec_fid, subrecords, rec_flags=0):
+    """Returns the bytes of a record made up of the specified subrecords,
+    compressing them if rec_flags has the compressed flag set."""
+    rec_data = b''.join(subrecords)
+    if rec_flags & 0x00040000:
+        rec_data = struct.pack(u'=I', len(rec_data)) + zlib.compress(
+            rec_data)
+    return struct.pack(u'=4s4I', rec_sig, len(rec_data), rec_flags,
+                       rec_fid, 0) + rec_data
+
+def pack_group(grup_label, grup_type, contents):
+    """Returns the bytes of a group of the specified type with the specified
+    contents. grup_label is a record signature for top groups and an integer
+    for all others."""
+    if not isinstance(grup_label, bytes):
+        grup_label = struct.pack(u'=I', grup_label)
+    contents = b''.join(contents)
+    return struct.pack(u'=4sI4sII', b'GRUP', len(contents) + 20,
+                       grup_label, grup_type, 0) + contents
+
+def pack_plugin(masters, top_groups, num_records):
+    """Returns the bytes of a plugin with the specified masters (bytes) and
+    top groups, whose header claims num_records records."""
+    header_subs = [pack_subrecord(b'HEDR', struct.pack(
+        u'=f2I', 1.0, num_records, 0x800)),
+        # Empty author and description
+        pack_subrecord(b'CNAM', b'\x00'), pack_subrecord(b'SNAM', b'\x00')]
+    for master_name in masters:
+        header_subs.append(pack_subrecord(b'MAST', master_name + b'\x00'))
+        header_subs.append(pack_subrecord(b'DATA', b'\x00' * 8))
+    return pack_record(b'TES4', 0, header_subs) + b''.join(top_groups)
+
+class PluginInfo(object):
+    """The parts of a ModInfo that ModFile needs to load and save a plugin,
+    and that RecordDigests needs to digest it."""
+    def __init__(self, plugin_path, masters=(u'Oblivion.esm',)):
+        from ..bolt import GPath
+        from ..brec import MreRecord, RecHeader
+        self._plugin_path = self.abs_path = GPath(plugin_path)
+        self.name = self._plugin_path.tail
+        self.masterNames = [GPath(m) for m in masters]
+        self.header = MreRecord(RecHeader())
+        self._record_index = None
+
+    def getPath(self): return self._plugin_path
+
+    def get_record_index(self, with_digests=False, progress=None):
+        """Like ModInfo.get_record_index, minus the caching on disk."""
+        from ..mod_files import RecordIndex
+        if self._record_index is None:
+            self._record_index = RecordIndex.build(self, (1, 2.0, 3))
+        if with_digests and self._record_index.digests is None:
+            self._record_index.compute_digests(self, progress)
+        return self._record_index
+
 # Here be hacks ---------------------------------------------------------------
 # Maps the resource subfolder game names back to displayNames
 resource_to_displayName = {
@@ -123,5 +188,8 @@ def _emulate_startup():
     # noinspection PyProtectedMember
     bush._supportedGames()
     set_game(u'Oblivion') # just need to pick one to start
+    # Normally set by bosh.initDefaultSettings
+    from .. import bass
+    bass.inisettings[u'DecompressionThreads'] = 1
 
 _emulate_startup()
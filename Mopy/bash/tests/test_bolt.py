@@ -20,12 +20,14 @@
 #  https://github.com/wrye-bash
 #
 # =============================================================================
+import os
+import struct
 from collections import OrderedDict
 
 import pytest
 
 from ..bolt import LowerDict, DefaultLowerDict, OrderedLowerDict, decoder, \
-    encode, getbestencoding, GPath, Path
+    encode, getbestencoding, GPath, Path, Progress, StringTable
 
 def test_getbestencoding():
     """Tests getbestencoding. Keep this one small, we don't want to test
@@ -427,3 +429,43 @@ def test_dict_keys(self):
         dd = {u'c:/random/path.txt': 1}
         assert not GPath(u'c:/random/path.txt') in dd
         assert not GPath(u'' r'c:\random\path.txt') in dd
+
+def _write_strings(strings_path, id_strings, formatted):
+    """Writes a strings file with the specified (id, bytes) pairs."""
+    directory, strings_data = [], b''
+    for id_, string in id_strings:
+        directory.append(struct.pack(u'=2I', id_, len(strings_data)))
+        if formatted:
+            strings_data += struct.pack(u'=I', len(string) + 1)
+        strings_data += string + b'\x00'
+    strings_path.write_binary(struct.pack(u'=2I', len(id_strings),
+        len(strings_data)) + b''.join(directory) + strings_data)
+    return GPath(unicode(strings_path))
+
+class TestStringTable(object):
+    def test_lookup(self, tmpdir):
+        table = StringTable()
+        table.loadFile(_write_strings(tmpdir.join(u'test_english.strings'),
+            [(1, b'One'), (2, b'Two')], formatted=False), Progress())
+        table.loadFile(_write_strings(tmpdir.join(u'test_english.dlstrings'),
+            [(2, b'Second'), (3, b'Third')], formatted=True), Progress())
+        assert table[1] == u'One'
+        assert table[2] == u'Second' # later files take precedence
+        assert table.get(3) == u'Third'
+        assert 1 in table and 3 in table and 4 not in table
+        assert table.get(4) is None
+
+    def test_reload(self, tmpdir):
+        """Strings must stay available to whoever still holds the table after
+        their file is gone, the table of a reloaded plugin being cleared or
+        the table being reloaded."""
+        strings_path = _write_strings(tmpdir.join(u'test_english.strings'),
+                                      [(1, b'One')], formatted=False)
+        old_table = StringTable()
+        old_table.loadFile(strings_path, Progress())
+        strings_file, = old_table._strings_files
+        os.remove(strings_path.s)
+        assert old_table[1] == u'One'
+        old_table.clear()
+        assert not old_table
+        assert strings_file.lookup(1) == u'One'
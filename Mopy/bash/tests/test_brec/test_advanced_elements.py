@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash.  If not, see <https://www.gnu.org/licenses/>.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+"""Tests for brec.advanced_elements."""
+import io
+import struct
+
+from .. import pack_record, pack_subrecord, set_game
+from ...brec import ModReader, MreRecord
+
+def _load_record(record_bytes):
+    with ModReader(u'Test.esp', io.BytesIO(record_bytes)) as ins:
+        header = ins.unpackRecHeader()
+        return MreRecord.type_class[header.recType](header, ins, True)
+
+def _redump(record):
+    """Returns the data of the specified record, packed anew."""
+    record.setChanged()
+    record.getSize()
+    return record.data
+
+class TestMelPackedArray(object):
+    def setup_method(self):
+        set_game(u'Oblivion')
+
+    def _land(self, *subrecords):
+        return pack_record(b'LAND', 0x01000900, [
+            pack_subrecord(b'DATA', b'\x00' * 4)] + list(subrecords))
+
+    def test_empty(self):
+        """Present but empty subrecords must be kept, absent ones must stay
+        absent."""
+        empty_subs = [pack_subrecord(b'VNML', b''),
+                      pack_subrecord(b'VCLR', b'')]
+        land = _load_record(self._land(*empty_subs))
+        assert land.vertex_normals is not None
+        assert len(land.vertex_normals) == 0
+        assert land.vertex_height_map is None
+        assert _redump(land) == b''.join(
+            [pack_subrecord(b'DATA', b'\x00' * 4)] + empty_subs)
+        assert land.size == 22
+
+    def test_round_trip(self):
+        """Arrays must be written back as they were read, including preludes
+        and trailing bytes."""
+        normals = bytes(bytearray(xrange(99)))
+        heights = struct.pack(u'=f', 12.5) + b'\x01' * (33 * 33) + b'\x00' * 3
+        land_bytes = self._land(pack_subrecord(b'VNML', normals),
+                                pack_subrecord(b'VHGT', heights))
+        land = _load_record(land_bytes)
+        assert len(land.vertex_normals) == 33
+        assert land.vertex_normals[1] == (3, 4, 5)
+        assert land.height_offset == 12.5
+        assert len(land.vertex_height_map) == 33 * 33
+        assert _redump(land) == land_bytes[20:]
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash.  If not, see <https://www.gnu.org/licenses/>.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+"""Tests for brec.mod_io."""
+import struct
+import zlib
+from multiprocessing.pool import ThreadPool
+
+import pytest
+
+from ...bolt import GPath
+from ...brec import MmapModReader
+
+def _chunk(chunk_data):
+    """Returns the data of a compressed record holding chunk_data."""
+    return struct.pack(u'=I', len(chunk_data)) + zlib.compress(chunk_data)
+
+class TestPrefetchDecompressed(object):
+    def setup_method(self):
+        self.pool = ThreadPool(2)
+
+    def teardown_method(self):
+        self.pool.close()
+        self.pool.join()
+
+    def _reader(self, tmpdir, chunks):
+        file_path = tmpdir.join(u'Chunks.bin')
+        file_path.write_binary(b''.join(chunks))
+        data_chunks = []
+        chunk_pos = 0
+        for chunk in chunks:
+            data_chunks.append((chunk_pos, len(chunk)))
+            chunk_pos += len(chunk)
+        return MmapModReader(GPath(u'Chunks.bin'),
+                             open(unicode(file_path), u'rb')), data_chunks
+
+    def test_take_decompressed(self, tmpdir, monkeypatch):
+        """Records must be handed out in file order while only a bounded
+        number of them is queued, skipped ones must be dropped."""
+        monkeypatch.setattr(MmapModReader, u'prefetch_batches', 2)
+        monkeypatch.setattr(MmapModReader, u'prefetch_batch_size', 3)
+        chunk_datas = [b'record %u' % i * 10 for i in xrange(20)]
+        ins, data_chunks = self._reader(tmpdir, [_chunk(d) for d in
+                                                 chunk_datas])
+        with ins:
+            ins.prefetch_decompressed(self.pool, data_chunks)
+            for i, (chunk_pos, _chunk_size) in enumerate(data_chunks):
+                queued = ins._prefetched[2]
+                assert len(queued) <= 2
+                if i % 4 == 3: continue # skipped, e.g. an ignored record
+                ins.seek(chunk_pos)
+                assert ins.take_decompressed() == chunk_datas[i]
+            ins.drop_prefetched()
+            assert ins._prefetched is None
+
+    def test_error(self, tmpdir):
+        """Decompression errors must only be raised for the record that
+        failed to decompress."""
+        chunks = [_chunk(b'good' * 10), b'\x10\x00\x00\x00corrupt',
+                  _chunk(b'also good' * 10)]
+        ins, data_chunks = self._reader(tmpdir, chunks)
+        with ins:
+            ins.prefetch_decompressed(self.pool, data_chunks)
+            ins.seek(data_chunks[0][0])
+            assert ins.take_decompressed() == b'good' * 10
+            ins.seek(data_chunks[1][0])
+            with pytest.raises(zlib.error):
+                ins.take_decompressed()
+            ins.seek(data_chunks[2][0])
+            assert ins.take_decompressed() == b'also good' * 10
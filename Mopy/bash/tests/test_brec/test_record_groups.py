@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash.  If not, see <https://www.gnu.org/licenses/>.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+"""Tests for brec.record_groups, by loading and saving plugins built with the
+helpers in bash.tests."""
+import struct
+
+import pytest
+
+from .. import PluginInfo, pack_group, pack_plugin, pack_record, \
+    pack_subrecord, set_game
+from ...bolt import GPath
+from ...brec import IndexedRecords, MreRecord
+from ...mod_files import LoadFactory, ModFile
+
+_cell_sigs = (b'WRLD', b'CELL', b'REFR', b'ROAD', b'ACHR', b'ACRE', b'PGRD',
+              b'LAND')
+_world_fid = 0x01000800
+_world_cell_fid = 0x01000801
+_ext_cell_fid = 0x01000802
+
+def _edid(eid):
+    return pack_subrecord(b'EDID', eid + b'\x00')
+
+def _refr(ref_fid, base_fid=0x7):
+    return pack_record(b'REFR', ref_fid, [
+        _edid(b'Ref%X' % ref_fid),
+        pack_subrecord(b'NAME', struct.pack(u'=I', base_fid)),
+        pack_subrecord(b'DATA', struct.pack(u'=6f', 1, 2, 3, 0, 0, 0))])
+
+def _cell(cell_fid, cell_pos=None, rec_flags=0):
+    cell_subs = [_edid(b'Cell%X' % cell_fid), pack_subrecord(b'DATA', b'\x00')]
+    if cell_pos is not None:
+        cell_subs.append(pack_subrecord(b'XCLC', struct.pack(u'=2i',
+                                                             *cell_pos)))
+    return pack_record(b'CELL', cell_fid, cell_subs, rec_flags)
+
+def _block_label(block_x, block_y):
+    return struct.unpack(u'=I', struct.pack(u'=2h', block_y, block_x))[0]
+
+def world_plugin(base_fid=0x7):
+    """Returns the bytes of a plugin with a worldspace, whose persistent cell
+    has one reference and whose one exterior cell has two, the last one
+    placing base_fid."""
+    world = pack_record(b'WRLD', _world_fid, [
+        _edid(b'TestWorld'), pack_subrecord(b'MNAM', b'\x00' * 16),
+        pack_subrecord(b'DATA', b'\x00'),
+        pack_subrecord(b'NAM0', b'\x00' * 8),
+        pack_subrecord(b'NAM9', b'\x00' * 8)])
+    world_children = pack_group(_world_fid, 1, [
+        _cell(_world_cell_fid, rec_flags=0x400), # persistent
+        pack_group(_world_cell_fid, 6, [
+            pack_group(_world_cell_fid, 8, [_refr(0x01000810)])]),
+        pack_group(_block_label(0, 0), 4, [
+            pack_group(_block_label(0, 0), 5, [
+                _cell(_ext_cell_fid, (1, 2)),
+                pack_group(_ext_cell_fid, 6, [
+                    pack_group(_ext_cell_fid, 9, [
+                        _refr(0x01000811),
+                        _refr(0x01000812, base_fid)])])])])])
+    # 6 records and 8 groups
+    return pack_plugin([b'Oblivion.esm'], [
+        pack_group(b'WRLD', 0, [world, world_children])], 14)
+
+def _load_cells_plugin(plugin_path):
+    mod_file = ModFile(PluginInfo(plugin_path), LoadFactory(
+        True, *[MreRecord.type_class[s] for s in _cell_sigs]))
+    mod_file.load(do_unpack=True)
+    return mod_file
+
+def _ext_cell_block(mod_file):
+    world_block, = mod_file.tops[b'WRLD'].worldBlocks
+    ext_block, = world_block.cellBlocks
+    return ext_block
+
+def _misc_plugin(misc_fids):
+    return pack_plugin([b'Oblivion.esm'], [pack_group(b'MISC', 0, [
+        pack_record(b'MISC', misc_fid, [_edid(b'Misc%X' % misc_fid)])
+        for misc_fid in misc_fids])], len(misc_fids))
+
+def _entry_key(entry):
+    return entry[0]
+
+class TestIndexedRecords(object):
+    def _indexed(self, num_entries):
+        return IndexedRecords(_entry_key, [(k, u'Entry%u' % k)
+                                           for k in xrange(num_entries)])
+
+    def test_lookup(self):
+        indexed = self._indexed(3)
+        assert 1 in indexed
+        assert 3 not in indexed
+        assert indexed[2] == (2, u'Entry2')
+        assert indexed.get(3) is None
+        indexed.set_entry((1, u'Replaced'))
+        indexed.set_entry((3, u'Entry3'))
+        assert list(indexed) == [(0, u'Entry0'), (1, u'Replaced'),
+                                 (2, u'Entry2'), (3, u'Entry3')]
+
+    def test_holes(self):
+        """Popped entries must leave holes that iteration, len and lookups
+        skip, until they make up half of the entries."""
+        indexed = self._indexed(5)
+        assert indexed.pop(1) == (1, u'Entry1')
+        assert indexed.pop(3) == (3, u'Entry3')
+        assert indexed._holes == 2
+        assert len(indexed) == 3
+        assert [k for k, _v in indexed] == [0, 2, 4]
+        assert 1 not in indexed
+        assert indexed[4] == (4, u'Entry4')
+        with pytest.raises(KeyError):
+            indexed.pop(1)
+        indexed.append((5, u'Entry5'))
+        assert indexed[5] == (5, u'Entry5')
+
+    def test_compact(self):
+        """Once holes make up half of the entries, they must be dropped
+        without breaking lookups."""
+        indexed = self._indexed(5)
+        for k in (0, 2, 3):
+            indexed.pop(k)
+        assert indexed._holes == 0
+        assert indexed._entries == [(1, u'Entry1'), (4, u'Entry4')]
+        assert indexed[4] == (4, u'Entry4')
+        assert indexed[1] == (1, u'Entry1')
+        indexed.set_entry((6, u'Entry6'))
+        assert [k for k, _v in indexed] == [1, 4, 6]
+
+    def test_reindex(self, tmpdir):
+        """Converting the fids of a block must reindex its records, holes
+        and all."""
+        set_game(u'Oblivion')
+        in_path = tmpdir.join(u'Misc.esp')
+        in_path.write_binary(_misc_plugin([0x01000800, 0x01000801,
+                                           0x00000802, 0x01000803]))
+        mod_file = ModFile(PluginInfo(unicode(in_path)), LoadFactory(
+            True, MreRecord.type_class[b'MISC']))
+        mod_file.load(do_unpack=True)
+        misc_block = mod_file.tops[b'MISC']
+        records = misc_block.records
+        misc_long = (GPath(u'Misc.esp'), 0x801)
+        assert misc_block.getRecord(misc_long).eid == u'Misc1000801'
+        records.pop((GPath(u'Misc.esp'), 0x800))
+        assert records._holes == 1
+        misc_block.convertFids(mod_file.getShortMapper(), False)
+        assert records._holes == 0
+        assert [r.fid for r in records] == [0x01000801, 0x00000802,
+                                            0x01000803]
+        assert misc_block.getRecord(0x00000802).eid == u'Misc802'
+        assert misc_block.getRecord(misc_long) is None
+
+class TestMobWorld(object):
+    def setup_method(self):
+        set_game(u'Oblivion')
+
+    def test_save(self, tmpdir):
+        """Saving a loaded world must write the same plugin, counting its
+        records and groups in the plugin header."""
+        plugin_bytes = world_plugin()
+        in_path = tmpdir.join(u'World.esp')
+        in_path.write_binary(plugin_bytes)
+        mod_file = _load_cells_plugin(unicode(in_path))
+        out_path = GPath(unicode(tmpdir.join(u'Out.esp')))
+        mod_file.save(out_path)
+        assert mod_file.tes4.numRecords == 14
+        assert out_path.open(u'rb').read() == plugin_bytes
+
+class TestMobCell(object):
+    def setup_method(self):
+        set_game(u'Oblivion')
+
+    def _save_lazy(self, tmpdir, plugin_bytes):
+        """Loads and saves the specified plugin, whose cell children do not
+        get decoded unless needed. Returns the saved bytes and whether the
+        exterior cell block still had undecoded children after saving."""
+        in_path = tmpdir.join(u'World.esp')
+        in_path.write_binary(plugin_bytes)
+        mod_file = _load_cells_plugin(unicode(in_path))
+        ext_block = _ext_cell_block(mod_file)
+        assert ext_block._lazy_children is not None
+        out_path = GPath(unicode(tmpdir.join(u'Out.esp')))
+        mod_file.save(out_path)
+        return (out_path.open(u'rb').read(),
+                ext_block._lazy_children is not None)
+
+    def test_dump_raw(self, tmpdir):
+        """Children whose fids survive the round trip to long fids and back
+        must be written as they were read, without decoding them."""
+        plugin_bytes = world_plugin()
+        saved_bytes, still_lazy = self._save_lazy(tmpdir, plugin_bytes)
+        assert saved_bytes == plugin_bytes
+        assert still_lazy
+
+    @pytest.mark.parametrize(u'base_fid,saved_base_fid', [
+        (0x05000900, 0x01000900), # HITME, clamped to the plugin itself
+        (0x01000007, 0x00000007), # hardcoded, mapped to the game master
+    ])
+    def test_dump_changed_fids(self, tmpdir, base_fid, saved_base_fid):
+        """Children with fids that the round trip changes must be saved like
+        decoded children are."""
+        saved_bytes, still_lazy = self._save_lazy(tmpdir,
+                                                  world_plugin(base_fid))
+        assert not still_lazy
+        assert saved_bytes == world_plugin(saved_base_fid)
+
+    def test_lazy_children(self, tmpdir):
+        """Accessing the children of a cell must decode them, with the fid
+        conversions made in the meantime applied."""
+        in_path = tmpdir.join(u'World.esp')
+        in_path.write_binary(world_plugin(0x05000900))
+        mod_file = _load_cells_plugin(unicode(in_path))
+        ext_block = _ext_cell_block(mod_file)
+        assert ext_block._lazy_children is not None
+        temp_refs = ext_block.temp_refs
+        assert ext_block._lazy_children is None
+        assert ext_block.getNumRecords(False) == 3
+        assert [r.fid for r in temp_refs] == [(GPath(u'World.esp'), 0x811),
+                                              (GPath(u'World.esp'), 0x812)]
+        assert [r.base for r in temp_refs] == [
+            (GPath(u'Oblivion.esm'), 0x7), (GPath(u'World.esp'), 0x900)]
+        assert not ext_block.persistent_refs
+        assert ext_block.land is None
+
+    def test_ref_columns(self, tmpdir):
+        """Reference columns read from undecoded children must hand out fids
+        converted like those of decoded children."""
+        in_path = tmpdir.join(u'World.esp')
+        in_path.write_binary(world_plugin(0x05000900))
+        ext_block = _ext_cell_block(_load_cells_plugin(unicode(in_path)))
+        ref_columns = ext_block.get_ref_columns()
+        assert ext_block._lazy_children is not None
+        assert [ref_columns.get_base(i) for i in xrange(len(ref_columns))] \
+               == [(GPath(u'Oblivion.esm'), 0x7), (GPath(u'World.esp'), 0x900)]
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash.  If not, see <https://www.gnu.org/licenses/>.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+"""Tests for brec.record_structs."""
+import copy
+import io
+import os
+import struct
+import zlib
+
+from .. import pack_record, pack_subrecord, set_game
+from ...bolt import GPath
+from ...brec import CompressionCache, MelSet, ModReader, MreRecord
+
+def _npc_bytes():
+    """Returns the bytes of an Oblivion NPC_ record that uses plain,
+    struct, group(s) and fid list elements."""
+    return pack_record(b'NPC_', 0x01000900, [
+        pack_subrecord(b'EDID', b'TestNpc\x00'),
+        pack_subrecord(b'FULL', b'Test NPC\x00'),
+        pack_subrecord(b'MODL', b'Characters\\Test.nif\x00'),
+        pack_subrecord(b'MODB', struct.pack(u'=f', 0.5)),
+        pack_subrecord(b'ACBS', struct.pack(u'=I3Hh2H', 0x9, 1, 2, 3, 4,
+                                            5, 6)),
+        pack_subrecord(b'SNAM', struct.pack(u'=IB3s', 0x00000800, 1,
+                                            b'\x00' * 3)),
+        pack_subrecord(b'SNAM', struct.pack(u'=IB3s', 0x00000801, 2,
+                                            b'\x00' * 3)),
+        pack_subrecord(b'RNAM', struct.pack(u'=I', 0x00000907)),
+        pack_subrecord(b'SPLO', struct.pack(u'=I', 0x00000810)),
+        pack_subrecord(b'SPLO', struct.pack(u'=I', 0x00000811)),
+        pack_subrecord(b'CNTO', struct.pack(u'=Ii', 0x00000820, 3)),
+        pack_subrecord(b'CNTO', struct.pack(u'=Ii', 0x01000821, 1)),
+        pack_subrecord(b'AIDT', struct.pack(u'=4BIbB2s', 5, 50, 50, 50,
+                                            0x800, 1, 2, b'\x00' * 2)),
+        pack_subrecord(b'KFFZ', b'Idle1\x00Idle2\x00'),
+        pack_subrecord(b'DATA', struct.pack(u'=21BH2s8B', *(
+            list(xrange(21)) + [100, b'\x00' * 2] + list(xrange(8))))),
+        pack_subrecord(b'HCLR', b'\x01\x02\x03\x00'),
+        pack_subrecord(b'FGGS', b'\x05' * 8),
+        pack_subrecord(b'FNAM', struct.pack(u'=H', 7))])
+
+def _load_record(record_bytes):
+    with ModReader(u'Test.esp', io.BytesIO(record_bytes)) as ins:
+        header = ins.unpackRecHeader()
+        return MreRecord.type_class[header.recType](header, ins, True)
+
+def _record_attrs(record):
+    return {a: getattr(record, a, None)
+            for a in type(record).melSet.getSlotsUsed()}
+
+def _dump_data(record):
+    out = io.BytesIO()
+    record.dumpData(out)
+    return out.getvalue()
+
+def _cache(tmpdir):
+    return CompressionCache(GPath(unicode(tmpdir.join(u'Test.cache'))))
+
+def _data(data_index):
+    # Random, so every entry compresses to about its own size
+    return os.urandom(CompressionCache.min_data_size) + b'%u' % data_index
+
+class TestCompressionCache(object):
+    def test_compress(self, tmpdir):
+        """The cache must produce the same bytes as zlib, whether they come
+        from the cache or not."""
+        comp_cache = _cache(tmpdir)
+        for data in (b'a' * 10, b'abc' * 1000, _data(0)):
+            expected = zlib.compress(data, 6)
+            assert comp_cache.compress(data) == expected
+            assert comp_cache.compress(data) == expected
+
+    def test_save(self, tmpdir):
+        """Saved entries must be read back, and only be written again once
+        something was added."""
+        comp_cache = _cache(tmpdir)
+        data = _data(0)
+        comp_cache.compress(data)
+        comp_cache.save()
+        reread = _cache(tmpdir)
+        reread.compress(data)
+        assert reread._entries.keys() == comp_cache._entries.keys()
+        assert not reread._changed
+        reread.compress(_data(1))
+        assert reread._changed
+        reread.save()
+        assert not reread._changed
+        saved = _cache(tmpdir)
+        saved._load()
+        assert len(saved._entries) == 2
+
+    def test_max_size(self, tmpdir, monkeypatch):
+        """The least recently used entries must be dropped once the cache
+        outgrows max_size, in memory and on disk."""
+        entry_data = [_data(i) for i in xrange(4)]
+        entry_size = len(zlib.compress(entry_data[0], 6))
+        monkeypatch.setattr(CompressionCache, u'max_size', entry_size * 3)
+        comp_cache = _cache(tmpdir)
+        for data in entry_data[:3]:
+            comp_cache.compress(data)
+        comp_cache.compress(entry_data[0]) # now the most recently used
+        comp_cache.compress(entry_data[3]) # drops entry 1
+        assert len(comp_cache._entries) == 3
+        assert comp_cache._total_size <= CompressionCache.max_size
+        comp_cache.save()
+        reread = _cache(tmpdir)
+        reread._load()
+        assert reread._entries.keys() == comp_cache._entries.keys()
+
+class TestMreRecord(object):
+    def test_dump_changed(self):
+        """Dumping a changed record must leave it packed and unchanged, so
+        that it can be dumped again."""
+        set_game(u'Oblivion')
+        glob = _load_record(pack_record(b'GLOB', 0x01000900, [
+            pack_subrecord(b'EDID', b'TestGlobal\x00'),
+            pack_subrecord(b'FNAM', b's'),
+            pack_subrecord(b'FLTV', b'\x00' * 4)]))
+        glob.eid = u'OtherGlobal'
+        glob.setChanged()
+        out = io.BytesIO()
+        glob.dump(out)
+        assert not glob.changed
+        assert glob.size == len(glob.data) == len(out.getvalue()) - 20
+        again = io.BytesIO()
+        glob.dump(again)
+        assert again.getvalue() == out.getvalue()
+        assert b'OtherGlobal' in out.getvalue()
+
+class TestMelRecord(object):
+    def setup_method(self):
+        set_game(u'Oblivion')
+
+    def test_load(self, monkeypatch):
+        """The generated loader must load the same attributes as the generic
+        one, and both must dump what they read."""
+        npc_bytes = _npc_bytes()
+        npc = _load_record(npc_bytes)
+        assert npc.full == u'Test NPC'
+        assert npc.model.modb == 0.5
+        assert [(f.faction, f.rank) for f in npc.factions] == [
+            (0x00000800, 1), (0x00000801, 2)]
+        assert npc.spells == [0x00000810, 0x00000811]
+        assert npc.items[1].item == 0x01000821
+        assert npc.health == 100
+        assert npc.attributes == list(xrange(8))
+        assert npc.animations == [u'Idle1', u'Idle2']
+        assert _dump_data(npc) == npc_bytes[20:]
+        monkeypatch.setattr(MelSet, u'use_generated_loaders', False)
+        generic_npc = _load_record(npc_bytes)
+        assert _record_attrs(generic_npc) == _record_attrs(npc)
+        assert _dump_data(generic_npc) == npc_bytes[20:]
+
+    def test_copy(self):
+        """Copies must equal the original record, without sharing any
+        mutable values with it."""
+        npc_bytes = _npc_bytes()
+        npc = _load_record(npc_bytes)
+        for npc_copy in (npc.getTypeCopy(), copy.deepcopy(npc)):
+            assert _record_attrs(npc_copy) == _record_attrs(npc)
+            for mutable_attr in (u'model', u'factions', u'spells', u'items',
+                                 u'flags', u'skills', u'animations'):
+                assert getattr(npc_copy, mutable_attr) is not getattr(
+                    npc, mutable_attr)
+            assert npc_copy.factions[0] is not npc.factions[0]
+            npc_copy.factions[0].rank = 9
+            npc_copy.model.modPath = u'Other.nif'
+            npc_copy.flags.essential = True
+            npc_copy.spells.append(0x00000812)
+            assert _dump_data(npc) == npc_bytes[20:]
+        type_copy = npc.getTypeCopy()
+        assert type_copy.changed
+        assert type_copy.data is None
+        type_copy.getSize()
+        assert type_copy.data == npc_bytes[20:]
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash.  If not, see <https://www.gnu.org/licenses/>.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+"""Tests for mod_files."""
+import struct
+
+from . import PluginInfo, pack_group, pack_plugin, pack_record, \
+    pack_subrecord, set_game
+from ..bolt import GPath
+from ..brec import MreRecord, RecordHeader
+from ..mod_files import LoadFactory, ModFile, RecordIndex, \
+    pickle_record_data, unpickle_record_data
+
+def _misc(misc_fid, misc_eid, rec_flags=0):
+    return pack_record(b'MISC', misc_fid, [
+        pack_subrecord(b'EDID', misc_eid + b'\x00'),
+        pack_subrecord(b'DATA', struct.pack(u'=if', 5, 1.5))], rec_flags)
+
+def _index_plugin(tmpdir, plugin_bytes, cache_key=(1, 2.0, 3)):
+    plugin_path = tmpdir.join(u'Index.esp')
+    plugin_path.write_binary(plugin_bytes)
+    return RecordIndex.build(PluginInfo(unicode(plugin_path)), cache_key)
+
+def _digest_plugin(tmpdir, plugin_bytes):
+    plugin_path = tmpdir.join(u'Digest.esp')
+    plugin_path.write_binary(plugin_bytes)
+    return PluginInfo(unicode(plugin_path)).get_record_index(
+        with_digests=True)
+
+class TestModFile(object):
+    def setup_method(self):
+        set_game(u'Oblivion')
+
+    def _load(self, tmpdir, plugin_bytes):
+        in_path = tmpdir.join(u'Test.esp')
+        in_path.write_binary(plugin_bytes)
+        mod_file = ModFile(PluginInfo(unicode(in_path)), LoadFactory(True,
+            *[MreRecord.type_class[s] for s in (b'GLOB', b'GMST', b'MISC')]))
+        mod_file.load(do_unpack=True)
+        return mod_file
+
+    def _save(self, tmpdir, mod_file):
+        out_path = GPath(unicode(tmpdir.join(u'Out.esp')))
+        mod_file.save(out_path)
+        return out_path.open(u'rb').read()
+
+    def _plugin(self):
+        return pack_plugin([b'Oblivion.esm'], [
+            pack_group(b'GMST', 0, [pack_record(b'GMST', 0x00000801, [
+                pack_subrecord(b'EDID', b'sTest\x00'),
+                pack_subrecord(b'DATA', b'Test\x00')])]),
+            pack_group(b'GLOB', 0, [pack_record(b'GLOB', 0x01000900, [
+                pack_subrecord(b'EDID', b'TestGlobal\x00'),
+                pack_subrecord(b'FNAM', b's'),
+                pack_subrecord(b'FLTV', struct.pack(u'=f', 3.0))])]),
+            pack_group(b'MISC', 0, [
+                _misc(0x01000901, b'First'),
+                _misc(0x00000802, b'Second', 0x00040000), # compressed
+                _misc(0x01000902, b'Third')])], 8) # 5 records and 3 groups
+
+    def test_round_trip(self, tmpdir):
+        """Loading and saving a plugin must write it back unchanged, with all
+        fids back in short format."""
+        plugin_bytes = self._plugin()
+        mod_file = self._load(tmpdir, plugin_bytes)
+        misc_records = list(mod_file.tops[b'MISC'].records)
+        assert [r.fid for r in misc_records] == [
+            (GPath(u'Test.esp'), 0x901), (GPath(u'Oblivion.esm'), 0x802),
+            (GPath(u'Test.esp'), 0x902)]
+        assert misc_records[1].flags1.compressed
+        assert self._save(tmpdir, mod_file) == plugin_bytes
+
+    def test_copy_round_trip(self, tmpdir):
+        """Saving copies of all records, which are packed anew, must write
+        the same plugin too."""
+        plugin_bytes = self._plugin()
+        mod_file = self._load(tmpdir, plugin_bytes)
+        for top_block in mod_file.tops.itervalues():
+            for record in list(top_block.records):
+                top_block.setRecord(record.getTypeCopy())
+            top_block.setChanged()
+        assert self._save(tmpdir, mod_file) == plugin_bytes
+
+    def test_lazy_load_detached(self, tmpdir):
+        """Lazily loaded records must not depend on the plugin once it has
+        been loaded - it may get written to while they are still alive."""
+        plugin_bytes = self._plugin()
+        in_path = tmpdir.join(u'Test.esp')
+        in_path.write_binary(plugin_bytes)
+        mod_file = ModFile(PluginInfo(unicode(in_path)), LoadFactory(
+            False, MreRecord.type_class[b'MISC'], lazy=True))
+        mod_file.load(do_unpack=True)
+        with open(unicode(in_path), u'r+b') as out:
+            out.write(b'\x00' * len(plugin_bytes))
+        assert [r.eid for r in mod_file.tops[b'MISC'].records] == [
+            u'First', u'Second', u'Third']
+
+    def test_save_over_source(self, tmpdir):
+        """Saving a plugin over the file it was loaded from, as safeSave
+        does, must work - repeatedly."""
+        plugin_bytes = self._plugin()
+        mod_file = self._load(tmpdir, plugin_bytes)
+        in_path = mod_file.fileInfo.getPath()
+        for _x in xrange(2):
+            mod_file.save(in_path)
+            assert in_path.open(u'rb').read() == plugin_bytes
+
+    def test_pickle_record_data(self, tmpdir):
+        """Records and the MelObjects of their groups must survive pickling
+        them via pickle_record_data."""
+        misc_class = MreRecord.type_class[b'MISC']
+        mod_file = self._load(tmpdir, pack_plugin([b'Oblivion.esm'], [
+            pack_group(b'MISC', 0, [pack_record(b'MISC', 0x01000901, [
+                pack_subrecord(b'EDID', b'First\x00'),
+                pack_subrecord(b'MODL', b'Test.nif\x00'),
+                pack_subrecord(b'DATA', struct.pack(u'=if', 5, 1.5))])])],
+            2))
+        misc_record, = mod_file.tops[b'MISC'].records
+        restored_record, restored_model = unpickle_record_data(
+            pickle_record_data([misc_record, misc_record.model],
+                               [misc_class]), [misc_class])
+        assert type(restored_record) is misc_class
+        assert (restored_record.eid, restored_record.value) == (u'First', 5)
+        assert restored_model.modPath == u'Test.nif'
+        assert restored_record.model.modPath == u'Test.nif'
+
+class TestRecordIndex(object):
+    def setup_method(self):
+        set_game(u'Oblivion')
+
+    def _plugin(self):
+        return pack_plugin([b'Oblivion.esm'], [
+            pack_group(b'GMST', 0, [pack_record(b'GMST', 0x01000800, [
+                pack_subrecord(b'EDID', b'fTest\x00'),
+                pack_subrecord(b'DATA', struct.pack(u'=f', 2.0))])]),
+            pack_group(b'MISC', 0, [_misc(0x01000801, b'First'),
+                                    _misc(0x00000802, b'Second')])], 5)
+
+    def test_build(self, tmpdir):
+        rec_index = _index_plugin(tmpdir, self._plugin())
+        assert len(rec_index) == 6
+        assert rec_index.sigs == b'TES4GRUPGMSTGRUPMISCMISC'
+        assert list(rec_index.parents) == [-1, -1, 1, -1, 3, 3]
+        assert list(rec_index.iter_records({b'MISC'})) == [4, 5]
+        assert rec_index.find_fid(0x00000802) == 5
+        assert rec_index.find_fid(0x01000900) is None
+        header = rec_index.header(4)
+        assert (header.recType, header.fid) == (b'MISC', 0x01000801)
+        grup_header = rec_index.header(3)
+        assert (grup_header.label, grup_header.groupType) == (b'MISC', 0)
+        assert list(rec_index.ancestors(5)) == [3]
+
+    def test_save_load(self, tmpdir):
+        rec_index = _index_plugin(tmpdir, self._plugin())
+        idx_path = GPath(unicode(tmpdir.join(u'Index.idx')))
+        rec_index.save(idx_path)
+        loaded = RecordIndex.load(idx_path, rec_index.cache_key)
+        assert loaded.sigs == rec_index.sigs
+        for column in RecordIndex._columns:
+            assert getattr(loaded, column) == getattr(rec_index, column)
+        # A changed plugin invalidates the index
+        assert RecordIndex.load(idx_path, (1, 2.0, 4)) is None
+
+    def test_morrowind(self, tmpdir, monkeypatch):
+        """Morrowind's record headers only have four fields and it has no
+        groups."""
+        header_format = [u'=4s', u'I', u'I', u'I']
+        monkeypatch.setattr(RecordHeader, u'rec_header_size', 16)
+        monkeypatch.setattr(RecordHeader, u'rec_pack_format', header_format)
+        monkeypatch.setattr(RecordHeader, u'header_unpack',
+                            struct.Struct(u''.join(header_format)).unpack)
+        monkeypatch.setattr(RecordHeader, u'valid_header_sigs',
+                            {b'TES3', b'MISC'})
+        def mw_record(rec_sig, rec_data, rec_flags):
+            return struct.pack(u'=4s3I', rec_sig, len(rec_data), 0,
+                               rec_flags) + rec_data
+        rec_index = _index_plugin(tmpdir, mw_record(
+            b'TES3', b'HEDR\x04\x00\x00\x00abcd', 0) + mw_record(
+            b'MISC', b'NAME\x02\x00\x00\x00a\x00', 0x400))
+        assert rec_index.sigs == b'TES3MISC'
+        assert list(rec_index.parents) == [-1, -1]
+        header = rec_index.header(1)
+        assert (header.recType, header.size) == (b'MISC', 10)
+        assert rec_index.data_offset(1) == 44
+
+    def _cell_plugin(self, cell_fid, children_type=9):
+        """Returns a plugin with a MISC and an interior cell, which holds one
+        reference in a children group of the specified type."""
+        cell = pack_record(b'CELL', cell_fid, [
+            pack_subrecord(b'EDID', b'TestCell\x00'),
+            pack_subrecord(b'DATA', b'\x01')])
+        refr = pack_record(b'REFR', 0x01000900, [
+            pack_subrecord(b'NAME', struct.pack(u'=I', 0x00000007)),
+            pack_subrecord(b'DATA', struct.pack(u'=6f', 1, 2, 3, 0, 0, 0))])
+        return pack_plugin([b'Oblivion.esm'], [
+            pack_group(b'MISC', 0, [_misc(0x00000802, b'Misc')]),
+            pack_group(b'CELL', 0, [pack_group(0, 2, [pack_group(0, 3, [
+                cell, pack_group(cell_fid, 6, [
+                    pack_group(cell_fid, children_type, [refr])])])])])], 3)
+
+    def test_digests(self, tmpdir):
+        """References placed in different cells or in different children
+        groups must not have the same digest."""
+        rec_index = _digest_plugin(tmpdir, self._cell_plugin(0x00000C00))
+        assert rec_index.sigs[-4:] == b'REFR'
+        misc_digest = rec_index.digest(2)
+        refr_digest = rec_index.digest(9)
+        assert refr_digest[0] == RecordIndex.DIGEST_LONG
+        for other_plugin in (self._cell_plugin(0x00000D00),
+                             self._cell_plugin(0x00000C00, 8)):
+            other_index = _digest_plugin(tmpdir, other_plugin)
+            assert other_index.digest(2) == misc_digest
+            assert other_index.digest(9) != refr_digest
+        same_index = _digest_plugin(tmpdir, self._cell_plugin(0x00000C00))
+        assert same_index.digest(9) == refr_digest
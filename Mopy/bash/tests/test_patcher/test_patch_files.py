@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash.  If not, see <https://www.gnu.org/licenses/>.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+"""Tests for patcher.patch_files."""
+import struct
+
+import pytest
+
+from .. import PluginInfo, pack_group, pack_plugin, pack_record, \
+    pack_subrecord, set_game
+from ... import bass
+from ...bolt import GPath, Progress
+from ...brec import MreRecord
+from ...mod_files import LoadFactory, ModFile, RecordDigests
+from ...patcher.patch_files import PatchFile, _BuildProfile
+
+def _misc(misc_fid, misc_value):
+    return pack_record(b'MISC', misc_fid, [
+        pack_subrecord(b'EDID', b'Misc%X\x00' % (misc_fid & 0xFFFFFF)),
+        pack_subrecord(b'DATA', struct.pack(u'=if', misc_value, 1.5))])
+
+def _misc_plugin(tmpdir, plugin_name, masters, misc_records,
+                 extra_groups=()):
+    plugin_path = tmpdir.join(plugin_name)
+    plugin_path.write_binary(pack_plugin(
+        [m.encode(u'ascii') for m in masters],
+        [pack_group(b'MISC', 0, misc_records)] + list(extra_groups),
+        len(misc_records) + 1))
+    return PluginInfo(unicode(plugin_path), masters)
+
+def _load(plugin_info):
+    mod_file = ModFile(plugin_info, LoadFactory(
+        False, MreRecord.type_class[b'MISC']))
+    mod_file.load(do_unpack=True)
+    return mod_file
+
+class TestPatchFile(object):
+    def setup_method(self):
+        set_game(u'Oblivion')
+
+    def test_drop_identical_overrides(self, tmpdir):
+        """Overrides identical to the version they override must be dropped
+        before scanning, all other records must be kept."""
+        master_info = _misc_plugin(tmpdir, u'Master.esm', [], [
+            _misc(0x00000800, 5), _misc(0x00000801, 5)])
+        plugin_info = _misc_plugin(tmpdir, u'Plugin.esp', [u'Master.esm'], [
+            _misc(0x00000800, 5), # identical
+            _misc(0x00000801, 6), # changed
+            _misc(0x01000800, 5)]) # new
+        rec_digests = RecordDigests()
+        rec_digests.add_plugin(master_info, {b'MISC'})
+        plugin_file = _load(plugin_info)
+        PatchFile._drop_identical_overrides(plugin_file, rec_digests,
+                                            {b'MISC'})
+        assert [r.fid for r in plugin_file.tops[b'MISC'].records] == [
+            (GPath(u'Master.esm'), 0x801), (GPath(u'Plugin.esp'), 0x800)]
+
+    @pytest.mark.parametrize(u'prefetch_depth', [0, 2])
+    def test_load_scan_mods(self, tmpdir, monkeypatch, prefetch_depth):
+        """Plugins loaded in the background must come out as if they had
+        been loaded right before scanning them, including record types that
+        merging an earlier plugin added."""
+        monkeypatch.setitem(bass.inisettings, u'ScanPrefetchPlugins',
+                            prefetch_depth)
+        glob_group = pack_group(b'GLOB', 0, [pack_record(b'GLOB', 0x01000900, [
+            pack_subrecord(b'EDID', b'TestGlobal\x00'),
+            pack_subrecord(b'FNAM', b's'),
+            pack_subrecord(b'FLTV', struct.pack(u'=f', 3.0))])])
+        mod_names = [GPath(u'Plugin%u.esp' % i) for i in xrange(6)]
+        patch_file = PatchFile.__new__(PatchFile)
+        patch_file.allMods = mod_names
+        patch_file.mergeSet = set()
+        patch_file.p_file_minfos = {m: _misc_plugin(
+            tmpdir, m.s, [u'Oblivion.esm'], [_misc(0x01000800, 5)],
+            [glob_group]) for m in mod_names}
+        patch_file.readFactory = LoadFactory(
+            False, MreRecord.type_class[b'MISC'], lazy=True)
+        patch_file.mergeFactory = LoadFactory(False)
+        patch_file.build_profile = _BuildProfile()
+        loaded_tops = []
+        for index, mod_name, mod_file in patch_file._load_scan_mods(
+                Progress()):
+            assert mod_name == mod_names[index]
+            loaded_tops.append(sorted(mod_file.tops))
+            # Scan in the meantime, like patchers do
+            for record in mod_file.tops[b'MISC'].records:
+                assert record.getTypeCopy().eid == u'Misc800'
+            if index == 1: # as merging the plugin would
+                patch_file.readFactory.addClass(MreRecord.type_class[b'GLOB'])
+        assert loaded_tops == [[b'MISC']] * 2 + [[b'GLOB', b'MISC']] * 4
+
+class _ProfiledPatcher(object):
+    def getName(self): return u'Profiled Patcher'
+
+class TestBuildProfile(object):
+    def test_run_patcher(self):
+        """run_patcher must record the time a patcher phase took and by how
+        much it raised the peak memory usage."""
+        build_profile = _BuildProfile()
+        block_size = 64 * 1048576
+        def allocate():
+            return len(bytearray(block_size))
+        assert build_profile.run_patcher(_ProfiledPatcher(), u'initData',
+                                         allocate) == block_size
+        patcher_memory = build_profile.patcher_memory[u'Profiled Patcher']
+        assert patcher_memory[u'initData'] >= block_size // 2
+        assert u'initData' in build_profile.patcher_times[u'Profiled Patcher']
@@ -0,0 +1,147 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# GPL License and Copyright Notice ============================================
+#  This file is part of Wrye Bash.
+#
+#  Wrye Bash is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  Wrye Bash is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Wrye Bash.  If not, see <https://www.gnu.org/licenses/>.
+#
+#  Wrye Bash copyright (C) 2005-2009 Wrye, 2010-2020 Wrye Bash Team
+#  https://github.com/wrye-bash
+#
+# =============================================================================
+
+"""This script benchmarks the generated MelSet loaders against the generic
+loadData loop, in records per second. For every record type of the chosen
+games, a record with default values is dumped and the resulting data loaded
+back with both loaders - which also checks that both produce the same
+records."""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import io
+import logging
+import os
+import sys
+import time
+
+import utils
+
+LOGGER = logging.getLogger(__name__)
+
+SCRIPTS_PATH = os.path.dirname(os.path.abspath(__file__))
+MOPY_PATH = os.path.abspath(os.path.join(SCRIPTS_PATH, u'..', u'Mopy'))
+sys.path.append(MOPY_PATH)
+
+DEFAULT_GAMES = (u'Oblivion', u'Skyrim', u'Fallout 4')
+
+def setup_parser(parser):
+    parser.add_argument(
+        u'-g',
+        u'--game',
+        action=u'append',
+        dest=u'games',
+        help=u'The game(s) whose record definitions to benchmark. Defaults '
+             u'to %s.' % u', '.join(DEFAULT_GAMES),
+    )
+    parser.add_argument(
+        u'-n',
+        u'--passes',
+        type=int,
+        default=200,
+        help=u'How many times to load every record type per loader.',
+    )
+
+def _sample_records():
+    """Returns a list of (record class, header, data) tuples, one for every
+    record type of the current game that we can dump with default values."""
+    from bash.brec import MelRecord, MreRecord, ModReader, RecHeader
+    samples = []
+    for rec_sig, rec_class in sorted(MreRecord.type_class.iteritems()):
+        if not issubclass(rec_class, MelRecord): continue
+        header = RecHeader(rec_sig)
+        try:
+            out = io.BytesIO()
+            rec_class(header).dumpData(out)
+            # Some records don't survive a roundtrip with default values
+            data = out.getvalue()
+            rec_class(header).loadData(ModReader(u'bench', io.BytesIO(data)),
+                                       len(data))
+        except Exception:
+            LOGGER.debug(u'Skipping %s' % rec_sig)
+            continue
+        samples.append((rec_class, header, data))
+    return samples
+
+def _load_all(samples, passes):
+    """Loads every sample passes times, returning the loaded records of the
+    last pass and the time spent inside loadData."""
+    from bash.brec import ModReader
+    readers = [ModReader(u'bench', io.BytesIO(data)) for _c, _h, data
+               in samples]
+    elapsed = 0
+    for _i in xrange(passes):
+        records = [rec_class(header) for rec_class, header, _d in samples]
+        start = time.clock()
+        for record, ins in zip(records, readers):
+            ins.seek(0)
+            record.loadData(ins, ins.size)
+        elapsed += time.clock() - start
+    return records, elapsed
+
+def _record_state(record):
+    return [(a, repr(getattr(record, a, None))) for a in
+            sorted(record.__slots__)]
+
+def bench_game(game_name, passes):
+    from bash.brec import MelSet
+    from bash.tests import set_game
+    set_game(game_name)
+    samples = _sample_records()
+    if not samples:
+        LOGGER.warning(u'%s: no records to benchmark' % game_name)
+        return
+    num_loaded = len(samples) * passes
+    results = {}
+    for generated in (False, True):
+        MelSet.use_generated_loaders = generated
+        records, elapsed = _load_all(samples, passes)
+        results[generated] = ([_record_state(r) for r in records],
+                              num_loaded / elapsed)
+    MelSet.use_generated_loaders = True
+    if results[False][0] != results[True][0]:
+        LOGGER.error(u'%s: generated loaders produced different records!'
+                     % game_name)
+    LOGGER.info(u'%s: %u record types, %u loads per loader' % (
+        game_name, len(samples), num_loaded))
+    LOGGER.info(u'  generic loop:      %10.0f records/s' % results[False][1])
+    LOGGER.info(u'  generated loaders: %10.0f records/s (x%.2f)' % (
+        results[True][1], results[True][1] / results[False][1]))
+
+def main(args):
+    utils.setup_log(LOGGER, verbosity=args.verbosity)
+    from bash import bolt
+    # Otherwise every string gets its encoding detected, which would dwarf
+    # everything else - Wrye Bash defaults to cp1252 as well
+    bolt.pluginEncoding = u'cp1252'
+    for game_name in args.games or DEFAULT_GAMES:
+        bench_game(game_name, args.passes)
+
+if __name__ == u'__main__':
+    argparser = argparse.ArgumentParser(description=__doc__)
+    utils.setup_common_parser(argparser)
+    setup_parser(argparser)
+    parsed_args = argparser.parse_args()
+    main(parsed_args)